@@ -32,6 +32,15 @@ def _run_pipeline(images: Any, method: DetectionMethod, height: int, fmt: str) -
         ImageIO.save_all(out=tmp, images=stitched, format=fmt)
 
 
+def _run_stream_pipeline(images: Any, method: DetectionMethod, height: int, fmt: str) -> None:
+    width = min(img.width for img in images)
+    resized = [ImageManipulator.resize(img, width=width) for img in images]
+    with tempfile.TemporaryDirectory() as tmp:
+        with ImageIO.open_writer(out=tmp, format=fmt) as writer:
+            for s in SlicesDetector.iter_slice_points(iter(resized), method=method, height=height):
+                writer.write(Stitcher.stitch_slice(resized, s))
+
+
 def _pipeline_pixel_jpeg_small(images: Any) -> None:
     _run_pipeline(images, DetectionMethod.PIXEL, height=1_000, fmt="jpeg")
 
@@ -48,6 +57,10 @@ def _pipeline_pixel_png_small(images: Any) -> None:
     _run_pipeline(images, DetectionMethod.PIXEL, height=1_000, fmt="png")
 
 
+def _stream_pixel_jpeg_small(images: Any) -> None:
+    _run_stream_pipeline(images, DetectionMethod.PIXEL, height=1_000, fmt="jpeg")
+
+
 BENCHMARKS: list[Benchmark] = [
     Benchmark(
         name="pipeline/pixel+jpeg/small",
@@ -70,6 +83,13 @@ BENCHMARKS: list[Benchmark] = [
         iterations=3,
         description="full pipeline – pixel detect + png out – 5×(800×3000)",
     ),
+    Benchmark(
+        name="pipeline/stream/pixel+jpeg/small",
+        fn=_stream_pixel_jpeg_small,
+        setup=_setup_small,
+        iterations=3,
+        description="streaming pipeline – pixel detect + jpeg out – 5×(800×3000)",
+    ),
     Benchmark(
         name="pipeline/pixel+jpeg/large",
         fn=_pipeline_pixel_jpeg_large,
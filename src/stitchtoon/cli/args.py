@@ -5,9 +5,13 @@
 import argparse
 from typing import Optional, Sequence
 
-from ..const import FORMATS
-from ..core.slices_detectors.slices_detector import DetectionMethod
 from .. import VERSION
+from ..const import FORMATS, PS_FORMATS
+from ..core.executor import ExecutorType
+from ..core.memory import AUTO_BUDGET_FRACTION, available_memory, parse_size
+from ..core.planner import HEADER_METHODS
+from ..core.slices_detectors.slices_detector import DetectionMethod
+from ..core.stitcher import StitchBackend
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -47,6 +51,28 @@ def build_parser() -> argparse.ArgumentParser:
         default=False,
         help="Pack each output directory into a zip archive",
     )
+    io.add_argument(
+        "--zip-compression",
+        choices=["auto", "store", "deflate"],
+        default="auto",
+        help="Compression of --archive members. 'auto' stores formats that "
+             "are already compressed (jpeg, webp, png) and deflates the others",
+    )
+    io.add_argument(
+        "--copy-unchanged",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Copy the file of a page that becomes an output slice as is "
+             "(whole, same format, no resize) instead of re-encoding it",
+    )
+    io.add_argument(
+        "--trim-transparent",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Crop every output to its pixels that are not fully transparent, "
+             "for pages with transparent margins. Scans every output, and turns "
+             "off --copy-unchanged and row-by-row writing of very large outputs",
+    )
     io.add_argument(
         "--width",
         type=int,
@@ -55,6 +81,137 @@ def build_parser() -> argparse.ArgumentParser:
         help="Normalize all images to this width before processing. "
              "If omitted, auto-resize to the minimum width found",
     )
+    io.add_argument(
+        "--reducing-gap",
+        type=float,
+        default=None,
+        metavar="X",
+        help="Speed up resizing by first shrinking pages by an integer factor, "
+             "JPEGs while decoding them, to no less than X times the target "
+             "size, e.g. 2 or 3. If omitted, pages are resized in one exact pass",
+    )
+    io.add_argument(
+        "--defer-resize",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Detect slices on the pages as they are and resize only the rows "
+             "of each output while stitching it, instead of resizing whole pages "
+             "first. Saves a resized copy of the chapter",
+    )
+
+    io.add_argument(
+        "--incremental",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Skip chapters whose inputs and settings have not changed since "
+             "the last run, using the manifest stored with each output",
+    )
+    io.add_argument(
+        "--resume",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Continue an interrupted run: finished chapters are skipped and "
+             "a chapter cut short continues after its last finished slice",
+    )
+    io.add_argument(
+        "--hash-inputs",
+        action="store_true",
+        default=False,
+        help="Also fingerprint inputs by content (sha256), not only by size "
+             "and modification time",
+    )
+    io.add_argument(
+        "--psd-cache",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Keep the composite of PSD/PSB files that have no merged image "
+             "in $XDG_CACHE_HOME/stitchtoon/composites, so later runs skip "
+             "compositing their layers. The least recently used are dropped "
+             "beyond 2 GiB",
+    )
+    io.add_argument(
+        "--read-ahead",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Read up to N page files ahead of the decoders, whole and in large "
+             "sequential chunks, so decoding never waits on slow or network storage. "
+             "0 lets every decoder read its own file",
+    )
+    io.add_argument(
+        "--io-workers",
+        type=int,
+        default=2,
+        metavar="N",
+        help="Page files read concurrently with --read-ahead",
+    )
+    io.add_argument(
+        "--stream",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Process one image at a time: decode, detect, stitch and save "
+             "overlap and only a few images are kept in memory",
+    )
+
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of chapters (directories) to process in parallel. "
+             "The biggest chapters are started first",
+    )
+
+    parser.add_argument(
+        "--executor",
+        choices=[e.value for e in ExecutorType],
+        default=ExecutorType.PROCESS.value,
+        help="How work inside a chapter is parallelized: worker processes, "
+             "threads, or serially in the main thread",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Workers per chapter. Defaults to the CPUs available to this "
+             "process (respecting cgroup quotas) divided by --jobs",
+    )
+
+    parser.add_argument(
+        "--stitch-backend",
+        choices=[b.value for b in StitchBackend],
+        default=StitchBackend.PIL.value,
+        help="How slices are assembled: by cropping and pasting pages, or by "
+             "copying rows of page arrays once into each output, with slices "
+             "within a single page sharing its memory",
+    )
+
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        default=False,
+        help="Plan the output from image headers only, without decoding or "
+             "writing images: print each chapter's outputs and any format "
+             "size limit they exceed. Needs --method=direct or metadata",
+    )
+    parser.add_argument(
+        "--export-plan",
+        default=None,
+        metavar="DIR",
+        help="Write each chapter's plan to DIR/<chapter>.json; implies "
+             "--dry-run. The plans can be used with --method=metadata --plan",
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        default=None,
+        metavar="SIZE",
+        help="Memory budget, e.g. 24G, or 'auto' for most of the available "
+             "memory. Chapters are estimated from their image headers: ones "
+             "that do not fit are streamed, and --jobs only starts chapters "
+             "that fit next to those already running",
+    )
 
     parser.add_argument(
         "--progress",
@@ -78,6 +235,26 @@ def build_parser() -> argparse.ArgumentParser:
         metavar="PX",
         help="Target slice height in pixels. Required for 'pixel' and 'direct' methods",
     )
+    det.add_argument(
+        "--plan",
+        default=None,
+        metavar="FILE",
+        help="Cut plan used by --method=metadata. Defaults to the plan stored "
+             "in the manifest of an earlier run writing the same chapter",
+    )
+    det.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Reuse detected slices from earlier runs on the same inputs "
+             "with the same detection settings",
+    )
+    det.add_argument(
+        "--cache-dir",
+        default=None,
+        metavar="DIR",
+        help="Slice cache directory. Defaults to $XDG_CACHE_HOME/stitchtoon/slices",
+    )
 
     # Pixel-detection tuning
     px = parser.add_argument_group(
@@ -147,18 +324,53 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
             f"Choose from: {', '.join(sorted(FORMATS))}"
         )
 
+    if args.archive and args.format in PS_FORMATS:
+        parser.error(f"--archive does not support the '{args.format}' format")
+
     # Height is required for non-auto methods
     needs_height = {DetectionMethod.PIXEL.value, DetectionMethod.DIRECT.value}
     if args.method in needs_height and args.height is None:
         parser.error(f"--height is required when using --method={args.method}")
 
+    if args.plan is not None and args.method != DetectionMethod.METADATA.value:
+        parser.error("--plan is only used with --method=metadata")
+
+    if args.export_plan is not None:
+        args.dry_run = True
+    if args.dry_run and args.method not in HEADER_METHODS:
+        parser.error(f"--dry-run cannot plan --method={args.method}, it needs decoded pixels")
+
     # Coerce whole-number floats to int for max/min height
     for attr in ("max_height", "min_height"):
         val = getattr(args, attr)
         if val != -1 and val == int(val):
             setattr(args, attr, int(val))
 
+    if args.reducing_gap is not None and args.reducing_gap < 1:
+        parser.error("--reducing-gap must be >= 1")
+
     if args.window < 1:
         parser.error("--window must be >= 1")
 
+    if args.jobs < 1:
+        parser.error("--jobs must be >= 1")
+
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be >= 1")
+    if args.read_ahead < 0:
+        parser.error("--read-ahead must be >= 0")
+    if args.io_workers < 1:
+        parser.error("--io-workers must be >= 1")
+
+    if args.max_memory == "auto":
+        free = available_memory()
+        if free is None:
+            parser.error("cannot determine the available memory; give --max-memory a size")
+        args.max_memory = int(free * AUTO_BUDGET_FRACTION)
+    elif args.max_memory is not None:
+        try:
+            args.max_memory = parse_size(args.max_memory)
+        except ValueError as e:
+            parser.error(f"--max-memory: {e}")
+
     return args
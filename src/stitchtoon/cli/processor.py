@@ -2,20 +2,44 @@
 # License: MIT, see the file "LICENSE" for details.
 """Core processing logic for the CLI."""
 
+import functools
+import json
+import multiprocessing
+import os
 import os.path as osp
+import queue
+import shutil
 import sys
 import zipfile
 from argparse import Namespace
-from typing import List, Tuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 from PIL.Image import Image
 
-from ..core.image_io import ImageIO
+from ..const import METADATA_FILENAME, PS_FORMATS
+from ..core.composite_cache import CompositeCache
+from ..core.executor import Executor, ExecutorType, available_cpus, get_executor
+from ..core.image_io import ImageHeader, ImageIO
 from ..core.image_manipulator import ImageManipulator
+from ..core.manifest import Manifest, fingerprint_all, manifest_path, staging_path
+from ..core.mapped_image import decode
+from ..core.memory import ChapterEstimate, MemoryPlan, estimate, plan
+from ..core.planner import SlicePlan, plan_slices
+from ..core.prefetch import PrefetchReader
+from ..core.row_writer import writes_by_rows
+from ..core.scaled_image import scaled
 from ..core.scanner import scan
+from ..core.slices_detectors.slice import Slice
+from ..core.slices_detectors.slice_cache import SliceCache
 from ..core.slices_detectors.slices_detector import DetectionMethod, SlicesDetector
-from ..core.stitcher import Stitcher
-from ..progressbar import DefaultCliProgress, ProgressHandler
+from ..core.stitcher import StitchBackend, Stitcher
+from ..progressbar import (
+    DefaultCliProgress,
+    ProgressAggregator,
+    ProgressHandler,
+    QueueProgress,
+)
 
 # Progress increments per stage (must sum to 100)
 _STAGE_LOAD = 30
@@ -24,6 +48,20 @@ _STAGE_DETECT = 20
 _STAGE_STITCH = 20
 _STAGE_SAVE = 20
 
+# Images decoded ahead of detection, and slices queued for encoding, in --stream mode
+_STREAM_PREFETCH = 2
+_STREAM_PENDING = 2
+
+# --zip-compression choices; None follows const.ARCHIVE_COMPRESSION
+_ZIP_COMPRESSION = {
+    "auto": None,
+    "store": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+}
+
+# How often the parent refreshes the combined progress bar with --jobs > 1
+_POLL_INTERVAL = 0.1
+
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -46,6 +84,291 @@ def _output_path(dir_path: str, input_base: str, output_base: str, archive: bool
     return out
 
 
+def _executor(args: Namespace) -> Executor:
+    """Executor for one chapter; --jobs chapters share the available CPUs."""
+    workers = args.workers or max(1, available_cpus() // args.jobs)
+    return get_executor(ExecutorType(args.executor), workers)
+
+
+def _composite_cache(args: Namespace) -> Optional[CompositeCache]:
+    return CompositeCache() if args.psd_cache else None
+
+
+def _reader(args: Namespace) -> Optional[PrefetchReader]:
+    if not args.read_ahead:
+        return None
+    return PrefetchReader(depth=args.read_ahead, workers=args.io_workers)
+
+
+def _chapter_size(image_files: List[str]) -> int:
+    """Total size of a chapter's files in bytes, used to schedule big ones first."""
+    size = 0
+    for imf in image_files:
+        try:
+            size += osp.getsize(imf)
+        except OSError:
+            pass
+    return size
+
+
+def _zip_output_path(zip_path: str, args: Namespace) -> str:
+    out = args.output
+    if args.archive:
+        out = osp.join(out, osp.splitext(osp.basename(zip_path))[0] + ".zip")
+    return out
+
+
+def _settings(args: Namespace) -> dict:
+    """Settings that affect the output, as recorded in the manifest."""
+    settings = {
+        "format": args.format,
+        "archive": args.archive,
+        "width": args.width,
+        "method": args.method,
+        "height": args.height,
+        "copy_unchanged": args.copy_unchanged,
+    }
+    if args.archive:
+        settings["zip_compression"] = args.zip_compression
+    if args.trim_transparent:
+        settings["trim_transparent"] = True
+    if args.reducing_gap is not None:
+        settings["reducing_gap"] = args.reducing_gap
+    if args.defer_resize:
+        settings["defer_resize"] = True
+    if DetectionMethod(args.method) == DetectionMethod.PIXEL:
+        settings.update(_pixel_detect_kwargs(args))
+    return settings
+
+
+def _is_up_to_date(out: str, args: Namespace, inputs: dict) -> bool:
+    path = manifest_path(out, args.archive)
+    manifest = Manifest.load(path)
+    return manifest is not None and manifest.is_up_to_date(inputs, _settings(args), path)
+
+
+def _is_directory_up_to_date(image_dir: Tuple[str, List[str]], args: Namespace) -> bool:
+    dir_path, image_files = image_dir
+    out = _output_path(dir_path, args.input, args.output, args.archive)
+    return _is_up_to_date(out, args, fingerprint_all(image_files, args.hash_inputs))
+
+
+def _commit_manifest(
+    out: str,
+    args: Namespace,
+    inputs: dict,
+    paths: List[str],
+    slices: List[Slice],
+) -> None:
+    """Record a finished output, removing files left over from an older run."""
+    path = manifest_path(out, args.archive)
+    base = osp.dirname(path)
+    outputs = [osp.relpath(p, base) for p in paths]
+
+    old = Manifest.load(path)
+    if old is not None:
+        for stale in set(old.outputs) - set(outputs):
+            try:
+                os.remove(osp.join(base, stale))
+            except OSError:
+                pass
+
+    Manifest(
+        inputs=inputs,
+        settings=_settings(args),
+        outputs=outputs,
+        slices=[s.to_dict() for s in slices],
+    ).save(path)
+
+
+class _Journal:
+    """Manifest of the files finished so far in an output's staging directory, kept with 'resume'."""
+
+    def __init__(self, out: str, inputs: dict, settings: dict, resume: bool):
+        self.staging = staging_path(out)
+        self.path = osp.join(self.staging, METADATA_FILENAME)
+        self.manifest = Manifest(inputs=inputs, settings=settings)
+        # slices handed to the writer but not written yet, in order
+        self._queued: List[Slice] = []
+
+        old = Manifest.load(self.path) if resume else None
+        if old is not None and old.matches(inputs, settings):
+            for name, s in zip(old.outputs, old.slices):
+                if not osp.exists(osp.join(self.staging, name)):
+                    break
+                self.manifest.outputs.append(name)
+                self.manifest.slices.append(s)
+        else:
+            shutil.rmtree(self.staging, ignore_errors=True)
+        os.makedirs(self.staging, exist_ok=True)
+
+    @property
+    def slices(self) -> List[Slice]:
+        """Slices already written."""
+        return [Slice.from_dict(s) for s in self.manifest.slices]
+
+    @property
+    def start(self) -> Tuple[int, int]:
+        """(image index, row) of the cut ending the slices already written, where detection resumes."""
+        if not self.manifest.slices:
+            return (0, 0)
+        idx, _, end = self.manifest.slices[-1]["points"][-1]
+        return (idx, end)
+
+    def queue(self, s: Slice) -> None:
+        self._queued.append(s)
+
+    def complete(self, name: str) -> None:
+        """ImageWriter on_complete callback: record the next queued slice as written."""
+        self.manifest.outputs.append(name)
+        self.manifest.slices.append(self._queued.pop(0).to_dict())
+        self.manifest.save(self.path)
+
+    def commit(self, out: str, archive: bool, compression: Optional[int] = None) -> List[str]:
+        """Move the finished output into place and return the paths written."""
+        names = self.manifest.outputs
+        if archive:
+            os.makedirs(osp.dirname(out) or ".", exist_ok=True)
+            tmp = osp.join(self.staging, "output.zip")
+            with zipfile.ZipFile(tmp, "w", compresslevel=5) as zf:
+                for name in names:
+                    fmt = osp.splitext(name)[1].strip(".")
+                    zf.write(
+                        osp.join(self.staging, name),
+                        name,
+                        compress_type=ImageIO.archive_compression(fmt, compression),
+                    )
+            os.replace(tmp, out)
+            paths = [out]
+        else:
+            os.makedirs(out, exist_ok=True)
+            paths = [osp.join(out, name) for name in names]
+            for name, path in zip(names, paths):
+                os.replace(osp.join(self.staging, name), path)
+        return paths
+
+    def discard(self) -> None:
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+def _plan_manifests(dir_out: str, archive_out: str) -> List[str]:
+    """Manifests of earlier runs writing a chapter as a directory or as an archive."""
+    return [manifest_path(dir_out), manifest_path(archive_out, archive=True)]
+
+
+def _plan_path(args: Namespace, manifests: List[str]) -> str:
+    """Cut plan used by --method=metadata: --plan, else the first manifest holding one."""
+    if args.plan:
+        return args.plan
+    for path in manifests:
+        manifest = Manifest.load(path)
+        if manifest is not None and manifest.slices:
+            return path
+    raise FileNotFoundError(
+        "No stored cut plan found; run with another method first or pass --plan"
+    )
+
+
+def _resize(img: Image, width: int, args: Namespace) -> Image:
+    """*img* at *width*, resized now or, with --defer-resize, a slice at a time while stitching."""
+    if args.defer_resize:
+        return scaled(img, width, reducing_gap=args.reducing_gap)
+    return ImageManipulator.resize(img, width=width, reducing_gap=args.reducing_gap)
+
+
+def _detect_kwargs(args: Namespace, inputs: dict, width: int, manifests: List[str]) -> dict:
+    """Keyword arguments for SlicesDetector, including the slice cache."""
+    method = DetectionMethod(args.method)
+    if method == DetectionMethod.METADATA:
+        return {"path": _plan_path(args, manifests)}
+
+    params = _pixel_detect_kwargs(args) if method == DetectionMethod.PIXEL else {}
+    extra = dict(params)
+    if args.cache:
+        if args.defer_resize and method == DetectionMethod.PIXEL:
+            # rows are judged on the pages as they are, not once resized
+            params["defer_resize"] = True
+        extra["cache"] = SliceCache(args.cache_dir)
+        extra["cache_key"] = SliceCache.key(inputs, width, method, args.height, **params)
+    return extra
+
+
+def _commit_output(journal: _Journal, out: str, args: Namespace) -> None:
+    """Move a finished output into place and record it in its manifest."""
+    paths = journal.commit(out, args.archive, _ZIP_COMPRESSION[args.zip_compression])
+    _commit_manifest(out, args, journal.manifest.inputs, paths, journal.slices)
+    journal.discard()
+
+
+def _fit(chapter: ChapterEstimate, args: Namespace) -> MemoryPlan:
+    return plan(chapter, args.max_memory, stream=args.stream, pending=_STREAM_PENDING)
+
+
+def _memory_plan(headers: List[ImageHeader], args: Namespace, overhead: int = 0) -> MemoryPlan:
+    """How to process a chapter within --max-memory, judging by its image headers."""
+    if args.max_memory is None:
+        return MemoryPlan(args.stream, _STREAM_PREFETCH, 0)
+    chapter = estimate(headers, args.width, args.height, overhead, args.defer_resize)
+    return _fit(chapter, args)
+
+
+def _defers_decoding(image_files: List[str], headers: List[ImageHeader], width: int, args: Namespace) -> bool:
+    """True if pages can reach the detector undecoded, for pixel detection to draft-decode JPEGs."""
+    return (
+        DetectionMethod(args.method) == DetectionMethod.PIXEL
+        and args.division_factor > 1
+        and all(h.width == width for h in headers)
+        and all(osp.splitext(imf)[1].lower() in (".jpg", ".jpeg") for imf in image_files)
+    )
+
+
+def _read_headers(image_files: List[str]) -> List[ImageHeader]:
+    """Read every page's header, rejecting oversized pages before anything is decoded."""
+    return [ImageIO.image_header(image_file=imf) for imf in image_files]
+
+
+# A page, as the file it is read from and its member name inside an archive
+_Source = Tuple[str, Optional[str]]
+
+# Format names that share an encoding
+_FORMAT_ALIASES = {"jpg": "jpeg"}
+
+
+def _same_format(ext: str, format: str) -> bool:
+    ext, format = ext.lower(), format.lower()
+    return _FORMAT_ALIASES.get(ext, ext) == _FORMAT_ALIASES.get(format, format)
+
+
+def _unchanged_source(
+    s: Slice,
+    headers: List[ImageHeader],
+    sources: List[_Source],
+    width: int,
+    args: Namespace,
+) -> Optional[_Source]:
+    """The page slice 's' reproduces whole, unresized and in the output format and mode, if any."""
+    if not args.copy_unchanged or args.trim_transparent:
+        return None
+    if len(s.points) != 1 or args.format in PS_FORMATS:
+        return None
+    idx, start, end = s.points[0]
+    header = headers[idx]
+    if start != 0 or end != header.height or header.width != width:
+        return None
+    if header.mode != ImageIO.format_mode(args.format, header.mode):
+        # e.g. a CMYK JPEG, written as RGB
+        return None
+    path, member = sources[idx]
+    ext = osp.splitext(member if member is not None else path)[1].lstrip(".")
+    return sources[idx] if _same_format(ext, args.format) else None
+
+
+def _writes_by_rows(s: Slice, args: Namespace) -> bool:
+    """True if slice 's' is stitched and encoded row by row, see core.row_writer."""
+    # outputs to trim are scanned whole, so they are always stitched whole
+    return not args.trim_transparent and writes_by_rows(args.format, s.size)
+
+
 def _pixel_detect_kwargs(args: Namespace) -> dict:
     return {
         "x_margins": args.x_margins,
@@ -63,30 +386,146 @@ def _pixel_detect_kwargs(args: Namespace) -> dict:
 
 def _pipeline(
     images: List[Image],
-    out: str,
+    journal: _Journal,
     args: Namespace,
     progress: ProgressHandler,
+    inputs: dict,
+    manifests: List[str],
+    headers: List[ImageHeader],
+    sources: List[_Source],
 ) -> None:
     """Run resize → detect → stitch → save on a list of already-loaded images."""
+    executor = _executor(args)
+    mode = Stitcher.stitch_mode(h.mode for h in headers)
+
     progress.update(_STAGE_RESIZE, "Resizing")
-    images = ImageManipulator.resize_all_width(images, value=args.width)
+    if args.defer_resize:
+        width = args.width or min(img.width for img in images)
+        images = [_resize(img, width, args) for img in images]
+    else:
+        images = ImageManipulator.resize_all_width(
+            images, value=args.width, executor=executor, reducing_gap=args.reducing_gap
+        )
 
     progress.update(_STAGE_DETECT, "Detecting slices")
-    method = DetectionMethod(args.method)
-    extra = _pixel_detect_kwargs(args) if method == DetectionMethod.PIXEL else {}
-    slices = SlicesDetector.slice_points(images, method=method, height=args.height, **extra)
+    extra = _detect_kwargs(args, inputs, images[0].width, manifests)
+    # only the slices after those the journal holds are detected
+    start = journal.start
+    todo = SlicesDetector.slice_points(
+        images[start[0]:], method=args.method, height=args.height, executor=executor, start=start, **extra
+    )
+    done = len(journal.manifest.outputs)
+    copies = [_unchanged_source(s, headers, sources, images[0].width, args) for s in todo]
+
+    by_rows = [copy is None and _writes_by_rows(s, args) for s, copy in zip(todo, copies)]
 
     progress.update(_STAGE_STITCH, "Stitching")
-    stitched = Stitcher.stitch(images, slices)
+    # decode the pages left undecoded for the detector, see _defers_decoding
+    pages = {idx for s, copy in zip(todo, copies) if copy is None for idx, _, _ in s.points}
+    executor.local().map(decode, [images[idx] for idx in sorted(pages)])
+    stitched = iter(Stitcher.stitch(
+        images,
+        [s for s, copy, rows in zip(todo, copies, by_rows) if copy is None and not rows],
+        mode=mode,
+        executor=executor,
+        backend=args.stitch_backend,
+        trim_transparent=args.trim_transparent,
+    ))
 
     progress.update(_STAGE_SAVE, "Saving")
-    ImageIO.save_all(
-        out=out,
-        images=stitched,
+    with ImageIO.open_writer(
+        out=journal.staging,
         format=args.format,
-        archive=args.archive,
-        make_dirs=True,
-    )
+        max_pending=executor.workers,
+        executor=executor,
+        start=done,
+        on_complete=journal.complete,
+    ) as writer:
+        for s, copy, rows in zip(todo, copies, by_rows):
+            journal.queue(s)
+            if copy is not None:
+                writer.copy(*copy)
+            elif rows:
+                writer.write_slice(images, s, mode=mode)
+            else:
+                writer.write(next(stitched))
+
+
+def _stream_pipeline(
+    images: Iterable[Image],
+    count: int,
+    width: int,
+    prefetch: int,
+    journal: _Journal,
+    args: Namespace,
+    progress: ProgressHandler,
+    inputs: dict,
+    manifests: List[str],
+    headers: List[ImageHeader],
+    sources: List[_Source],
+) -> None:
+    """Run resize → detect → stitch → save one image at a time, from the image the journal resumes from."""
+    executor = _executor(args)
+    mode = Stitcher.stitch_mode(h.mode for h in headers)
+    extra = _detect_kwargs(args, inputs, width, manifests)
+    if DetectionMethod(args.method) == DetectionMethod.PIXEL:
+        extra["lookahead"] = prefetch
+
+    # Images that may still be referenced by the slice being detected, and
+    # their arrays with --stitch-backend=numpy
+    window = {}
+    arrays = {}
+
+    start = journal.start
+
+    def resized() -> Iterator[Image]:
+        done = 0
+        for idx, img in enumerate(images, start[0]):
+            window[idx] = _resize(img, width, args)
+            # Spread the whole bar over the images as they are consumed
+            step = (idx + 1) * 100 // count - done
+            done += step
+            progress.update(step, "Processing")
+            yield window[idx]
+
+    done = len(journal.manifest.outputs)
+    with ImageIO.open_writer(
+        out=journal.staging,
+        format=args.format,
+        max_pending=_STREAM_PENDING,
+        executor=executor,
+        start=done,
+        on_complete=journal.complete,
+    ) as writer:
+        detected = SlicesDetector.iter_slice_points(
+            resized(), method=args.method, height=args.height, executor=executor, start=start, **extra
+        )
+        for s in detected:
+            journal.queue(s)
+            copy = _unchanged_source(s, headers, sources, width, args)
+            if copy is not None:
+                writer.copy(*copy)
+            else:
+                # decode the pages the detector left undecoded, in parallel
+                pages = [window[idx] for idx in {p[0] for p in s.points}]
+                executor.local().map(decode, pages)
+                if _writes_by_rows(s, args):
+                    writer.write_slice({idx: window[idx] for idx, _, _ in s.points}, s, mode=mode)
+                elif StitchBackend(args.stitch_backend) == StitchBackend.NUMPY:
+                    for idx, _, _ in s.points:
+                        if idx not in arrays:
+                            arrays[idx] = Stitcher.page_array(window[idx], mode)
+                    writer.write(Stitcher.stitch_slice_array(
+                        arrays, s, mode=mode, trim_transparent=args.trim_transparent
+                    ))
+                else:
+                    writer.write(Stitcher.stitch_slice(
+                        window, s, mode=mode, trim_transparent=args.trim_transparent
+                    ))
+            last = s.points[-1][0]
+            for idx in [idx for idx in window if idx < last]:
+                del window[idx]
+                arrays.pop(idx, None)
 
 
 # ---------------------------------------------------------------------------
@@ -97,27 +536,90 @@ def _process_directory(
     image_dir: Tuple[str, List[str]],
     args: Namespace,
     progress: ProgressHandler,
+    memory: Optional[MemoryPlan] = None,
 ) -> None:
     dir_path, image_files = image_dir
+    headers = _read_headers(image_files)
+    memory = memory or _memory_plan(headers, args)
     out = _output_path(dir_path, args.input, args.output, args.archive)
-
-    progress.update(_STAGE_LOAD, "Loading")
-    images = ImageIO.load_all(files=tuple(image_files))
-
-    _pipeline(images, out, args, progress)
+    inputs = fingerprint_all(image_files, args.hash_inputs)
+    dir_out = _output_path(dir_path, args.input, args.output, archive=False)
+    manifests = _plan_manifests(dir_out, dir_out.rstrip(osp.sep) + ".zip")
+    journal = _Journal(out, inputs, _settings(args), args.resume)
+    sources = [(imf, None) for imf in image_files]
+    width = args.width or min(h.width for h in headers)
+    decoded = not _defers_decoding(image_files, headers, width, args)
+
+    if memory.stream:
+        images = ImageIO.iter_load(
+            # pages before the one a resumed run continues from are never read
+            files=image_files[journal.start[0]:],
+            prefetch=memory.prefetch,
+            executor=_executor(args),
+            composite_cache=_composite_cache(args),
+            reader=_reader(args),
+            width=None if args.defer_resize else width,
+            reducing_gap=args.reducing_gap,
+            decoded=decoded,
+        )
+        _stream_pipeline(
+            images, len(image_files), width, memory.prefetch, journal, args, progress,
+            inputs, manifests, headers, sources,
+        )
+    else:
+        progress.update(_STAGE_LOAD, "Loading")
+        # pages are resized by the workers loading them, before being decoded
+        images = ImageIO.load_all(
+            files=tuple(image_files),
+            executor=_executor(args),
+            composite_cache=_composite_cache(args),
+            reader=_reader(args),
+            width=None if args.defer_resize else width,
+            reducing_gap=args.reducing_gap,
+            decoded=decoded,
+        )
+        _pipeline(images, journal, args, progress, inputs, manifests, headers, sources)
+
+    _commit_output(journal, out, args)
 
 
 def _process_zip(zip_path: str, args: Namespace, progress: ProgressHandler) -> None:
-    out = args.output
-    if args.archive:
-        out = osp.join(out, osp.splitext(osp.basename(zip_path))[0] + ".zip")
-
-    progress.update(_STAGE_LOAD, "Loading archive")
-    images = ImageIO.load_archive(path=zip_path)
-    if not images:
+    out = _zip_output_path(zip_path, args)
+    inputs = fingerprint_all([zip_path], args.hash_inputs)
+    archive_out = osp.join(args.output, osp.splitext(osp.basename(zip_path))[0] + ".zip")
+    manifests = _plan_manifests(args.output, archive_out)
+    journal = _Journal(out, inputs, _settings(args), args.resume)
+
+    headers = ImageIO.archive_headers(path=zip_path)
+    if not headers:
         raise ValueError(f"No supported images found in '{zip_path}'")
+    memory = _memory_plan(headers, args)
+    sources = [(zip_path, name) for name in ImageIO.archive_members(path=zip_path)]
+    width = args.width or min(h.width for h in headers)
+    decoded = not _defers_decoding([name for _, name in sources], headers, width, args)
 
-    _pipeline(images, out, args, progress)
+    try:
+        if memory.stream:
+            images = ImageIO.iter_archive(
+                path=zip_path,
+                prefetch=memory.prefetch,
+                executor=_executor(args),
+                start=journal.start[0],
+                decoded=decoded,
+            )
+            _stream_pipeline(
+                images, len(headers), width, memory.prefetch, journal, args, progress,
+                inputs, manifests, headers, sources,
+            )
+        else:
+            progress.update(_STAGE_LOAD, "Loading archive")
+            images = ImageIO.load_archive(path=zip_path, executor=_executor(args), decoded=decoded)
+            _pipeline(images, journal, args, progress, inputs, manifests, headers, sources)
+    finally:
+        # unchanged pages are copied from the archive after it is loaded
+        ImageIO.close_archive(path=zip_path)
+
+    _commit_output(journal, out, args)
 
 
 # ---------------------------------------------------------------------------
@@ -125,6 +627,8 @@ def _process_zip(zip_path: str, args: Namespace, progress: ProgressHandler) -> N
 # ---------------------------------------------------------------------------
 
 def run(args: Namespace) -> int:
+    if args.dry_run:
+        return _dry_run(args)
     if _is_zip(args.input):
         return _run_zip(args)
     return _run_directory(args)
@@ -138,6 +642,12 @@ def _run_zip(args: Namespace) -> int:
     label = osp.basename(args.input)
     print(f"[1/1] {label}")
 
+    if args.incremental or args.resume:
+        inputs = fingerprint_all([args.input], args.hash_inputs)
+        if _is_up_to_date(_zip_output_path(args.input, args), args, inputs):
+            print("  Up to date, skipped")
+            return 0
+
     progress = _make_progress(args.progress)
     progress.start()
     try:
@@ -158,6 +668,17 @@ def _run_directory(args: Namespace) -> int:
         print(f"No supported images found in '{args.input}'", file=sys.stderr)
         return 1
 
+    if args.incremental or args.resume:
+        pending = [d for d in dirs if not _is_directory_up_to_date(d, args)]
+        if len(pending) < len(dirs):
+            print(f"Skipping {len(dirs) - len(pending)} up-to-date chapter(s)")
+        if not pending:
+            return 0
+        dirs = pending
+
+    if args.jobs > 1 and len(dirs) > 1:
+        return _run_directories_parallel(dirs, args)
+
     total = len(dirs)
     errors = 0
 
@@ -179,3 +700,172 @@ def _run_directory(args: Namespace) -> int:
         progress.finish()
 
     return 0 if errors == 0 else 1
+
+
+# ---------------------------------------------------------------------------
+# Planning without decoding (--dry-run)
+# ---------------------------------------------------------------------------
+
+def _report_plan(plan: SlicePlan, pages: int) -> None:
+    heights = [h for _, (_, h) in plan.outputs]
+    print(
+        f"  {pages} pages -> {len(heights)} outputs, {plan.width} px wide, "
+        f"{min(heights)}-{max(heights)} px tall"
+    )
+    for violation in plan.violations:
+        print(f"  Warning: {violation}", file=sys.stderr)
+
+
+def _export_plan(plan: SlicePlan, name: str, args: Namespace) -> None:
+    path = osp.join(args.export_plan, f"{name}.json")
+    os.makedirs(osp.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(plan.to_dict(), f, indent=1)
+
+
+def _dry_run(args: Namespace) -> int:
+    """Plan every chapter from its image headers, without decoding or writing images."""
+    chapters = []
+    if _is_zip(args.input):
+        stem = osp.splitext(osp.basename(args.input))[0]
+        archive_out = osp.join(args.output, stem + ".zip")
+
+        read = functools.partial(ImageIO.archive_headers, path=args.input)
+        chapters.append((stem, read, _plan_manifests(args.output, archive_out)))
+    else:
+        for dir_path, image_files in scan(args.input, recursive=args.recursive):
+            rel = osp.relpath(dir_path, args.input)
+            name = osp.basename(osp.abspath(args.input)) if rel == "." else rel
+            dir_out = _output_path(dir_path, args.input, args.output, archive=False)
+            manifests = _plan_manifests(dir_out, dir_out.rstrip(osp.sep) + ".zip")
+            read = functools.partial(_read_headers, image_files)
+            chapters.append((name, read, manifests))
+
+    if not chapters:
+        print(f"No supported images found in '{args.input}'", file=sys.stderr)
+        return 1
+
+    failed = 0
+    for i, (name, read_headers, manifests) in enumerate(chapters, 1):
+        print(f"[{i}/{len(chapters)}] {name}")
+        try:
+            headers = read_headers()
+            if not headers:
+                raise ValueError("no supported images found")
+            path = None
+            if DetectionMethod(args.method) == DetectionMethod.METADATA:
+                path = _plan_path(args, manifests)
+            plan = plan_slices(
+                headers, args.format, args.method, args.height, args.width, path
+            )
+        except Exception as exc:
+            print(f"  Error: {exc}", file=sys.stderr)
+            failed += 1
+            continue
+
+        _report_plan(plan, len(headers))
+        if args.export_plan:
+            _export_plan(plan, name, args)
+        failed += bool(plan.violations)
+
+    return 0 if not failed else 1
+
+
+# ---------------------------------------------------------------------------
+# Chapter-level parallelism (--jobs)
+# ---------------------------------------------------------------------------
+
+# Set in every worker process by _init_worker
+_progress_queue = None
+
+
+def _init_worker(progress_queue) -> None:
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _process_directory_job(
+    key: int,
+    image_dir: Tuple[str, List[str]],
+    args: Namespace,
+    memory: Optional[MemoryPlan],
+) -> None:
+    _process_directory(image_dir, args, QueueProgress(_progress_queue, key), memory)
+
+
+def _drain(progress_queue, aggregator: ProgressAggregator) -> None:
+    while True:
+        try:
+            _, value, msg = progress_queue.get_nowait()
+        except queue.Empty:
+            return
+        aggregator.update(value, msg)
+
+
+def _reserved(plan: Optional[MemoryPlan]) -> int:
+    return 0 if plan is None else plan.reserved
+
+
+def _run_directories_parallel(dirs: List[Tuple[str, List[str]]], args: Namespace) -> int:
+    """Process up to --jobs chapters at once, biggest first, within --max-memory if set."""
+    total = len(dirs)
+    jobs = min(args.jobs, total)
+    order = sorted(range(total), key=lambda i: _chapter_size(dirs[i][1]), reverse=True)
+    budget = args.max_memory if args.max_memory is not None else float("inf")
+    errors = []
+    done = 0
+
+    # without --max-memory every chapter plans itself once it starts
+    plans: List[Optional[MemoryPlan]] = [None] * total
+    if args.max_memory is not None:
+        for i, (dir_path, image_files) in enumerate(dirs):
+            try:
+                plans[i] = _memory_plan(_read_headers(image_files), args)
+            except Exception as exc:
+                errors.append((osp.relpath(dir_path, args.input), exc))
+                order.remove(i)
+                done += 1
+
+    print(f"Processing {total} chapters with {jobs} jobs")
+    progress = _make_progress(args.progress)
+    aggregator = ProgressAggregator(progress, total)
+    progress_queue = multiprocessing.Queue()
+
+    progress.start()
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker, initargs=(progress_queue,)
+    ) as executor:
+        queued = list(order)
+        running = {}
+        reserved = 0
+        while queued or running:
+            for i in list(queued):
+                if len(running) >= jobs:
+                    break
+                # smaller chapters fill the gaps; one that never fits runs alone
+                if running and reserved + _reserved(plans[i]) > budget:
+                    continue
+                queued.remove(i)
+                reserved += _reserved(plans[i])
+                future = executor.submit(_process_directory_job, i, dirs[i], args, plans[i])
+                running[future] = i
+
+            finished, _ = wait(running, timeout=_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            _drain(progress_queue, aggregator)
+            for future in finished:
+                i = running.pop(future)
+                reserved -= _reserved(plans[i])
+                done += 1
+                label = osp.relpath(dirs[i][0], args.input)
+                exc = future.exception()
+                if exc is not None:
+                    errors.append((label, exc))
+                if not args.progress:
+                    print(f"[{done}/{total}] {label}")
+    _drain(progress_queue, aggregator)
+    progress.finish()
+
+    for label, exc in errors:
+        print(f"  Error in {label}: {exc}", file=sys.stderr)
+
+    return 0 if not errors else 1
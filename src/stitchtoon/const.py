@@ -1,6 +1,7 @@
 from enum import StrEnum
 from os import PathLike
 from typing import Union
+from zipfile import ZIP_DEFLATED, ZIP_STORED
 
 _PathType = Union[str, PathLike]
 
@@ -28,6 +29,20 @@ FORMATS_LIMITS = {
     "tga": MAX_IMAGE_SIZE,
 }
 
+# Zip compression of archived images per format: formats that are already
+# compressed barely shrink under deflate, so they are stored as they are
+ARCHIVE_COMPRESSION = {
+    "jpg": ZIP_STORED,
+    "jpeg": ZIP_STORED,
+    "webp": ZIP_STORED,
+    "png": ZIP_STORED,
+    "psd": ZIP_DEFLATED,
+    "psb": ZIP_DEFLATED,
+    "tiff": ZIP_DEFLATED,
+    "bmp": ZIP_DEFLATED,
+    "tga": ZIP_DEFLATED,
+}
+
 # Formats supporting transparency
 SUPPORTS_TRANSPARENCY = {"png", "webp", "psd", "psb", "tga"}
 
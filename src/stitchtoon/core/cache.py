@@ -0,0 +1,15 @@
+import os
+import os.path as osp
+
+
+def default_cache_dir(*parts: str) -> str:
+    """Directory for stitchtoon's on-disk caches.
+
+    $STITCHTOON_CACHE_DIR if set, else $XDG_CACHE_HOME/stitchtoon, else
+    ~/.cache/stitchtoon, joined with 'parts'.
+    """
+    base = os.getenv("STITCHTOON_CACHE_DIR")
+    if not base:
+        xdg = os.getenv("XDG_CACHE_HOME") or osp.join(osp.expanduser("~"), ".cache")
+        base = osp.join(xdg, "stitchtoon")
+    return osp.join(base, *parts)
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import os.path as osp
+from typing import Optional
+
+import PIL.Image
+from PIL.Image import Image
+
+from ..const import _PathType
+from ..logger import logged
+from .cache import default_cache_dir
+from .manifest import fingerprint
+
+# TIFF keeps every mode a PSD composite can have (L, RGB, RGBA, CMYK, ...)
+_FORMAT = "tiff"
+_COMPRESSION = "tiff_lzw"
+
+# Bytes the cache may take on disk by default
+MAX_SIZE = 2 << 30
+
+
+class CompositeCache:
+    """On-disk cache of composited PSD/PSB files.
+
+    Rendering a Photoshop file that has no usable merged image means
+    compositing all of its layers, by far the slowest way to load a page.
+    The result is stored under CompositeCache.key, a digest of the file's
+    path and fingerprint, so later runs over the same file read it back
+    instead. Once the entries take more than 'max_size' bytes, the least
+    recently used ones are deleted.
+
+    Args:
+        path (str, optional): cache directory. Defaults to default_cache_dir("composites").
+        max_size (int): bytes the entries may take. Defaults to MAX_SIZE.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_size: int = MAX_SIZE):
+        self.path = path or default_cache_dir("composites")
+        self.max_size = max_size
+
+    @staticmethod
+    def key(image_file: _PathType) -> str:
+        """Cache key of 'image_file'; changes whenever the file is rewritten.
+
+        Raises:
+            OSError: if 'image_file' cannot be stat'ed.
+        """
+        material = {"path": osp.abspath(image_file), **fingerprint(image_file)}
+        data = json.dumps(material, sort_keys=True).encode()
+        return hashlib.sha256(data).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return osp.join(self.path, key[:2], f"{key}.{_FORMAT}")
+
+    @logged(inclass=True)
+    def get(self, key: str) -> Optional[Image]:
+        """Cached composite for 'key', decoded, or None."""
+        entry = self._entry(key)
+        try:
+            img = PIL.Image.open(entry)
+            img.load()
+        except (OSError, ValueError, PIL.Image.DecompressionBombError):
+            return None
+        try:
+            # the modification time orders entries for eviction
+            os.utime(entry)
+        except OSError:
+            pass
+        return img
+
+    @logged(inclass=True)
+    def put(self, key: str, image: Image) -> None:
+        """Store 'image' under 'key'. Failing to write the cache is not an error."""
+        entry = self._entry(key)
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(osp.dirname(entry), exist_ok=True)
+            image.save(tmp, _FORMAT, compression=_COMPRESSION)
+            os.replace(tmp, entry)
+        except (OSError, ValueError):
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        """delete the least recently used entries until they fit in max_size."""
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if not name.endswith(f".{_FORMAT}"):
+                    continue
+                try:
+                    st = os.stat(osp.join(root, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, osp.join(root, name)))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, entry in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.unlink(entry)
+            except OSError:
+                continue
+            size -= entry_size
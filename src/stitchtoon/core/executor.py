@@ -0,0 +1,345 @@
+"""Pluggable executors used by every parallel stage of the pipeline.
+
+Three backends share one interface:
+
+* process: a long-lived process pool. Best for decoding and encoding
+  files, the only stages that hold the GIL for long (PSD compositing, PNG
+  filtering). Workers are warmed up once and the pool is replaced after
+  MAX_TASKS_PER_CHILD tasks per worker so memory fragmented by large images
+  is given back to the system.
+* thread: a thread pool. Pillow and NumPy release the GIL for the heavy
+  parts of decoding, resizing, pasting and row analysis, so threads scale
+  well without copying pixels between processes.
+* serial: runs everything inline; handy for small chapters, debugging and
+  for callers embedding the library.
+
+Stages that work on images already in memory (resize, detection, stitching)
+call Executor.local(), which is the executor itself for the thread and
+serial backends and a thread executor of the same size for the process
+backend: moving whole pages between processes costs more than it saves.
+"""
+
+import atexit
+import math
+import multiprocessing.util
+import os
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from enum import StrEnum
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import PIL.Image
+
+from ..logger import logged
+
+# Tasks per worker a process pool runs before it is replaced by a fresh one
+MAX_TASKS_PER_CHILD = 64
+
+
+class ExecutorType(StrEnum):
+    PROCESS = "process"
+    THREAD = "thread"
+    SERIAL = "serial"
+
+
+def _cgroup_cpu_quota() -> Optional[float]:
+    """CPU quota of the current cgroup in CPUs, or None if unlimited."""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota <= 0 or period <= 0:
+            return None
+        return quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    """Number of CPUs this process may actually use.
+
+    Respects the CPU affinity mask and the cgroup CPU quota, so a container
+    limited to 4 CPUs on a 64-core host gets 4 workers, not 64.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+class Executor(ABC):
+    """Common interface of all backends.
+
+    Args:
+        workers (int, optional): number of workers. Defaults to available_cpus().
+    """
+
+    kind: ExecutorType
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or available_cpus()
+
+    @property
+    def shares_memory(self) -> bool:
+        """True if tasks run in this process and can use its objects directly."""
+        return self.kind != ExecutorType.PROCESS
+
+    @abstractmethod
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """schedule fn(*args, **kwargs) and return a Future for its result."""
+
+    def imap(
+            self,
+            fn: Callable,
+            items: Iterable,
+            lookahead: Optional[int] = None,
+            discard: Optional[Callable[[Any], None]] = None,
+    ) -> Iterator:
+        """lazily yield fn(item) for every item, in order.
+
+        Args:
+            fn (Callable): function to apply. Must be picklable for the process backend.
+            items (Iterable): consumed lazily, at most 'lookahead' items ahead of the caller.
+            lookahead (int, optional): tasks in flight. Defaults to twice the number of workers.
+            discard (Callable, optional): called with results that were computed but
+                never yielded because the caller stopped iterating.
+        """
+        lookahead = lookahead or 2 * self.workers
+        pending: deque[Future] = deque()
+        try:
+            for item in items:
+                pending.append(self.submit(fn, item))
+                if len(pending) > lookahead:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            self._abandon(pending, discard)
+
+    def imap_unordered(
+            self,
+            fn: Callable,
+            items: Iterable,
+            lookahead: Optional[int] = None,
+            discard: Optional[Callable[[Any], None]] = None,
+    ) -> Iterator:
+        """like imap, but yield results in completion order."""
+        lookahead = lookahead or 2 * self.workers
+        pending: set[Future] = set()
+        try:
+            for item in items:
+                pending.add(self.submit(fn, item))
+                while len(pending) > lookahead:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            self._abandon(pending, discard)
+
+    def map(self, fn: Callable, items: Iterable) -> list:
+        """apply fn to every item and return the results in order."""
+        return list(self.imap(fn, items))
+
+    def local(self) -> "Executor":
+        """executor for work on objects living in this process. see module docstring."""
+        return self
+
+    def shutdown(self) -> None:
+        pass
+
+    @staticmethod
+    def _abandon(pending: Iterable[Future], discard: Optional[Callable[[Any], None]]) -> None:
+        for future in pending:
+            if future.cancel() or discard is None:
+                continue
+            future.add_done_callback(
+                lambda f: discard(f.result()) if f.exception() is None else None
+            )
+
+
+class SerialExecutor(Executor):
+    """Run every task inline, in the calling thread."""
+
+    kind = ExecutorType.SERIAL
+
+    def __init__(self, workers: Optional[int] = None):
+        super().__init__(1)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class ThreadExecutor(Executor):
+    """Run tasks on a persistent thread pool."""
+
+    kind = ExecutorType.THREAD
+
+    def __init__(self, workers: Optional[int] = None):
+        super().__init__(workers)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if self._pool is None or self._pid != os.getpid():
+            # threads do not survive a fork; start a fresh pool in the child
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+            self._pid = os.getpid()
+        return self._pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self) -> None:
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown()
+        self._pool = None
+
+
+def _warm_up() -> None:
+    """Process pool initializer: load everything a worker needs before its first task."""
+    PIL.Image.init()
+    import psd_tools  # noqa: F401
+
+
+class ProcessExecutor(Executor):
+    """Run tasks on a long-lived process pool, created on first use.
+
+    If a worker dies, killed for memory say, the tasks it was running fail
+    with BrokenProcessPool and the next task starts a fresh pool. The pool
+    is recycled by hand rather than with max_tasks_per_child, which can
+    leave a pool without workers on Python 3.11.
+    """
+
+    kind = ExecutorType.PROCESS
+
+    def __init__(self, workers: Optional[int] = None):
+        super().__init__(workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._tasks = 0
+        self._local: Optional[ThreadExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None or self._pid != os.getpid():
+            if self._pid != os.getpid():
+                # a pool inherited through fork belongs to the parent process.
+                # A worker process joins its children when it exits: stop ours
+                # first, and before the pool's queues are closed (priority 10)
+                multiprocessing.util.Finalize(self, self.shutdown, exitpriority=20)
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_warm_up)
+            self._pid = os.getpid()
+            self._tasks = 0
+        return self._pool
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        try:
+            future = self.pool.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            # a worker died: its tasks have failed, start over with a new pool
+            self._retire()
+            future = self.pool.submit(fn, *args, **kwargs)
+        self._tasks += 1
+        if self._tasks >= MAX_TASKS_PER_CHILD * self.workers:
+            self._retire()
+        return future
+
+    def _retire(self) -> None:
+        # tasks already submitted still run; the workers exit once they are done
+        self._pool.shutdown(wait=False)
+        self._pool = None
+
+    def local(self) -> Executor:
+        if self._local is None:
+            self._local = ThreadExecutor(self.workers)
+        return self._local
+
+    def shutdown(self) -> None:
+        """stop the pool, waiting for running tasks to finish."""
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown()
+        self._pool = None
+        if self._local is not None:
+            self._local.shutdown()
+
+
+_BACKENDS = {
+    ExecutorType.PROCESS: ProcessExecutor,
+    ExecutorType.THREAD: ThreadExecutor,
+    ExecutorType.SERIAL: SerialExecutor,
+}
+
+_default_kind = ExecutorType.PROCESS
+_default_workers: Optional[int] = None
+_executors: dict[tuple[ExecutorType, int], Executor] = {}
+
+
+@logged
+def get_executor(
+        kind: Optional[ExecutorType] = None,
+        workers: Optional[int] = None,
+) -> Executor:
+    """Return a shared executor, creating it on first use.
+
+    Executors are kept alive until shutdown_executors() or interpreter exit,
+    so repeated calls (one per chapter, say) reuse the same warm workers.
+
+    Args:
+        kind (ExecutorType, optional): backend. Defaults to the one set with set_default_executor.
+        workers (int, optional): number of workers. Defaults to available_cpus().
+
+    Returns:
+        Executor
+    """
+    if kind is None:
+        kind, workers = _default_kind, workers or _default_workers
+    kind = ExecutorType(kind)
+    workers = 1 if kind == ExecutorType.SERIAL else workers or available_cpus()
+
+    key = (kind, workers)
+    if key not in _executors:
+        _executors[key] = _BACKENDS[kind](workers)
+    return _executors[key]
+
+
+@logged
+def set_default_executor(kind: ExecutorType, workers: Optional[int] = None) -> None:
+    """Set the executor used when no executor is passed explicitly."""
+    global _default_kind, _default_workers
+    _default_kind = ExecutorType(kind)
+    _default_workers = workers
+
+
+@logged
+def shutdown_executors() -> None:
+    """Stop every shared executor."""
+    while _executors:
+        _, executor = _executors.popitem()
+        executor.shutdown()
+
+
+atexit.register(shutdown_executors)
@@ -1,29 +1,236 @@
-import multiprocessing
+import os
 import os.path as osp
+import shutil
+import threading
 import zipfile
+from collections import deque
+from concurrent.futures import Future
 from io import BytesIO
 from os import makedirs
-from typing import Optional
+from typing import Callable, Iterable, Iterator, Mapping, NamedTuple, Optional, Sequence, Union
 
 import PIL.Image
+from natsort import natsorted
 from PIL.Image import Image
 from psd_tools import PSDImage
-from psd_tools.constants import ChannelID
-
-from ..const import FORMATS
-from ..const import PS_FORMATS
-from ..const import SUPPORTS_TRANSPARENCY
-from ..const import _PathType
-from ..decorators import validate_format
-from ..decorators import validate_path
+
+from ..const import ARCHIVE_COMPRESSION, FORMATS, MAX_IMAGE_SIZE, PS_FORMATS, SUPPORTS_TRANSPARENCY, _PathType
+from ..decorators import validate_format, validate_path
+from ..exc import ImageTooLargeError
 from ..logger import logged
+from .composite_cache import CompositeCache
+from .executor import Executor, get_executor
 from .image_manipulator import ImageManipulator
+from .mapped_image import decode, mapped
+from .prefetch import PrefetchReader
+from .row_writer import ROW_WRITERS, open_row_writer
+from .shared_image import SharedImage, discard, share, unshare
+from .slices_detectors.slice import Slice
+from .stitcher import Stitcher
+
+
+class ImageHeader(NamedTuple):
+    """image size and mode, as read from a file header.
+
+    Has the width and height of an Image, so size-only code such as the
+    direct detector can run on headers instead of decoded images.
+    """
+
+    size: tuple[int, int]
+    mode: str
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+
+# width images are resized to as they are loaded and the reducing gap of
+# the resize, see ImageManipulator.resize; None to keep their size
+_Resize = Optional[tuple[int, Optional[float]]]
+
+
+def _load_indexed(
+        task: tuple[int, _PathType, bool, Optional[CompositeCache], Optional[bytes], _Resize, bool]
+) -> tuple[int, Union[Image, SharedImage]]:
+    idx, *task = task
+    return idx, _load_task(tuple(task))
+
+
+def _load_task(
+        task: tuple[_PathType, bool, Optional[CompositeCache], Optional[bytes], _Resize, bool]
+) -> Union[Image, SharedImage]:
+    image_file, shared_memory, composite_cache, data, resize, decoded = task
+    if not decoded and data is None:
+        # an undecoded image must not keep its file open
+        with open(image_file, "rb") as f:
+            data = f.read()
+    image = ImageIO.load_image(image_file=image_file, composite_cache=composite_cache, data=data)
+    if resize is not None:
+        # resized before being decoded, so JPEGs can be decoded at a reduced scale
+        width, reducing_gap = resize
+        image = ImageManipulator.resize(image, width=width, reducing_gap=reducing_gap)
+    if not decoded:
+        return image
+    return share(image) if shared_memory else decode(image)
+
+
+def _read_files(
+        files: Iterable[_PathType], reader: Optional[PrefetchReader]
+) -> Iterator[tuple[_PathType, Optional[bytes]]]:
+    # (file, content read ahead by 'reader', or None to be read by the decoder)
+    if reader is None:
+        return ((imf, None) for imf in files)
+    return reader.iter_read(files)
+
+
+def _save_task(task: tuple[_PathType, Union[Image, SharedImage], str, dict]) -> None:
+    out, image, format, params = task
+    ImageIO.save_image(out=out, image=unshare(image), format=format, **params)
+
+
+def _encode_task(task: tuple[Union[Image, SharedImage], str, dict]) -> bytes:
+    image, format, params = task
+    membuf = BytesIO()
+    unshare(image).save(membuf, format, **params)
+    return membuf.getvalue()
+
+
+def _read_task(task: tuple[_PathType, Optional[str]]) -> bytes:
+    path, member = task
+    if member is not None:
+        return _open_archive(path).read(member)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _copy_task(task: tuple[_PathType, Optional[str], _PathType]) -> None:
+    path, member, out = task
+    if member is None:
+        shutil.copyfile(path, out)
+    else:
+        with open(out, "wb") as f:
+            f.write(_open_archive(path).read(member))
+
+
+def _stream_task(
+    task: tuple[Optional[_PathType], Union[Sequence[Image], Mapping[int, Image]], Slice, str, str, str, dict]
+) -> Optional[bytes]:
+    # stitch a slice band by band in 'mode' and encode it in 'out_mode', to
+    # 'out' or to bytes if it is None
+    out, images, s, format, mode, out_mode, params = task
+    fp = BytesIO() if out is None else open(out, "wb")
+    with fp:
+        with open_row_writer(fp, s.size, out_mode, format, **params) as writer:
+            for band in Stitcher.iter_bands(images, s, mode=mode):
+                writer.write(ImageManipulator.convert_mode(band, out_mode))
+        return fp.getvalue() if out is None else None
+
+
+def _load_psd(
+        image_file: _PathType, composite_cache: Optional[CompositeCache], data: Optional[bytes] = None
+) -> Image:
+    """composite of a PSD/PSB file.
+
+    The merged image Photoshop stores alongside the layers is used when the
+    file has a valid one. Otherwise the layers are composited, which is
+    slow, so the result is kept in 'composite_cache' when one is given. A
+    composite found there is used without parsing the file.
+    """
+    key = None
+    if composite_cache is not None:
+        # only files without a usable merged image have an entry
+        key = CompositeCache.key(image_file)
+        img = composite_cache.get(key)
+        if img is not None:
+            return img
+
+    psd = PSDImage.open(image_file if data is None else BytesIO(data))
+    img = psd.topil() if psd.has_preview() else None
+    if img is not None and img.size == psd.size:
+        # the merged image already carries the alpha channel, if any
+        return img
+    img = psd.composite(ignore_preview=True)
+    if composite_cache is not None:
+        composite_cache.put(key, img)
+    return img
+
+
+def _discard_indexed(result: tuple[int, Union[Image, SharedImage]]) -> None:
+    discard(result[1])
+
+
+def _read_header(fp, name: str) -> "ImageHeader":
+    try:
+        with PIL.Image.open(fp) as img:
+            header = ImageHeader(img.size, img.mode)
+    except PIL.Image.DecompressionBombError as e:
+        raise ImageTooLargeError(f"{name}: {e}") from e
+    ImageIO.check_size(header.size, name=name)
+    return header
+
+
+# Archives kept open by each worker thread, see _open_archive
+_archives = threading.local()
+_MAX_OPEN_ARCHIVES = 4
+# every archive kept open by a thread of this process, see close_archive
+_open_archives: set[zipfile.ZipFile] = set()
+_open_archives_lock = threading.Lock()
+
+
+def _open_archive(path: _PathType) -> zipfile.ZipFile:
+    """ZipFile for 'path', opened once per worker thread and process.
+
+    Workers decoding members of the same archive reuse it instead of
+    parsing the central directory for every member. Each thread keeps at
+    most _MAX_OPEN_ARCHIVES open, closing the least recently used; the
+    threads of this process close theirs once a load is over, see
+    ImageIO.close_archive.
+    """
+    cache = getattr(_archives, "cache", None)
+    if cache is None:
+        cache = _archives.cache = {}
+    path = osp.abspath(path)
+    st = os.stat(path)
+    # a forked worker must not share the parent's file offset
+    key = (path, st.st_mtime_ns, st.st_size, os.getpid())
+    zf = cache.pop(key, None)
+    if zf is None or zf.fp is None:
+        # never opened, or closed by ImageIO.close_archive
+        zf = zipfile.ZipFile(path, "r")
+        with _open_archives_lock:
+            _open_archives.add(zf)
+        while len(cache) >= _MAX_OPEN_ARCHIVES:
+            _close_archive(cache.pop(next(iter(cache))))
+    # most recently used last
+    cache[key] = zf
+    return zf
+
+
+def _close_archive(zf: zipfile.ZipFile) -> None:
+    with _open_archives_lock:
+        _open_archives.discard(zf)
+    zf.close()
+
 
+def _load_member_task(task: tuple[_PathType, str, bool, bool]) -> Union[Image, SharedImage]:
+    path, name, shared_memory, decoded = task
+    image = _read_member(_open_archive(path), name, decoded)
+    return share(image) if shared_memory and decoded else image
 
-def error_callback(e: Exception):
-    print(
-        f"Exception raised in ImageIO.save_image: {type(e).__name__}: {str(e)}"
-    )
+
+def _read_member(zf: zipfile.ZipFile, name: str, decoded: bool = True) -> Image:
+    # ZipFile.read checks the CRC as it decompresses
+    data = zf.read(name)
+    try:
+        image = PIL.Image.open(BytesIO(data))
+    except PIL.Image.DecompressionBombError as e:
+        raise ImageTooLargeError(f"{name}: {e}") from e
+    ImageIO.check_size(image.size, name=name)
+    return decode(image) if decoded else image
 
 
 class ImageIO:
@@ -32,14 +239,26 @@ class ImageIO:
     @validate_path("image_file")
     @validate_format(filename_arg="image_file")
     @logged(inclass=True)
-    def load_image(*, image_file: _PathType) -> Image:
+    def load_image(
+            *,
+            image_file: _PathType,
+            composite_cache: Optional[CompositeCache] = None,
+            data: Optional[bytes] = None,
+    ) -> Image:
         """load image file into Image object.
 
         Args:
             image_file (Union[str, Path]): image_file
+            composite_cache (CompositeCache, optional): where PSD/PSB files without
+                a usable merged image keep their composite between runs.
+                Defaults to no caching.
+            data (bytes, optional): content of 'image_file', already read, e.g. by
+                a core.prefetch.PrefetchReader. The file is then never read again.
 
         Returns:
             lazy loaded Image if not a Photoshop format, else a loaded image.
+            Uncompressed BMP/TGA/TIFF files read from disk give a MappedImage,
+            see core.mapped_image.
 
         Raises:
             FileNotFoundError: if 'image_file' does not exist.
@@ -48,65 +267,309 @@ class ImageIO:
         file_ext = osp.splitext(image_file)[1].strip(".")
 
         if file_ext in PS_FORMATS:
-            psd = PSDImage.open(image_file)
-            img = psd.composite()
+            img = _load_psd(image_file, composite_cache, data)
             img.format = "psd"
-            if psd.channels >= 4:
-                # the alpha (channel) in photoshop
-                alpha = psd.topil(ChannelID.TRANSPARENCY_MASK)
-                img.putalpha(alpha)
+        elif data is not None:
+            img = PIL.Image.open(BytesIO(data))
         else:
-            img = PIL.Image.open(image_file)
+            # uncompressed BMP/TGA/TIFF pages are mapped, not decoded
+            img = mapped(PIL.Image.open(image_file))
 
         return img
 
     @staticmethod
     @validate_path("path")
     @logged(inclass=True)
-    def load_archive(path: _PathType) -> Optional[list[Image]]:
-        """load images from an archive.
+    def archive_members(*, path: _PathType) -> list[str]:
+        """names of the supported images in an archive, in natural order.
 
         Raises:
             FileNotFoundError: if 'path' does not exist.
-            ValueError: see zipfile.ZipFile.testzip and zipfile.ZipFile.read for more info.
         """
-        zf = zipfile.ZipFile(path, "r")
-        zf.testzip()
-        zf_files = zf.namelist()
-
-        img_files = []
-        for file in zf_files:
-            if osp.splitext(file)[1].strip(".") in FORMATS:
-                img_files.append(file)
-        if not img_files:
-            return None
-
-        imgs = []
-        for img_file in img_files:
-            data = zf.read(img_file)
-            membuf = BytesIO(data)
-            img = PIL.Image.open(membuf)
-            imgs.append(img)
-
-        return imgs
-
-    @staticmethod
-    @logged(inclass=True)
-    def load_all(*, files: tuple[_PathType]):
-        pool = multiprocessing.Pool()
-        async_res = [
-            pool.apply_async(
-                ImageIO.load_image,
-                kwds={"image_file": imf},
-                error_callback=error_callback,
+        with zipfile.ZipFile(path, "r") as zf:
+            return natsorted(
+                name for name in zf.namelist()
+                if osp.splitext(name)[1].strip(".") in FORMATS
             )
-            for imf in files
-        ]
 
-        pool.close()
-        pool.join()
+    @staticmethod
+    @validate_path("path")
+    @logged(inclass=True)
+    def load_archive(
+            path: _PathType,
+            executor: Optional[Executor] = None,
+            shared_memory=True,
+            decoded: bool = True,
+    ) -> Optional[list[Image]]:
+        """load and decode the images of an archive, in natural order.
+
+        Members are decoded in parallel by workers that open the archive
+        themselves; each member is decompressed once, its CRC checked while
+        it is read, and its bytes dropped as soon as it is decoded.
+
+        Args:
+            path (_PathType): archive path.
+            executor (Executor, optional): defaults to executor.get_executor().
+            shared_memory: see ImageIO.load_all.
+            decoded (bool): see ImageIO.iter_load_all. Defaults to True.
+
+        Returns:
+            decoded images, or None if the archive holds no supported image.
+
+        Raises:
+            FileNotFoundError: if 'path' does not exist.
+            zipfile.BadZipFile: if a member is corrupt.
+            ImageTooLargeError: see ImageIO.check_size.
+        """
+        images = list(
+            ImageIO.iter_archive(
+                path=path, prefetch=None, executor=executor, shared_memory=shared_memory, decoded=decoded
+            )
+        )
+        return images or None
+
+    @staticmethod
+    @logged(inclass=True)
+    def close_archive(*, path: _PathType) -> None:
+        """close the handles the threads of this process keep open on an archive.
+
+        Called once an archive is loaded; a thread reading it again reopens
+        it. Process workers keep at most a few archives open each, until
+        they are recycled, see executor.MAX_TASKS_PER_CHILD.
+        """
+        path = osp.abspath(path)
+        with _open_archives_lock:
+            handles = [zf for zf in _open_archives if zf.filename == path]
+        for zf in handles:
+            _close_archive(zf)
+
+    @staticmethod
+    @validate_path("path")
+    @logged(inclass=True)
+    def iter_archive(
+            *,
+            path: _PathType,
+            prefetch: Optional[int] = 2,
+            executor: Optional[Executor] = None,
+            shared_memory=True,
+            start: int = 0,
+            decoded: bool = True,
+    ) -> Iterator[Image]:
+        """lazily decode the images of an archive in natural order.
+
+        Workers only receive the archive path and a member name. At most
+        'prefetch' members are decoded ahead of the consumer; None lets
+        the executor pick, see Executor.imap. The first 'start' images are
+        skipped without being read. With 'decoded' False members are read
+        but left undecoded, see ImageIO.iter_load_all.
+
+        Raises:
+            see ImageIO.load_archive.
+        """
+        executor = executor or get_executor()
+        if not decoded:
+            executor = executor.local()
+        shared_memory = shared_memory and not executor.shares_memory
+        path = osp.abspath(path)
+        members = ImageIO.archive_members(path=path)[start:]
+        tasks = ((path, name, shared_memory, decoded) for name in members)
+        try:
+            for image in executor.imap(
+                _load_member_task, tasks, lookahead=prefetch, discard=discard
+            ):
+                yield unshare(image)
+        finally:
+            ImageIO.close_archive(path=path)
+
+    @staticmethod
+    @validate_path("path")
+    @logged(inclass=True)
+    def archive_headers(*, path: _PathType) -> list[ImageHeader]:
+        """read the size and mode of every image in an archive.
+
+        Only the start of each member is decompressed.
+
+        Raises:
+            FileNotFoundError: if 'path' does not exist.
+            ImageTooLargeError: see ImageIO.check_size.
+        """
+        members = ImageIO.archive_members(path=path)
+        with zipfile.ZipFile(path, "r") as zf:
+            headers = []
+            for name in members:
+                with zf.open(name) as member:
+                    headers.append(_read_header(member, name))
+            return headers
+
+    @staticmethod
+    @logged(inclass=True)
+    def load_all(
+            *,
+            files: tuple[_PathType],
+            executor: Optional[Executor] = None,
+            shared_memory: bool = True,
+            composite_cache: Optional[CompositeCache] = None,
+            reader: Optional[PrefetchReader] = None,
+            width: Optional[int] = None,
+            reducing_gap: Optional[float] = None,
+            decoded: bool = True,
+    ):
+        images = [None] * len(files)
+        for idx, img in ImageIO.iter_load_all(
+                files=files,
+                executor=executor,
+                shared_memory=shared_memory,
+                composite_cache=composite_cache,
+                reader=reader,
+                width=width,
+                reducing_gap=reducing_gap,
+                decoded=decoded,
+        ):
+            images[idx] = img
+        return images
+
+    @staticmethod
+    @logged(inclass=True)
+    def iter_load_all(
+            *,
+            files: Iterable[_PathType],
+            executor: Optional[Executor] = None,
+            shared_memory: bool = True,
+            composite_cache: Optional[CompositeCache] = None,
+            reader: Optional[PrefetchReader] = None,
+            width: Optional[int] = None,
+            reducing_gap: Optional[float] = None,
+            decoded: bool = True,
+    ) -> Iterator[tuple[int, Image]]:
+        """load image files on 'executor'.
+
+        Args:
+            files (Iterable[_PathType]): image files.
+            executor (Executor, optional): defaults to executor.get_executor().
+            shared_memory (bool): with a process executor, hand decoded pixels back
+                through shared memory instead of pickling them. see core.shared_image.
+                Defaults to True.
+            composite_cache (CompositeCache, optional): see ImageIO.load_image.
+            reader (PrefetchReader, optional): reads the files ahead of the workers,
+                which then decode them from memory. Defaults to the workers
+                reading their files themselves.
+            width (int, optional): width the workers resize images to, before
+                decoding them. Defaults to keeping their size.
+            reducing_gap (float, optional): see ImageManipulator.resize.
+            decoded (bool): decode the images. False leaves them to be decoded
+                when their pixels are needed, so the slice detectors can
+                draft-decode JPEGs, see pixel_detect; they are then loaded on
+                executor.local(), as undecoded images cannot leave the
+                worker process. Defaults to True.
+
+        Yields:
+            tuple[int, Image]: (index in 'files', image), in completion order.
+        """
+        executor = executor or get_executor()
+        if not decoded:
+            executor = executor.local()
+        shared_memory = shared_memory and not executor.shares_memory
+        resize = None if width is None else (width, reducing_gap)
+        tasks = (
+            (idx, imf, shared_memory, composite_cache, data, resize, decoded)
+            for idx, (imf, data) in enumerate(_read_files(files, reader))
+        )
+        for idx, image in executor.imap_unordered(
+                _load_indexed, tasks, discard=_discard_indexed
+        ):
+            yield idx, unshare(image)
+
+    @staticmethod
+    @logged(inclass=True)
+    def iter_load(
+            *,
+            files: Iterable[_PathType],
+            prefetch: int = 2,
+            executor: Optional[Executor] = None,
+            composite_cache: Optional[CompositeCache] = None,
+            reader: Optional[PrefetchReader] = None,
+            width: Optional[int] = None,
+            reducing_gap: Optional[float] = None,
+            decoded: bool = True,
+    ) -> Iterator[Image]:
+        """lazily load and decode image files in order.
+
+        At most 'prefetch' images are decoded ahead of the consumer, so memory
+        stays bounded no matter how many files are given.
+
+        Args:
+            files (Iterable[_PathType]): image files.
+            prefetch (int): number of images to decode ahead. Defaults to 2.
+            executor (Executor, optional): defaults to executor.get_executor().
+            composite_cache (CompositeCache, optional): see ImageIO.load_image.
+            reader (PrefetchReader, optional): see ImageIO.iter_load_all.
+            width, reducing_gap, decoded: see ImageIO.iter_load_all.
+
+        Yields:
+            Image: fully decoded images, unless 'decoded' is False.
+        """
+        executor = executor or get_executor()
+        if not decoded:
+            executor = executor.local()
+        shared_memory = not executor.shares_memory
+        resize = None if width is None else (width, reducing_gap)
+        tasks = (
+            (imf, shared_memory, composite_cache, data, resize, decoded)
+            for imf, data in _read_files(files, reader)
+        )
+        for image in executor.imap(_load_task, tasks, lookahead=prefetch, discard=discard):
+            yield unshare(image)
+
+    @staticmethod
+    @validate_path("image_file")
+    @validate_format(filename_arg="image_file")
+    @logged(inclass=True)
+    def image_size(*, image_file: _PathType) -> tuple[int, int]:
+        """read image size from the file header without decoding pixels.
+
+        Raises:
+            FileNotFoundError: if 'image_file' does not exist.
+        """
+        return ImageIO.image_header(image_file=image_file)[0]
+
+    @staticmethod
+    @validate_path("image_file")
+    @validate_format(filename_arg="image_file")
+    @logged(inclass=True)
+    def image_header(*, image_file: _PathType) -> ImageHeader:
+        """read image size and mode from the file header without decoding pixels.
+
+        PSD/PSB files report the mode of their composite, RGBA.
+
+        Raises:
+            FileNotFoundError: if 'image_file' does not exist.
+            ImageTooLargeError: see ImageIO.check_size.
+        """
+        file_ext = osp.splitext(image_file)[1].strip(".")
+        if file_ext in PS_FORMATS:
+            header = ImageHeader(PSDImage.open(image_file).size, "RGBA")
+            ImageIO.check_size(header.size, name=str(image_file))
+            return header
+        return _read_header(image_file, str(image_file))
 
-        return [ar.get(0.5) for ar in async_res]
+    @staticmethod
+    def check_size(size: tuple[int, int], name: str = "image") -> None:
+        """reject images too large to be processed safely.
+
+        Raises:
+            ImageTooLargeError: if a side exceeds stitchtoon.const.MAX_IMAGE_SIZE, or the
+                pixel count exceeds Pillow's decompression bomb limit.
+        """
+        width, height = size
+        if width > MAX_IMAGE_SIZE or height > MAX_IMAGE_SIZE:
+            raise ImageTooLargeError(
+                f"{name}: {width}x{height} exceeds the {MAX_IMAGE_SIZE} px size limit"
+            )
+        limit = PIL.Image.MAX_IMAGE_PIXELS
+        if limit and width * height > 2 * limit:
+            raise ImageTooLargeError(
+                f"{name}: {width}x{height} pixels could be a decompression bomb"
+            )
 
     @staticmethod
     @validate_format
@@ -143,16 +606,26 @@ class ImageIO:
             format: str,
             mode: str = "w",
             compress_level=5,
+            compression: Optional[int] = None,
+            executor: Optional[Executor] = None,
+            shared_memory=True,
             **params,
     ) -> None:
         """save images into an archive file.
 
+        Images are encoded in parallel and written to the archive in order as
+        they finish.
+
         Args:
             out (_PathType): output file name, or output directory (file name will be a time stamp).
             images (list[Image]): list of images to archive.
             format (str): format to save images in.
             mode (str): archive creation mode. Defaults to 'w'. see zipfile.ZipFile for more info.
             compress_level (int): compression level 1->9, defaults to 5.
+            compression (int, optional): zipfile compression method. Defaults to the
+                format's, see ImageIO.archive_compression.
+            executor: executor to encode images on. Defaults to executor.get_executor().
+            shared_memory: see ImageIO.save_all.
             params: parameters for Pillow image writer.
 
         Raises:
@@ -164,18 +637,25 @@ class ImageIO:
             # TODOO: add support for making psd/psb archives
             raise Exception("Can't make PSD/PSB archive.")
 
-        zf = zipfile.ZipFile(
-            out, mode, zipfile.ZIP_DEFLATED, compresslevel=compress_level
+        executor = executor or get_executor()
+        shared_memory = shared_memory and not executor.shares_memory
+        tasks = (
+            (share(img) if shared_memory else img, format, params) for img in images
         )
+        compression = ImageIO.archive_compression(format, compression)
+        with zipfile.ZipFile(out, mode, compression, compresslevel=compress_level) as zf:
+            for idx, data in enumerate(executor.imap(_encode_task, tasks), 1):
+                zf.writestr(ImageIO.filename_format_handler(f"{idx:03}", format), data)
 
-        for idx, image in enumerate(images, 1):
-            img_byte_arr = BytesIO()
-            image.save(img_byte_arr, format, **params)
-            img_byte_arr = img_byte_arr.getvalue()
-            zf.writestr(
-                ImageIO.filename_format_handler(f"{idx:03}", format), img_byte_arr
-            )
-        zf.close()
+    @staticmethod
+    def archive_compression(format: str, compression: Optional[int] = None) -> int:
+        """zip compression method for images saved as 'format'.
+
+        'compression' if given, else the format's entry in stitchtoon.const.ARCHIVE_COMPRESSION.
+        """
+        if compression is not None:
+            return compression
+        return ARCHIVE_COMPRESSION.get(format, zipfile.ZIP_DEFLATED)
 
     @staticmethod
     @validate_format
@@ -188,8 +668,10 @@ class ImageIO:
             archive=False,
             convert_modes=True,
             make_dirs=False,
+            executor: Optional[Executor] = None,
+            shared_memory=True,
             **params,
-    ) -> None:
+    ) -> list[str]:
         """save all images to 'out'.
 
         Args:
@@ -199,8 +681,14 @@ class ImageIO:
             archive: if true, images will be saved into an archive. Defaults to False.
             convert_modes: if true, images modes will be auto converted according to format. Defaults to True
             make_dirs: make 'out' and it's parents directories if not exists. Defaults to False
+            executor: executor to encode images on. Defaults to executor.get_executor().
+            shared_memory: with a process executor, hand images to the workers through shared memory
+                instead of pickling them. Defaults to True.
             params: parameters for Pillow image writer.
 
+        Returns:
+            list[str]: paths written; the archive path, or one path per image.
+
         Raises:
             UnSupportedFormatError: when format is not supported. see stitchtoon.const.FORMATS.
         """
@@ -208,32 +696,102 @@ class ImageIO:
             outdirs = osp.dirname(out) if osp.splitext(out)[1] else out
             makedirs(outdirs, exist_ok=True)
 
-        # TODO: only convert incompatible images
         if convert_modes:
-            if format in SUPPORTS_TRANSPARENCY:
-                mode = "RGBA"
-            else:
-                mode = "RGB"
-            cnvrtd_imgs = [ImageManipulator.convert_mode(img, mode) for img in images]
+            # images already in a mode 'format' takes are left as they are
+            cnvrtd_imgs = [
+                ImageManipulator.convert_mode(img, ImageIO.format_mode(format, img.mode))
+                for img in images
+            ]
             del images
             images = cnvrtd_imgs
 
+        executor = executor or get_executor()
         if archive:
-            ImageIO.archive_images(out=out, images=images, format=format, **params)
-        else:
-            pool = multiprocessing.Pool()
-            for idx, img in enumerate(images, 1):
-                outpath = osp.join(
-                    out, ImageIO.filename_format_handler(f"{idx:03}", format)
-                )
-                pool.apply_async(
-                    ImageIO.save_image,
-                    kwds={"out": outpath, "image": img, "format": format, **params},
-                    error_callback=error_callback,
-                )
+            ImageIO.archive_images(
+                out=out,
+                images=images,
+                format=format,
+                executor=executor,
+                shared_memory=shared_memory,
+                **params,
+            )
+            return [str(out)]
 
-            pool.close()
-            pool.join()
+        shared_memory = shared_memory and not executor.shares_memory
+        paths = [
+            osp.join(out, ImageIO.filename_format_handler(f"{idx:03}", format))
+            for idx in range(1, len(images) + 1)
+        ]
+        tasks = (
+            (path, share(img) if shared_memory else img, format, params)
+            for path, img in zip(paths, images)
+        )
+        # imap keeps a bounded number of images shared but not yet saved
+        for _ in executor.imap_unordered(_save_task, tasks):
+            pass
+        return paths
+
+    @staticmethod
+    @validate_format
+    @logged(inclass=True)
+    def open_writer(
+            *,
+            out: _PathType,
+            format: str,
+            archive=False,
+            convert_modes=True,
+            make_dirs=False,
+            max_pending=2,
+            compression: Optional[int] = None,
+            executor: Optional[Executor] = None,
+            start=0,
+            on_complete: Optional[Callable[[str], None]] = None,
+            **params,
+    ) -> "ImageWriter":
+        """open an ImageWriter that saves images to 'out' one at a time.
+
+        Args:
+            see ImageIO.save_all, ImageIO.archive_images for 'compression', and
+            ImageWriter for 'max_pending', 'start' and 'on_complete'.
+
+        Raises:
+            UnSupportedFormatError: when format is not supported. see stitchtoon.const.FORMATS.
+        """
+        if make_dirs:
+            outdirs = osp.dirname(out) if osp.splitext(out)[1] else out
+            makedirs(outdirs, exist_ok=True)
+        if archive and format in PS_FORMATS:
+            # TODOO: add support for making psd/psb archives
+            raise Exception("Can't make PSD/PSB archive.")
+
+        return ImageWriter(
+            out,
+            format,
+            archive=archive,
+            convert_modes=convert_modes,
+            max_pending=max_pending,
+            compression=compression,
+            executor=executor,
+            start=start,
+            on_complete=on_complete,
+            **params,
+        )
+
+    @staticmethod
+    def format_mode(format: str, mode: Optional[str] = None) -> str:
+        """image mode images are converted to before being saved as 'format'.
+
+        Args:
+            format (str): output format.
+            mode (str, optional): mode of the image. Grayscale images stay L,
+                and transparency is kept only if 'format' supports it. Without
+                it, the mode any image can be converted to: RGBA or RGB.
+        """
+        if mode == "L":
+            return mode
+        if mode is None or mode in ("RGBA", "LA", "PA", "P"):
+            return "RGBA" if format in SUPPORTS_TRANSPARENCY else "RGB"
+        return "RGB"
 
     @staticmethod
     @logged(inclass=True)
@@ -253,3 +811,149 @@ class ImageIO:
             filename = f"{osp.splitext(filename)[0]}.{ext}"
 
         return filename
+
+
+class ImageWriter:
+    """save images to a directory or an archive as they are produced.
+
+    Images are numbered in the order they are written, exactly like
+    ImageIO.save_all numbers them, starting after 'start'. Encoding runs on
+    'executor', with at most 'max_pending' images waiting to be encoded, so
+    the caller can produce the next image while the previous ones are being
+    written. 'on_complete' is called with the file name of every image once
+    it is fully written, in order.
+
+    Use it as a context manager, or call close() when done.
+    """
+
+    def __init__(
+            self,
+            out: _PathType,
+            format: str,
+            archive=False,
+            convert_modes=True,
+            max_pending=2,
+            compress_level=5,
+            compression: Optional[int] = None,
+            executor: Optional[Executor] = None,
+            start=0,
+            on_complete: Optional[Callable[[str], None]] = None,
+            **params,
+    ):
+        self.out = out
+        self.format = format
+        self.archive = archive
+        self.convert_modes = convert_modes
+        self.params = params
+        self.count = start
+        self.on_complete = on_complete
+        # paths written; the archive path, or one path per image
+        self.paths: list[str] = [str(out)] if archive else []
+        self._max_pending = max(1, max_pending)
+        self._pending: deque[tuple[str, Future]] = deque()
+        self._executor = executor or get_executor()
+        self._zf = None
+        if archive:
+            self._zf = zipfile.ZipFile(
+                out,
+                "w",
+                ImageIO.archive_compression(format, compression),
+                compresslevel=compress_level,
+            )
+
+    def write(self, image: Image) -> None:
+        """queue 'image' to be saved as the next file."""
+        self.count += 1
+        name = ImageIO.filename_format_handler(f"{self.count:03}", self.format)
+        if self.convert_modes:
+            image = ImageManipulator.convert_mode(image, ImageIO.format_mode(self.format, image.mode))
+        if not self._executor.shares_memory:
+            image = share(image)
+
+        if self._zf is not None:
+            future = self._executor.submit(_encode_task, (image, self.format, self.params))
+        else:
+            path = osp.join(self.out, name)
+            future = self._executor.submit(
+                _save_task, (path, image, self.format, self.params)
+            )
+            self.paths.append(path)
+        self._queue(name, future)
+
+    def write_slice(
+            self, images: Union[Sequence[Image], Mapping[int, Image]], s: Slice, mode="RGBA"
+    ) -> None:
+        """queue slice 's' of 'images' to be stitched and saved as the next file, row by row.
+
+        The slice is never held whole, unlike an image stitched with
+        Stitcher.stitch_slice and passed to write(): bands of its rows are
+        stitched in 'mode' and encoded one after the other, see core.row_writer.
+        'images' are read in place, so this runs on threads.
+
+        Raises:
+            ValueError: if the format cannot be written row by row, see row_writer.ROW_WRITERS.
+        """
+        if self.format not in ROW_WRITERS:
+            raise ValueError(f"{self.format} cannot be written row by row")
+        self.count += 1
+        name = ImageIO.filename_format_handler(f"{self.count:03}", self.format)
+        out_mode = ImageIO.format_mode(self.format, mode) if self.convert_modes else mode
+        task = (images, s, self.format, mode, out_mode, self.params)
+        executor = self._executor.local()
+        if self._zf is not None:
+            future = executor.submit(_stream_task, (None, *task))
+        else:
+            path = osp.join(self.out, name)
+            future = executor.submit(_stream_task, (path, *task))
+            self.paths.append(path)
+        self._queue(name, future)
+
+    def copy(self, path: _PathType, member: Optional[str] = None) -> None:
+        """queue an already encoded image to be written unchanged as the next file.
+
+        Args:
+            path (_PathType): image file, or archive holding the image.
+            member (str, optional): name of the image inside archive 'path'.
+        """
+        self.count += 1
+        name = ImageIO.filename_format_handler(f"{self.count:03}", self.format)
+        if self._zf is not None:
+            future = self._executor.submit(_read_task, (path, member))
+        else:
+            out = osp.join(self.out, name)
+            future = self._executor.submit(_copy_task, (path, member, out))
+            self.paths.append(out)
+        self._queue(name, future)
+
+    def _queue(self, name: str, future: Future) -> None:
+        self._pending.append((name, future))
+        while len(self._pending) > self._max_pending:
+            self._complete(*self._pending.popleft())
+
+    def close(self) -> None:
+        """wait for every queued image to be written, then release resources."""
+        try:
+            while self._pending:
+                self._complete(*self._pending.popleft())
+        finally:
+            if self._zf is not None:
+                self._zf.close()
+
+    def _complete(self, name: str, future: Future) -> None:
+        result = future.result()
+        if self._zf is not None:
+            # archive members are written in order from the calling thread
+            self._zf.writestr(name, result)
+        if self.on_complete is not None:
+            self.on_complete(name)
+
+    def __enter__(self) -> "ImageWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            # let queued work finish but do not write anything more
+            for _, future in self._pending:
+                future.cancel()
+            self._pending.clear()
+        self.close()
@@ -1,10 +1,16 @@
+import functools
 from io import BytesIO
+from typing import Optional
 
 import PIL.Image
 from PIL.Image import Image
 
 from ..decorators import validate_format
 from ..logger import logged
+from .executor import Executor, get_executor
+
+# modes with an alpha channel; other images are transparent through info["transparency"]
+_ALPHA_MODES = {"LA", "La", "PA", "RGBA", "RGBa"}
 
 
 class ImageManipulator:
@@ -39,53 +45,107 @@ class ImageManipulator:
     ) -> Image:
         """convert image mode.
 
+        Images already in 'mode' are returned as they are, without a copy.
+
         Args:
             image (Image): image to convert
-            mode (str): (RGB, RGBA),
+            mode (str): (L, RGB, RGBA),
             fill_color (tuple[int, int, int]): color to fill transparent areas. Defaults to (255,255,255).
 
         Returns:
-            Image: new image with mode (mode).
+            Image: image with mode (mode).
         """
-        cnvrtd_img = PIL.Image.new(mode, image.size, fill_color)
+        if image.mode == mode:
+            return image
+        if "A" in mode or not (image.mode in _ALPHA_MODES or "transparency" in image.info):
+            cnvrtd_img = image.convert(mode)
+        else:
+            # flatten transparent areas onto 'fill_color'
+            alpha = image if image.mode in ("RGBA", "LA") else image.convert("RGBA")
+            cnvrtd_img = PIL.Image.new(mode, image.size, ImageManipulator.mode_color(fill_color, mode))
+            cnvrtd_img.paste(alpha, mask=alpha.getchannel("A"))
         if hasattr(image, "filename"):
             cnvrtd_img.filename = image.filename
-        mask = None
-        if mode.upper() == "RGB":
-            # TODOO: replace with getchannel
-            channels = image.split()
-            mask = channels[3] if len(channels) > 3 else mask
-        cnvrtd_img.paste(image, mask=mask)
         return cnvrtd_img
 
+    @staticmethod
+    def mode_color(color: tuple, mode: str):
+        """'color', an RGB or RGBA tuple, as a pixel value of an image in 'mode'."""
+        return PIL.Image.new("RGBA" if len(color) > 3 else "RGB", (1, 1), tuple(color)).convert(mode).getpixel((0, 0))
+
     @classmethod
     @logged(inclass=True)
-    def resize_all_width(cls, images: list[Image], value=None):
+    def resize_all_width(
+        cls,
+        images: list[Image],
+        value=None,
+        executor: Optional[Executor] = None,
+        reducing_gap: Optional[float] = None,
+    ):
+        """resize images to width 'value', or to the smallest width among them.
+
+        Images already at that width are returned as they are. The others
+        are resized in parallel on threads of 'executor', Pillow releasing the
+        GIL while resampling. See ImageManipulator.resize for 'reducing_gap'.
+        """
         if value is None:
-            return cls._resize_all_width_auto(images)
+            return cls._resize_all_width_auto(images, executor=executor, reducing_gap=reducing_gap)
         else:
-            return cls._resize_all_width_fixed(images, value)
+            return cls._resize_all_width_fixed(images, value, executor=executor, reducing_gap=reducing_gap)
 
     @classmethod
     @logged(inclass=True)
-    def _resize_all_width_fixed(cls, images: list[Image], value: int) -> list[Image]:
-        resized_imgs = []
-        for image in images:
-            resized_img = cls.resize(image, width=value)
-            resized_imgs.append(resized_img)
-
-        return resized_imgs
+    def _resize_all_width_fixed(
+        cls,
+        images: list[Image],
+        value: int,
+        executor: Optional[Executor] = None,
+        reducing_gap: Optional[float] = None,
+    ) -> list[Image]:
+        if all(img.width == value for img in images):
+            return list(images)
+        executor = (executor or get_executor()).local()
+        return executor.map(functools.partial(cls.resize, width=value, reducing_gap=reducing_gap), images)
 
     @classmethod
     @logged(inclass=True)
-    def _resize_all_width_auto(cls, images: list[Image]) -> list[Image]:
+    def _resize_all_width_auto(
+        cls,
+        images: list[Image],
+        executor: Optional[Executor] = None,
+        reducing_gap: Optional[float] = None,
+    ) -> list[Image]:
         widths, heights = zip(*(img.size for img in images))
         new_width = min(widths)
-        return cls._resize_all_width_fixed(images, value=new_width)
+        return cls._resize_all_width_fixed(images, value=new_width, executor=executor, reducing_gap=reducing_gap)
+
+    @staticmethod
+    def scaled_size(size: tuple[int, int], width=None, height=None) -> tuple[int, int]:
+        """size of an image of 'size' resized by ImageManipulator.resize, keeping its ratio."""
+        img_ratio = float(size[1] / size[0])
+        if width is None:
+            width = int(img_ratio * height)
+        elif height is None:
+            height = int(img_ratio * width)
+        return width, height
 
     @classmethod
     @logged(inclass=True)
-    def resize(cls, img, width=None, height=None, respect_ratio=True):
+    def resize(cls, img, width=None, height=None, respect_ratio=True, reducing_gap: Optional[float] = None):
+        """resize 'img' with LANCZOS, keeping its ratio if 'respect_ratio'.
+
+        Images already at the requested size are returned as they are.
+
+        Args:
+            reducing_gap (float, optional): downscale by an integer factor
+                first, so the final LANCZOS pass works on at most
+                'reducing_gap' times the target size: lazily opened JPEGs
+                are decoded at a reduced scale (see Image.draft), others are
+                shrunk with Image.reduce. Much faster for large downscales;
+                the larger the gap, the closer to a plain resize. A JPEG
+                decoded at a reduced scale is so for good, 'img' included.
+                Defaults to None, a plain LANCZOS resize.
+        """
         if width is None and height is None:
             raise RuntimeError("at least one of (width, height) should not be None")
         if (width is None or height is None) and not respect_ratio:
@@ -93,15 +153,12 @@ class ImageManipulator:
                 "both width and height should not be provided when respect_ratio is False."
             )
 
-        img_ratio = float(img.height / img.width)
-        if width is None:
-            if img.height == height:
-                return img
-            width = int(img_ratio * height)
-        elif height is None:
-            if img.width == width:
-                return img
-            height = int(img_ratio * width)
+        if (width is None and img.height == height) or (height is None and img.width == width):
+            return img
+        width, height = cls.scaled_size(img.size, width=width, height=height)
         if height > 0 and width > 0:
-            img = img.resize((width, height), PIL.Image.Resampling.LANCZOS)
+            if reducing_gap and img.format == "JPEG" and getattr(img, "tile", None):
+                # let libjpeg decode at 1/2, 1/4 or 1/8 scale, still above the gap
+                img.draft(None, (int(width * reducing_gap), int(height * reducing_gap)))
+            img = img.resize((width, height), PIL.Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
         return img
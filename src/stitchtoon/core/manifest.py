@@ -0,0 +1,135 @@
+"""Per-output manifests used to skip work that is already done.
+
+Every output (a directory of slices or an archive) gets a small JSON file,
+named after const.METADATA_FILENAME, that records a fingerprint of each
+input file, the settings the output was produced with and the files that
+were written. If neither inputs nor settings changed and all outputs are
+still there, the output is up to date and does not need to be rebuilt.
+
+Outputs are assembled in a staging directory next to them (see
+staging_path) and only moved into place once complete. The staging
+directory holds its own manifest, the journal, listing the files finished
+so far, so an interrupted chapter can be resumed slice by slice.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import os.path as osp
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, Optional
+
+from ..const import METADATA_FILENAME, _PathType
+from ..logger import logged
+
+MANIFEST_VERSION = 1
+
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+@logged
+def fingerprint(path: _PathType, content_hash: bool = False) -> dict:
+    """Fingerprint a file by size and modification time, and optionally content.
+
+    Args:
+        path (_PathType): file path.
+        content_hash (bool, optional): include a sha256 of the content; slower,
+            but catches files rewritten with their old mtime. Defaults to False.
+
+    Returns:
+        dict
+    """
+    st = os.stat(path)
+    fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if content_hash:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        fp["sha256"] = digest.hexdigest()
+    return fp
+
+
+@logged
+def fingerprint_all(files: Iterable[_PathType], content_hash: bool = False) -> dict:
+    """Fingerprint files, keyed by file name."""
+    return {osp.basename(f): fingerprint(f, content_hash) for f in files}
+
+
+def manifest_path(out: _PathType, archive: bool = False) -> str:
+    """Where the manifest of output 'out' is stored.
+
+    Inside the output directory, or next to the archive for archive outputs.
+    """
+    if archive:
+        head, tail = osp.split(str(out).rstrip(osp.sep))
+        return osp.join(head, f".{tail}{METADATA_FILENAME}")
+    return osp.join(out, METADATA_FILENAME)
+
+
+def staging_path(out: _PathType) -> str:
+    """Hidden directory next to output 'out' where it is assembled before being committed."""
+    head, tail = osp.split(str(out).rstrip(osp.sep))
+    return osp.join(head, f".{tail}.partial")
+
+
+@dataclass
+class Manifest:
+    inputs: dict
+    settings: dict
+    # paths written, relative to the directory holding the manifest
+    outputs: list = field(default_factory=list)
+    # cut plan the outputs were stitched from, see Slice.to_dict; lets
+    # DetectionMethod.METADATA re-export the chapter without detection
+    slices: list = field(default_factory=list)
+    version: int = MANIFEST_VERSION
+
+    @classmethod
+    @logged(inclass=True)
+    def load(cls, path: _PathType) -> Optional[Manifest]:
+        """Read a manifest, or None if it is missing, unreadable or outdated."""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+            return None
+        try:
+            return cls(**data)
+        except TypeError:
+            return None
+
+    @logged(inclass=True)
+    def save(self, path: _PathType) -> None:
+        """Write the manifest atomically, so a crash never leaves a partial one."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(asdict(self), f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+    def is_up_to_date(self, inputs: dict, settings: dict, path: _PathType) -> bool:
+        """True if this manifest, stored at 'path', describes the same work and its outputs exist."""
+        if not self.matches(inputs, settings):
+            return False
+        base = osp.dirname(path)
+        return bool(self.outputs) and all(
+            osp.exists(osp.join(base, out)) for out in self.outputs
+        )
+
+    def matches(self, inputs: dict, settings: dict) -> bool:
+        """True if this manifest was written for the same inputs and settings.
+
+        Content hashes are only compared when both sides have them.
+        """
+        if settings != self.settings or inputs.keys() != self.inputs.keys():
+            return False
+        for name, fp in inputs.items():
+            old = self.inputs[name]
+            if any(old.get(k) != v for k, v in fp.items() if k != "sha256"):
+                return False
+            if "sha256" in fp and "sha256" in old and fp["sha256"] != old["sha256"]:
+                return False
+        return True
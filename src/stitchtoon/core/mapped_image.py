@@ -0,0 +1,178 @@
+"""Zero-copy access to the rows of uncompressed BMP, TGA and TIFF pages.
+
+These formats store a page as raw rows, which Pillow still copies (and
+reorders, for BGR or bottom-up files) into a fresh buffer when decoding.
+mapped() maps such a file instead and wraps its rows in a MappedImage:
+cropping one copies only the rows of the crop, gray() reads rows straight
+from the mapping, and the OS pages in only the parts of the file that are
+actually read. Any other operation decodes the whole image once, as for a
+regular image.
+"""
+
+import mmap
+import os
+from typing import Optional
+
+import numpy as np
+import PIL.Image
+from PIL.Image import Image
+
+MAPPABLE_FORMATS = {"BMP", "TGA", "TIFF"}
+
+# raw mode: (bytes per pixel, channels in image mode order or None if the same, image mode)
+_RAW_MODES = {
+    "L": (1, None, "L"),
+    "RGB": (3, None, "RGB"),
+    "BGR": (3, (2, 1, 0), "RGB"),
+    "RGBX": (4, (0, 1, 2), "RGB"),
+    "BGRX": (4, (2, 1, 0), "RGB"),
+    "RGBA": (4, None, "RGBA"),
+    "BGRA": (4, (2, 1, 0, 3), "RGBA"),
+}
+
+
+class MappedImage(Image):
+    """Image whose pixels are rows of a memory-mapped file, read on demand.
+
+    Built by mapped(). It stays undecoded until an operation other than
+    crop() needs its pixels; see decode(). Like Pillow's own lazily loaded
+    images, it sets _mode and _size, which need Pillow 11 or later.
+    """
+
+    # unpickled decoded images skip __init__
+    _mapped = False
+
+    def __init__(self, rows: np.ndarray, channels: Optional[tuple], mode: str):
+        super().__init__()
+        self._rows = rows
+        self._channels = channels
+        self._mode = mode
+        self._size = (rows.shape[1], rows.shape[0])
+        self._mapped = True
+
+    @property
+    def is_mapped(self) -> bool:
+        """True until the image is decoded."""
+        return self._mapped
+
+    def pixels(self, top: int = 0, bottom: Optional[int] = None) -> np.ndarray:
+        """rows 'top' to 'bottom' as an array of shape (rows, width[, channels]).
+
+        A read-only view of the file if its channels are stored in image
+        mode order, else a copy of those rows only.
+        """
+        return self._in_mode_order(self._rows[top:bottom])
+
+    def gray(self, step: int = 1) -> np.ndarray:
+        """grayscale uint8 array of the image resized to 1/'step' of its size.
+
+        Matches convert("L"), after a NEAREST resize for steps above 1.
+        """
+        rows = self._rows
+        if step > 1:
+            ys = _nearest(self.height, self.height // step)
+            xs = _nearest(self.width, self.width // step)
+            rows = rows[ys][:, xs]
+        if self.mode == "L":
+            return rows[..., 0]
+        # same fixed-point weights as Pillow's RGB to L conversion
+        r, g, b = (rows[..., c].astype(np.uint32) for c in (self._channels or (0, 1, 2))[:3])
+        return ((r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16).astype(np.uint8)
+
+    def _in_mode_order(self, rows: np.ndarray) -> np.ndarray:
+        if self._channels is not None:
+            rows = rows[..., list(self._channels)]
+        return rows[..., 0] if self.mode == "L" else rows
+
+    def crop(self, box=None) -> Image:
+        if self.is_mapped and box is not None:
+            left, upper, right, lower = map(int, map(round, box))
+            if 0 <= left <= right <= self.width and 0 <= upper <= lower <= self.height:
+                pixels = self.pixels(upper, lower)[:, left:right]
+                img = PIL.Image.fromarray(np.ascontiguousarray(pixels))
+                img.info = dict(self.info)
+                return img
+        return super().crop(box)
+
+    def load(self):
+        if self.is_mapped:
+            self.im = PIL.Image.fromarray(np.ascontiguousarray(self.pixels())).im
+            self._mapped = False
+        return super().load()
+
+    def __reduce_ex__(self, protocol):
+        if self.is_mapped and getattr(self, "filename", None):
+            # map the file again instead of pickling its pixels
+            return _remap, (self.filename,)
+        return super().__reduce_ex__(protocol)
+
+
+def _nearest(size: int, new_size: int) -> np.ndarray:
+    """source indices a NEAREST resize from 'size' to 'new_size' samples.
+
+    Pillow walks pixel centers by repeatedly adding the scale, rounding
+    errors included, so the same running sum is used here.
+    """
+    scale = size / new_size
+    steps = np.full(new_size, scale)
+    steps[0] = scale * 0.5
+    return np.cumsum(steps).astype(np.intp)
+
+
+def _remap(path: str) -> Image:
+    with PIL.Image.open(path) as img:
+        return mapped(img)
+
+
+def mapped(img: Image) -> Image:
+    """MappedImage over the file of the lazily opened 'img', or 'img' itself.
+
+    Only uncompressed files in MAPPABLE_FORMATS whose rows are stored
+    contiguously in one of the supported raw modes can be mapped.
+    """
+    if img.format not in MAPPABLE_FORMATS or not getattr(img, "filename", None):
+        return img
+    tile = getattr(img, "tile", None)
+    if not tile or len(tile) != 1:
+        return img
+    codec, extents, offset, args = tile[0]
+    if codec != "raw" or tuple(extents) != (0, 0) + img.size:
+        return img
+    rawmode, stride, orientation = args if isinstance(args, tuple) else (args, 0, 1)
+    if rawmode not in _RAW_MODES or orientation not in (1, -1):
+        return img
+    bpp, channels, mode = _RAW_MODES[rawmode]
+    if mode != img.mode:
+        return img
+
+    width, height = img.size
+    stride = stride or width * bpp
+    if not width or not height or stride < width * bpp:
+        return img
+    try:
+        with open(img.filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size < offset + stride * height:
+                return img
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return img
+
+    rows = np.ndarray(
+        (height, width, bpp), np.uint8, buffer=buffer, offset=offset, strides=(stride, bpp, 1)
+    )
+    if orientation == -1:
+        # stored bottom-up
+        rows = rows[::-1]
+    image = MappedImage(rows, channels, mode)
+    image.format = img.format
+    image.info = dict(img.info)
+    image.filename = img.filename
+    img.close()
+    return image
+
+
+def decode(image: Image) -> Image:
+    """decode 'image' in place and return it; a MappedImage is left mapped."""
+    if not isinstance(image, MappedImage):
+        image.load()
+    return image
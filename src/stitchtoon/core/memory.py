@@ -0,0 +1,187 @@
+"""Estimate the memory a chapter needs before decoding it.
+
+Image headers give every page's size and mode, which is enough to tell how
+much a chapter occupies once decoded, resized, stitched and converted for
+saving. The CLI uses these estimates to keep the chapters and pages in
+flight within a --max-memory budget.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from ..logger import logged
+from .stitcher import Stitcher
+
+# Pillow stores these modes with fewer than four bytes per pixel
+_MODE_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16B": 2, "I;16L": 2}
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+# Share of the available memory used by --max-memory=auto
+AUTO_BUDGET_FRACTION = 0.8
+
+# Limits of the number of pages decoded ahead in streaming mode
+MIN_PREFETCH = 1
+MAX_PREFETCH = 16
+
+
+def pixel_bytes(size: tuple[int, int], mode: str) -> int:
+    """Memory Pillow needs for the pixels of an image of 'size' and 'mode'."""
+    width, height = size
+    return width * height * _MODE_BYTES.get(mode, 4)
+
+
+def parse_size(value: str) -> int:
+    """Parse a byte count like '512M', '24G' or '1.5GiB'.
+
+    Raises:
+        ValueError: if 'value' is not a size.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", value, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"invalid size '{value}'")
+    number, unit = match.groups()
+    return int(float(number) * _UNITS[unit.upper()])
+
+
+def _cgroup_memory_free() -> Optional[int]:
+    """Memory left under the current cgroup's limit, or None if unlimited."""
+    for limit_file, usage_file in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    ):
+        try:
+            with open(limit_file) as f:
+                limit = f.read().strip()
+            with open(usage_file) as f:
+                usage = int(f.read())
+        except (OSError, ValueError):
+            continue
+        if limit == "max" or int(limit) >= 1 << 60:
+            return None
+        return max(0, int(limit) - usage)
+    return None
+
+
+@logged
+def available_memory() -> Optional[int]:
+    """Memory this process can still allocate, or None if unknown.
+
+    The smaller of the system's available memory and what is left under
+    the cgroup memory limit, so containers are not overcommitted.
+    """
+    free = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    free = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        pass
+    cgroup = _cgroup_memory_free()
+    if cgroup is not None:
+        free = cgroup if free is None else min(free, cgroup)
+    return free
+
+
+@dataclass(frozen=True)
+class ChapterEstimate:
+    """Peak memory of processing a chapter, in bytes."""
+
+    # pages as decoded, plus any encoded data held in memory
+    native: int
+    # pages once resized to the common width
+    resized: int
+    # largest single page, decoded or resized
+    page: int
+    # one stitched slice
+    slice: int
+    # pages are resized a slice at a time while stitching, see core.scaled_image
+    deferred_resize: bool = False
+
+    @property
+    def batch(self) -> int:
+        """Peak when the whole chapter is held in memory.
+
+        Decoded pages, their resized copies unless resizing is deferred, the
+        stitched slices and their copies converted for saving, each about
+        the size of the chapter.
+        """
+        return self.native + (2 if self.deferred_resize else 3) * self.resized
+
+    def stream(self, prefetch: int, pending: int) -> int:
+        """Peak when streaming with 'prefetch' pages decoded ahead and 'pending' slices being saved."""
+        # the detector's window holds a couple of pages besides the prefetched ones
+        return (prefetch + 2) * self.page + (pending + 1) * self.slice
+
+
+@logged
+def estimate(
+    headers: Iterable[tuple[tuple[int, int], str]],
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    overhead: int = 0,
+    deferred_resize: bool = False,
+) -> ChapterEstimate:
+    """Estimate a chapter's memory needs from its pages' headers.
+
+    Args:
+        headers: (size, mode) of every page, see ImageIO.image_header.
+        width (int, optional): width pages are resized to. Defaults to the smallest page width.
+        height (int, optional): target slice height. Defaults to the tallest resized page.
+        overhead (int, optional): bytes held for the whole run, e.g. an archive read into memory.
+        deferred_resize (bool, optional): pages are resized while stitching,
+            so no resized copy of them is held. Defaults to False.
+    """
+    headers = list(headers)
+    if not headers:
+        return ChapterEstimate(overhead, 0, 0, 0, deferred_resize)
+    width = width or min(w for (w, _), _ in headers)
+
+    native = resized = page = tallest = 0
+    for (w, h), mode in headers:
+        scaled = max(1, round(h * width / w)) if w else 0
+        decoded = pixel_bytes((w, h), mode)
+        native += decoded
+        # resizing keeps the mode of the page
+        scaled_bytes = pixel_bytes((width, scaled), mode)
+        resized += scaled_bytes
+        page = max(page, decoded, scaled_bytes)
+        tallest = max(tallest, scaled)
+
+    # slices are stitched in the smallest mode holding every page
+    mode = Stitcher.stitch_mode(mode for _, mode in headers)
+    slice_bytes = pixel_bytes((width, height or tallest), mode)
+    return ChapterEstimate(native + overhead, resized, page, slice_bytes, deferred_resize)
+
+
+@dataclass(frozen=True)
+class MemoryPlan:
+    """How a chapter is processed under a memory budget."""
+
+    stream: bool
+    # pages decoded ahead when streaming
+    prefetch: int
+    # memory set aside for the chapter while it runs
+    reserved: int
+
+
+@logged
+def plan(chapter: ChapterEstimate, budget: int, stream=False, pending=2) -> MemoryPlan:
+    """Fit a chapter into 'budget' bytes.
+
+    Chapters that fit are processed in batch unless 'stream' is set; bigger
+    ones are streamed with as many pages decoded ahead as the budget allows,
+    between MIN_PREFETCH and MAX_PREFETCH, unless streaming would need even
+    more (a short chapter with a huge page). A chapter that does not fit
+    either way is still planned; the caller should run it on its own.
+    """
+    if not stream and chapter.batch <= max(budget, chapter.stream(MIN_PREFETCH, pending)):
+        return MemoryPlan(False, MIN_PREFETCH, chapter.batch)
+
+    spare = budget - chapter.stream(0, pending)
+    prefetch = spare // chapter.page if chapter.page else MAX_PREFETCH
+    prefetch = min(MAX_PREFETCH, max(MIN_PREFETCH, prefetch))
+    return MemoryPlan(True, prefetch, chapter.stream(prefetch, pending))
@@ -0,0 +1,101 @@
+"""Plan a chapter's output from image headers alone.
+
+Direct slicing only needs page sizes, and stored cut plans only need to be
+checked against them, so the slices, the files they become and any format
+size limit they break can all be worked out without decoding a pixel.
+"""
+
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from ..const import FORMAT_SIZE_MAPPER, FORMATS_LIMITS, _PathType
+from ..logger import logged
+from .image_io import ImageHeader, ImageIO
+from .image_manipulator import ImageManipulator
+from .slices_detectors.direct_detect import direct_detect
+from .slices_detectors.metadata_detect import metadata_detect
+from .slices_detectors.slice import Slice
+from .slices_detectors.slices_detector import DetectionMethod
+
+# Methods that can plan from headers
+HEADER_METHODS = {DetectionMethod.DIRECT, DetectionMethod.METADATA}
+
+
+@dataclass
+class SlicePlan:
+    """Slices of a chapter and the files they are saved as."""
+
+    slices: list[Slice]
+    format: str
+    # width pages are resized to
+    width: int
+    violations: list[str] = field(default_factory=list)
+
+    @property
+    def outputs(self) -> list[tuple[str, tuple[int, int]]]:
+        """(file name, size) of every output, named like ImageIO.save_all names them."""
+        return [
+            (ImageIO.filename_format_handler(f"{idx:03}", self.format), s.size)
+            for idx, s in enumerate(self.slices, 1)
+        ]
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form, readable by DetectionMethod.METADATA."""
+        return {
+            "format": self.format,
+            "width": self.width,
+            "slices": [s.to_dict() for s in self.slices],
+            "outputs": [{"name": name, "size": list(size)} for name, size in self.outputs],
+            "violations": self.violations,
+        }
+
+
+@logged
+def plan_slices(
+    headers: Iterable[ImageHeader],
+    format: str,
+    method: DetectionMethod = DetectionMethod.DIRECT,
+    height: Optional[int] = None,
+    width: Optional[int] = None,
+    path: Optional[_PathType] = None,
+) -> SlicePlan:
+    """plan slices from page headers.
+
+    Args:
+        headers (Iterable[ImageHeader]): page headers, see ImageIO.image_header.
+        format (str): output format, checked against stitchtoon.const.FORMATS_LIMITS.
+        method (DetectionMethod): DIRECT or METADATA, see HEADER_METHODS.
+        height (int, optional): slice height for the direct method.
+        width (int, optional): width pages are resized to. Defaults to the smallest page width.
+        path (_PathType, optional): cut plan for the metadata method.
+
+    Returns:
+        SlicePlan
+
+    Raises:
+        ValueError: if 'method' needs decoded pixels, or the cut plan does not fit the pages.
+    """
+    headers = list(headers)
+    width = width or min(h.width for h in headers)
+    scaled = [
+        h if h.width == width else ImageHeader(ImageManipulator.scaled_size(h.size, width=width), h.mode)
+        for h in headers
+    ]
+
+    method = DetectionMethod(method)
+    if method == DetectionMethod.DIRECT:
+        slices = direct_detect(scaled, height=height)
+    elif method == DetectionMethod.METADATA:
+        slices = metadata_detect(scaled, path)
+    else:
+        raise ValueError(f"{method} detection needs decoded pixels and cannot be planned")
+
+    plan = SlicePlan(slices=slices, format=format, width=width)
+    limit = FORMATS_LIMITS.get(format)
+    for name, (w, h) in plan.outputs:
+        if limit is not None and max(w, h) > limit:
+            msg = f"{name}: {w}x{h} exceeds the {limit} px limit of {format}"
+            if format in FORMAT_SIZE_MAPPER:
+                msg += f", use {FORMAT_SIZE_MAPPER[format]}"
+            plan.violations.append(msg)
+    return plan
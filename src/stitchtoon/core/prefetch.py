@@ -0,0 +1,75 @@
+"""Read input files ahead of their decoders.
+
+On high-latency storage (NFS, SMB, ...) many workers opening files and
+issuing the small, scattered reads of an image decoder each wait for a
+round trip per read. A PrefetchReader reads the files instead, in order,
+whole and in large sequential chunks, on a few threads of its own, up to
+'depth' files ahead of the consumer. Decoders are then handed bytes that
+are already in memory, see ImageIO.load_image.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+from ..const import _PathType
+
+# large enough for a few round trips per page on network file systems
+DEFAULT_CHUNK_SIZE = 8 << 20
+
+
+def read_file(path: _PathType, chunk_size: int = DEFAULT_CHUNK_SIZE) -> bytes:
+    """content of file 'path', read sequentially in chunks of 'chunk_size' bytes."""
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            # let the kernel (or the NFS client) read ahead aggressively
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        chunks = []
+        while chunk := f.read(chunk_size):
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class PrefetchReader:
+    """Read files in order, up to 'depth' files ahead of the consumer.
+
+    Args:
+        depth (int): files read ahead. Defaults to 4.
+        workers (int): files read concurrently. Defaults to 2.
+        chunk_size (int): size of a single read. Defaults to DEFAULT_CHUNK_SIZE.
+    """
+
+    def __init__(self, depth: int = 4, workers: int = 2, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if depth < 1 or workers < 1 or chunk_size < 1:
+            raise ValueError("depth, workers and chunk_size must be >= 1")
+        self.depth = depth
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def iter_read(self, files: Iterable[_PathType]) -> Iterator[tuple[_PathType, bytes]]:
+        """read 'files'.
+
+        Yields:
+            tuple[_PathType, bytes]: (file, content), in the order of 'files'.
+
+        Raises:
+            OSError: if a file cannot be read, once the consumer gets to it.
+        """
+        files = iter(files)
+        pending: deque[tuple[_PathType, Future]] = deque()
+        with ThreadPoolExecutor(min(self.workers, self.depth), "prefetch") as pool:
+            try:
+                while True:
+                    for path in files:
+                        pending.append((path, pool.submit(read_file, path, self.chunk_size)))
+                        if len(pending) >= self.depth:
+                            break
+                    if not pending:
+                        return
+                    path, future = pending.popleft()
+                    yield path, future.result()
+            finally:
+                # the consumer stopped early or a read failed: drop what is left
+                for _, future in pending:
+                    future.cancel()
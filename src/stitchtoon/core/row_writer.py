@@ -0,0 +1,307 @@
+"""Encode images band by band, without holding them whole.
+
+A RowWriter is created with the size and mode of the image to write and is
+then handed its rows in order, a band of full-width rows at a time. Only
+the band being encoded is in memory, so outputs far taller than the memory
+a full canvas would need (a whole chapter as one strip, say) can be
+written. PNG, TIFF and BMP, whose pixel data is a plain sequence of rows,
+are supported; see ROW_WRITERS.
+"""
+
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Optional
+
+import numpy as np
+from PIL.Image import Image
+
+from ..exc import ImageTooLargeError
+
+# outputs of at least this many pixels are worth writing row by row: their
+# canvas alone would take 128 MiB in RGBA
+STREAM_MIN_PIXELS = 1 << 25
+
+
+def writes_by_rows(format: str, size: tuple[int, int]) -> bool:
+    """True if an output of 'size' saved as 'format' is best written row by row."""
+    return format in ROW_WRITERS and size[0] * size[1] >= STREAM_MIN_PIXELS
+
+
+class RowWriter(ABC):
+    """Write an image of 'size' and 'mode' to 'fp', a band of rows at a time.
+
+    Use it as a context manager, or call close() once every row is written.
+
+    Args:
+        fp (BinaryIO): binary file to write to; TIFF needs it seekable.
+        size (tuple[int, int]): image size.
+        mode (str): image mode, one of the writer's MODES.
+    """
+
+    MODES: set[str] = set()
+
+    def __init__(self, fp: BinaryIO, size: tuple[int, int], mode: str):
+        if mode not in self.MODES:
+            raise ValueError(f"cannot write mode {mode} as {type(self).__name__}")
+        self.fp = fp
+        self.size = size
+        self.mode = mode
+        self.rows = 0
+
+    def write(self, band: Image) -> None:
+        """write the next rows, a full-width image in the writer's mode."""
+        if band.size[0] != self.size[0] or band.mode != self.mode:
+            raise ValueError(f"expected {self.mode} rows {self.size[0]} px wide")
+        if self.rows + band.height > self.size[1]:
+            raise ValueError("more rows than the image height")
+        if band.height:
+            # np.asarray would copy the bytes Pillow hands out once more
+            self._write(np.frombuffer(band.tobytes(), np.uint8).reshape(band.height, -1))
+            self.rows += band.height
+
+    def close(self) -> None:
+        """finish the file. Every row must have been written."""
+        if self.rows != self.size[1]:
+            raise ValueError(f"{self.rows} of {self.size[1]} rows written")
+        self._close()
+
+    @abstractmethod
+    def _write(self, rows: np.ndarray) -> None:
+        """encode 'rows', one flattened row of pixels per element."""
+
+    def _close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _paeth(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    a, b, c = (x.astype(np.int16) for x in (a, b, c))
+    pa, pb, pc = np.abs(b - c), np.abs(a - c), np.abs(a + b - 2 * c)
+    return np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c)).astype(np.uint8)
+
+
+def _filter_cost(filtered: np.ndarray) -> np.ndarray:
+    # sum of the bytes of each row taken as signed, as in libpng: -v wraps to 256 - v
+    return np.minimum(filtered, -filtered).sum(axis=1, dtype=np.uint64)
+
+
+class PngRowWriter(RowWriter):
+    """PNG writer. Rows are filtered per row like libpng's adaptive filtering:
+    the filter giving the smallest sum of absolute differences wins.
+
+    Args:
+        compress_level (int): zlib level, 0-9. Defaults to 6, like Pillow.
+    """
+
+    MODES = {"L": 0, "LA": 4, "RGB": 2, "RGBA": 6}
+
+    # IDAT chunks are flushed once this much compressed data is pending
+    CHUNK_SIZE = 1 << 20
+
+    # rows are filtered this many bytes at a time, so the candidate filters
+    # of a band take a small fraction of the band itself
+    FILTER_BYTES = 1 << 18
+
+    def __init__(self, fp: BinaryIO, size: tuple[int, int], mode: str, compress_level: int = 6):
+        super().__init__(fp, size, mode)
+        self._bpp = len(mode)
+        self._prev: Optional[np.ndarray] = None
+        self._zlib = zlib.compressobj(compress_level)
+        self._pending = b""
+        header = struct.pack(">IIBBBBB", *size, 8, self.MODES[mode], 0, 0, 0)
+        fp.write(b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header))
+
+    def _write(self, rows: np.ndarray) -> None:
+        step = max(1, self.FILTER_BYTES // rows.shape[1])
+        for top in range(0, len(rows), step):
+            self._filter(rows[top:top + step])
+
+    def _filter(self, raw: np.ndarray) -> None:
+        # uint8 arithmetic wraps modulo 256, as PNG filters do
+        prev = np.zeros_like(raw[:1]) if self._prev is None else self._prev
+        up = np.concatenate([prev, raw[:-1]])
+        left = np.zeros_like(raw)
+        left[:, self._bpp:] = raw[:, :-self._bpp]
+        upleft = np.zeros_like(raw)
+        upleft[:, self._bpp:] = up[:, :-self._bpp]
+
+        lines = np.empty((len(raw), raw.shape[1] + 1), np.uint8)
+        lines[:, 0] = 0
+        lines[:, 1:] = raw
+        best = _filter_cost(raw)
+        candidates = (
+            lambda: raw - left,
+            lambda: raw - up,
+            # floor((left + up) / 2) without overflowing
+            lambda: raw - ((left >> 1) + (up >> 1) + (left & up & 1)),
+            lambda: raw - _paeth(left, up, upleft),
+        )
+        # the filter giving the smallest cost wins, the first one on ties
+        for kind, candidate in enumerate(candidates, 1):
+            filtered = candidate()
+            cost = _filter_cost(filtered)
+            better = cost < best
+            lines[better, 0] = kind
+            lines[better, 1:] = filtered[better]
+            best = np.minimum(best, cost)
+        self._prev = raw[-1:].copy()
+        self._idat(self._zlib.compress(lines.tobytes()))
+
+    def _idat(self, data: bytes, flush=False) -> None:
+        self._pending += data
+        if self._pending and (flush or len(self._pending) >= self.CHUNK_SIZE):
+            self.fp.write(_png_chunk(b"IDAT", self._pending))
+            self._pending = b""
+
+    def _close(self) -> None:
+        self._idat(self._zlib.flush(), flush=True)
+        self.fp.write(_png_chunk(b"IEND", b""))
+
+
+class TiffRowWriter(RowWriter):
+    """Uncompressed TIFF writer, one strip per band written."""
+
+    MODES = {"L": 1, "RGB": 3, "RGBA": 4}
+
+    def __init__(self, fp: BinaryIO, size: tuple[int, int], mode: str):
+        super().__init__(fp, size, mode)
+        if size[0] * size[1] * self.MODES[mode] >= 1 << 32:
+            # classic TIFF offsets are 32 bits
+            raise ImageTooLargeError(f"{size[0]}x{size[1]} is too large for a TIFF file")
+        self._start = fp.tell()
+        self._strips: list[tuple[int, int]] = []
+        self._rows_per_strip = 0
+        # little endian; the offset of the directory is filled in by close()
+        fp.write(b"II*\x00\x00\x00\x00\x00")
+
+    def _write(self, rows: np.ndarray) -> None:
+        # strips must all be RowsPerStrip rows, except the last one
+        if self._rows_per_strip and (self.rows % self._rows_per_strip or len(rows) > self._rows_per_strip):
+            raise ValueError("TIFF bands must all have the same height, except the last")
+        self._rows_per_strip = self._rows_per_strip or len(rows)
+        data = rows.tobytes()
+        self._strips.append((self.fp.tell() - self._start, len(data)))
+        self.fp.write(data)
+
+    def _close(self) -> None:
+        width, height = self.size
+        samples = self.MODES[self.mode]
+        offsets, counts = zip(*self._strips)
+        extra = b""
+
+        def array(fmt: str, values) -> tuple[int, int]:
+            # (count, offset) of values stored after the pixel data
+            nonlocal extra
+            if len(values) * struct.calcsize(fmt) <= 4:
+                return len(values), int.from_bytes(
+                    struct.pack(f"<{len(values)}{fmt}", *values).ljust(4, b"\0"), "little"
+                )
+            offset = base + len(extra)
+            extra += struct.pack(f"<{len(values)}{fmt}", *values)
+            if len(extra) % 2:
+                extra += b"\0"
+            return len(values), offset
+
+        base = self.fp.tell() - self._start
+        if base % 2:
+            self.fp.write(b"\0")
+            base += 1
+        bits = array("H", [8] * samples)
+        strip_offsets = array("I", offsets)
+        strip_counts = array("I", counts)
+        # tag, type (3 SHORT, 4 LONG), (count, value or offset)
+        tags = [
+            (256, 4, (1, width)),
+            (257, 4, (1, height)),
+            (258, 3, bits),
+            (259, 3, (1, 1)),
+            (262, 3, (1, 1 if self.mode == "L" else 2)),
+            (273, 4, strip_offsets),
+            (277, 3, (1, samples)),
+            (278, 4, (1, self._rows_per_strip or height)),
+            (279, 4, strip_counts),
+            (284, 3, (1, 1)),
+        ]
+        if self.mode == "RGBA":
+            # unassociated alpha
+            tags.append((338, 3, (1, 2)))
+        ifd = struct.pack("<H", len(tags))
+        for tag, kind, (count, value) in tags:
+            ifd += struct.pack("<HHII", tag, kind, count, value)
+        ifd += b"\0\0\0\0"
+        self.fp.write(extra + ifd)
+        end = self.fp.tell()
+        self.fp.seek(self._start + 4)
+        self.fp.write(struct.pack("<I", base + len(extra)))
+        self.fp.seek(end)
+
+
+class BmpRowWriter(RowWriter):
+    """BMP writer, storing rows top-down."""
+
+    MODES = {"L": 8, "RGB": 24, "RGBA": 32}
+
+    def __init__(self, fp: BinaryIO, size: tuple[int, int], mode: str):
+        super().__init__(fp, size, mode)
+        width, height = size
+        bits = self.MODES[mode]
+        self._stride = (width * bits // 8 + 3) & ~3
+        palette = bytes(b for i in range(256) for b in (i, i, i, 0)) if mode == "L" else b""
+        offset = 14 + 40 + len(palette)
+        file_size = offset + self._stride * height
+        if file_size >= 1 << 32:
+            raise ImageTooLargeError(f"{width}x{height} is too large for a BMP file")
+        fp.write(b"BM" + struct.pack("<IHHI", file_size, 0, 0, offset))
+        # negative height: the first row is the top one
+        fp.write(struct.pack(
+            "<IiiHHIIiiII", 40, width, -height, 1, bits, 0, self._stride * height,
+            2835, 2835, 256 if palette else 0, 0,
+        ))
+        fp.write(palette)
+
+    def _write(self, rows: np.ndarray) -> None:
+        width = self.size[0]
+        channels = len(self.mode)
+        if channels > 1:
+            # BGR(A) order
+            pixels = rows.reshape(len(rows), width, channels)
+            order = [2, 1, 0, 3][:channels]
+            rows = pixels[:, :, order].reshape(len(rows), -1)
+        padded = np.zeros((len(rows), self._stride), np.uint8)
+        padded[:, :rows.shape[1]] = rows
+        self.fp.write(padded.tobytes())
+
+
+ROW_WRITERS = {
+    "png": PngRowWriter,
+    "tiff": TiffRowWriter,
+    "bmp": BmpRowWriter,
+}
+
+
+def open_row_writer(fp: BinaryIO, size: tuple[int, int], mode: str, format: str, **params) -> RowWriter:
+    """RowWriter for 'format', see ROW_WRITERS.
+
+    Args:
+        params: writer options, e.g. compress_level for PNG. Others are ignored.
+
+    Raises:
+        ValueError: if 'format' cannot be written row by row.
+    """
+    if format not in ROW_WRITERS:
+        raise ValueError(f"{format} cannot be written row by row")
+    writer = ROW_WRITERS[format]
+    if writer is PngRowWriter and "compress_level" in params:
+        return writer(fp, size, mode, compress_level=params["compress_level"])
+    return writer(fp, size, mode)
@@ -0,0 +1,126 @@
+"""Pages resized on demand, a crop at a time.
+
+Resizing every page to the common width up front resamples whole pages and
+keeps a resized copy of the chapter, even though only the stitched outputs
+need that width. scaled() wraps a page in a ScaledImage instead: it has the
+size of the resized page, but cropping it resamples only the rows of the
+crop from the page, and the slice detectors read the page's own rows, see
+pixel_detect. Any other operation resizes the whole page once, as
+ImageManipulator.resize would.
+"""
+
+from typing import Optional
+
+import numpy as np
+import PIL.Image
+from PIL.Image import Image
+
+from .image_manipulator import ImageManipulator
+
+# half the width of the main lobe of the LANCZOS kernel, in pixels of the
+# smaller image; the weights of its other lobes are small
+_LANCZOS_LOBE = 1
+
+
+class ScaledImage(Image):
+    """Image 'source' resized to 'size', resampled a crop at a time.
+
+    Built by scaled(). A crop matches the crop of the whole resized page
+    within rounding (one level at most), as Pillow resamples a box of the
+    source with the kernel of the whole image. Like MappedImage, it sets
+    _mode and _size, which need Pillow 11 or later.
+    """
+
+    # unpickled resized images skip __init__
+    _scaled = False
+
+    def __init__(self, source: Image, size: tuple[int, int], reducing_gap: Optional[float] = None):
+        super().__init__()
+        self.source = source
+        self.reducing_gap = reducing_gap
+        self._mode = source.mode
+        self._size = size
+        self.info = dict(source.info)
+        if hasattr(source, "filename"):
+            self.filename = source.filename
+        self._scaled = True
+
+    @property
+    def is_scaled(self) -> bool:
+        """True until the whole page is resized."""
+        return self._scaled
+
+    @property
+    def scale(self) -> float:
+        """rows of the image per row of 'source'."""
+        return self.height / self.source.height
+
+    def source_box(self, box: tuple[float, float, float, float]) -> tuple[float, float, float, float]:
+        """'box' of the image in 'source' coordinates."""
+        left, upper, right, lower = box
+        x, y = self.source.width / self.width, self.source.height / self.height
+        # rounding must not push the edges past the source
+        return (left * x, upper * y, min(right * x, self.source.width), min(lower * y, self.source.height))
+
+    def crop(self, box=None) -> Image:
+        if self.is_scaled and box is not None:
+            left, upper, right, lower = map(int, map(round, box))
+            if 0 <= left < right <= self.width and 0 <= upper < lower <= self.height:
+                img = self.source.resize(
+                    (right - left, lower - upper),
+                    PIL.Image.Resampling.LANCZOS,
+                    box=self.source_box((left, upper, right, lower)),
+                    reducing_gap=self.reducing_gap,
+                )
+                img.info = dict(self.info)
+                return img
+        return super().crop(box)
+
+    def load(self):
+        if self.is_scaled:
+            self.im = self.crop((0, 0) + self.size).im
+            self._scaled = False
+        return super().load()
+
+
+def scaled(img: Image, width: int, reducing_gap: Optional[float] = None) -> Image:
+    """'img' resized to 'width' on demand, keeping its ratio, see ScaledImage.
+
+    Images already 'width' wide are returned as they are.
+
+    Args:
+        reducing_gap (float, optional): see Image.resize. Lazily opened JPEGs
+            are not draft-decoded, unlike with ImageManipulator.resize.
+    """
+    if img.width == width:
+        return img
+    size = ImageManipulator.scaled_size(img.size, width=width)
+    if size[0] <= 0 or size[1] <= 0:
+        return img
+    return ScaledImage(img, size, reducing_gap)
+
+
+def scale_rows(valid: np.ndarray, scale: float, rows: int, step: int = 1) -> np.ndarray:
+    """rows of a resized image that only sample rows of the original flagged in 'valid'.
+
+    A row of the resized image is a weighted sum of the rows of the
+    original under the LANCZOS kernel centered on it, so it is flagged if
+    all of the rows under the main lobe of the kernel are; the other lobes
+    weigh little. Rows that only become uniform once resized, faint noise
+    averaging out, may be missed.
+
+    Args:
+        valid (np.ndarray): bool, one per row of the original, or per 'step' rows.
+        scale (float): rows of the resized image per row of the original.
+        rows (int): length of the result.
+        step (int): rows of both images per element of 'valid' and the result.
+
+    Returns:
+        np.ndarray: bool, one per 'step' rows of the resized image.
+    """
+    radius = _LANCZOS_LOBE * max(1.0, 1 / scale)
+    centers = (np.arange(rows) * step + 0.5) / scale
+    lo = np.clip(np.floor((centers - radius) / step).astype(np.intp), 0, len(valid))
+    hi = np.clip(np.floor((centers + radius) / step).astype(np.intp) + 1, 0, len(valid))
+    invalid = np.concatenate([[0], np.cumsum(~valid, dtype=np.intp)])
+    return (hi > lo) & (invalid[hi] == invalid[lo])
@@ -0,0 +1,136 @@
+"""Hand decoded images between processes through shared memory.
+
+Pickling a PIL image copies all of its pixels into the pipe and back out of
+it on the other side. Instead, share() copies the pixels once into a file on
+a memory-backed filesystem (/dev/shm where available), a band of rows at a
+time, and returns a small SharedImage reference; unshare() maps that file
+and wraps the mapping as an image without copying it. The file is unlinked as soon as it is mapped, so
+the memory is released with the image that uses it.
+
+Only L, RGB, RGBA and CMYK images are shared; other images are passed
+through unchanged and end up pickled as before. Image.frombuffer maps all of
+those but RGB, which Pillow stores padded to four bytes per pixel: RGB pages
+are not zero-copy, they are copied once out of the mapping instead. That is
+still far cheaper than pickling them, and unlike an RGBX mapping the result
+can be saved in every format.
+"""
+
+import mmap
+import os
+import os.path as osp
+import tempfile
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+import PIL.Image
+from PIL.Image import Image
+
+from .mapped_image import MappedImage
+
+SHM_DIR = "/dev/shm" if osp.isdir("/dev/shm") else tempfile.gettempdir()
+
+# Modes stored in shared memory, as their raw bytes
+SHAREABLE_MODES = {"L", "RGB", "RGBA", "CMYK"}
+
+# Modes Image.frombuffer wraps without copying
+_MAPPED_MODES = {"L", "RGBA", "CMYK"}
+
+# Bytes of the bands of rows share() copies at a time
+_BAND_BYTES = 1 << 22
+
+
+@dataclass(frozen=True)
+class SharedImage:
+    """Picklable reference to an image stored in shared memory."""
+
+    path: str
+    mode: str
+    size: tuple[int, int]
+    format: Optional[str] = None
+    info: dict = field(default_factory=dict)
+
+    @property
+    def nbytes(self) -> int:
+        return _nbytes(self.mode, self.size)
+
+
+def _nbytes(mode: str, size: tuple[int, int]) -> int:
+    width, height = size
+    return width * height * len(mode)
+
+
+def share(image: Image) -> Union[SharedImage, Image]:
+    """copy 'image' into shared memory.
+
+    Args:
+        image (Image): image to share.
+
+    Returns:
+        SharedImage if the image mode can be shared, else 'image' itself.
+    """
+    if image.mode not in SHAREABLE_MODES or not image.width or not image.height:
+        return image
+    if isinstance(image, MappedImage) and image.is_mapped:
+        # already shared through its file, and pickled as a reference to it
+        return image
+
+    image.load()
+    nbytes = _nbytes(image.mode, image.size)
+    rows = max(1, _BAND_BYTES * image.height // nbytes)
+    fd, path = tempfile.mkstemp(prefix="stitchtoon-", dir=SHM_DIR)
+    try:
+        os.ftruncate(fd, nbytes)
+        with mmap.mmap(fd, nbytes) as buffer:
+            # a band at a time, so no copy of the whole image is made on the way
+            for top in range(0, image.height, rows):
+                band = image.crop((0, top, image.width, min(top + rows, image.height)))
+                buffer.write(band.tobytes())
+    except BaseException:
+        os.unlink(path)
+        raise
+    finally:
+        os.close(fd)
+
+    return SharedImage(
+        path=path,
+        mode=image.mode,
+        size=image.size,
+        format=image.format,
+        info=dict(image.info),
+    )
+
+
+def unshare(ref: Union[SharedImage, Image]) -> Image:
+    """wrap a SharedImage as an Image without copying its pixels.
+
+    RGB images are the exception: they are copied once out of the mapping
+    into memory of their own, see the module docstring. The returned image is read-only; Pillow copies it on the first in-place
+    modification. Anything that is not a SharedImage is returned unchanged.
+    """
+    if not isinstance(ref, SharedImage):
+        return ref
+
+    fd = os.open(ref.path, os.O_RDWR)
+    try:
+        # copy-on-write: the mapping stays private to this process
+        buffer = mmap.mmap(fd, ref.nbytes, access=mmap.ACCESS_COPY)
+    finally:
+        os.close(fd)
+        os.unlink(ref.path)
+
+    image = PIL.Image.frombuffer(ref.mode, ref.size, buffer, "raw", ref.mode, 0, 1)
+    if ref.mode not in _MAPPED_MODES:
+        # decoded into memory of its own
+        buffer.close()
+    image.format = ref.format
+    image.info = dict(ref.info)
+    return image
+
+
+def discard(ref: Union[SharedImage, Image]) -> None:
+    """release a SharedImage that will never be unshared."""
+    if isinstance(ref, SharedImage):
+        try:
+            os.unlink(ref.path)
+        except FileNotFoundError:
+            pass
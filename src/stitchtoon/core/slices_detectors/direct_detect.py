@@ -1,3 +1,5 @@
+from typing import Iterable, Iterator, Tuple
+
 from PIL.Image import Image
 
 from ...logger import logged
@@ -5,37 +7,57 @@ from .slice import Slice
 
 
 @logged
-def direct_detect(images: list[Image], height: int) -> list[Slice]:
+def direct_detect(images: list[Image], height: int, start: Tuple[int, int] = (0, 0)) -> list[Slice]:
     """detect direct slicing points of images according to height.
 
     Args:
         images (list[Image]): images
         height (int): height
+        start (tuple[int, int]): see iter_direct_detect.
 
     Returns:
         list[Slice]
     """
+    return list(iter_direct_detect(images, height, start))
+
+
+def iter_direct_detect(
+    images: Iterable[Image], height: int, start: Tuple[int, int] = (0, 0)
+) -> Iterator[Slice]:
+    """lazily detect direct slicing points of images according to height.
+
+    Images are consumed in order and every slice is yielded as soon as it is
+    complete, so callers can stitch it before the next image is needed.
+
+    Args:
+        images (Iterable[Image]): images
+        height (int): height
+        start (tuple[int, int]): (image index, row) of a cut to detect from,
+            to resume an interrupted run. 'images' then begins with that image.
+
+    Yields:
+        Slice
+    """
+    first_idx, first_row = start
     cur_height = 0
-    slices = []
-    images_len = len(images)
     sp = Slice()
-    for idx, img in enumerate(images):
-        start = 0
-        cur_height += img.height
+    for idx, img in enumerate(images, first_idx):
+        start = first_row if idx == first_idx else 0
+        cur_height += img.height - start
 
         while cur_height >= height:
             slice_pos = img.height - (cur_height - height)
             sp.add((idx, start, slice_pos))
             sp.width = img.width
-            slices.append(sp)
+            yield sp
             cur_height = img.height - slice_pos
             start = slice_pos
             sp = Slice()
 
-        if cur_height < height:
+        # nothing is left of the image when a cut falls on its bottom edge
+        if 0 < cur_height < height:
             sp.add((idx, start, img.height))
             sp.width = img.width
-            if idx == images_len - 1:
-                slices.append(sp)
 
-    return slices
+    if sp.points:
+        yield sp
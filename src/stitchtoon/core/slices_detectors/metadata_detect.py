@@ -0,0 +1,103 @@
+import json
+from typing import Iterable, Iterator, Tuple
+
+from PIL.Image import Image
+
+from ...const import _PathType
+from ...logger import logged
+from .slice import Slice
+
+
+@logged
+def load_plan(path: _PathType) -> list[Slice]:
+    """load a stored cut plan.
+
+    Any JSON object with a "slices" list is accepted: output manifests, slice
+    cache entries and exported plans all use that layout.
+
+    Raises:
+        FileNotFoundError: if 'path' does not exist.
+        ValueError: if the file holds no cut plan.
+    """
+    with open(path) as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"'{path}' is not a valid cut plan: {e}") from e
+    if not isinstance(data, dict) or not data.get("slices"):
+        raise ValueError(f"'{path}' does not contain a cut plan")
+    return [Slice.from_dict(s) for s in data["slices"]]
+
+
+@logged
+def metadata_detect(images: list[Image], path: _PathType, start: Tuple[int, int] = (0, 0)) -> list[Slice]:
+    """slice images according to a stored cut plan.
+
+    Args:
+        images (list[Image]): images
+        path (_PathType): plan file, see load_plan.
+        start (tuple[int, int]): see replay.
+
+    Returns:
+        list[Slice]
+
+    Raises:
+        ValueError: if the plan does not fit the images.
+    """
+    return list(iter_metadata_detect(images, path, start))
+
+
+def iter_metadata_detect(
+    images: Iterable[Image], path: _PathType, start: Tuple[int, int] = (0, 0)
+) -> Iterator[Slice]:
+    """lazily slice images according to a stored cut plan.
+
+    Images are consumed in step with the plan: a slice is yielded once every
+    image it references has been consumed. See replay for 'start'.
+    """
+    return replay(images, load_plan(path), start)
+
+
+def replay(images: Iterable[Image], slices: list[Slice], start: Tuple[int, int] = (0, 0)) -> Iterator[Slice]:
+    """yield precomputed 'slices' while consuming 'images' as a detector would.
+
+    Args:
+        start (tuple[int, int]): (image index, row) of a cut of the plan to
+            replay from, to resume an interrupted run. 'images' then begins
+            with that image.
+
+    Raises:
+        ValueError: if a slice does not fit the images it references, or
+            'start' is not a cut of the plan.
+    """
+    first_idx = start[0]
+    if start != (0, 0):
+        ends = [(s.points[-1][0], s.points[-1][2]) for s in slices]
+        if tuple(start) not in ends:
+            raise ValueError(f"cut plan has no cut at row {start[1]} of image {first_idx}")
+        slices = slices[ends.index(tuple(start)) + 1:]
+
+    heights = []
+    it = iter(images)
+
+    def consume(upto: int) -> None:
+        while first_idx + len(heights) <= upto:
+            try:
+                heights.append(next(it).height)
+            except StopIteration:
+                raise ValueError("cut plan references more images than given") from None
+
+    for s in slices:
+        consume(s.points[-1][0])
+        for idx, start, end in s.points:
+            if end > heights[idx - first_idx]:
+                raise ValueError(
+                    f"cut plan does not match image {idx}: "
+                    f"row {end} is past its height {heights[idx - first_idx]}"
+                )
+        yield s
+
+    consumed = first_idx + len(heights)
+    total = consumed + sum(1 for _ in it)
+    if total != consumed:
+        raise ValueError(f"cut plan covers {consumed} images, got {total}")
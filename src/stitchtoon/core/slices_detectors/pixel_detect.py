@@ -1,10 +1,15 @@
-from typing import List, Union
+import functools
+from io import BytesIO
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 import PIL.Image
 from PIL.Image import Image
 
 from ...logger import logged
+from ..executor import Executor, get_executor
+from ..mapped_image import MappedImage
+from ..scaled_image import ScaledImage, scale_rows
 from .slice import Slice
 
 
@@ -79,6 +84,72 @@ def _find_nearest_valid_row(
     return int(abs_indices[np.argmin(np.abs(abs_indices - target))])
 
 
+def _draft_gray(img: Image, size: Tuple[int, int]) -> Optional[Image]:
+    """Grayscale *img* at *size*, decoded at reduced scale by libjpeg.
+
+    Only possible for JPEGs that are not decoded yet. A separate reader is
+    used, so *img* itself stays undecoded until its full pixels are needed.
+    Returns None if *img* cannot be draft-decoded.
+    """
+    if img.format != "JPEG" or not getattr(img, "tile", None):
+        return None
+    if getattr(img, "filename", None):
+        source = img.filename
+    elif isinstance(getattr(img, "fp", None), BytesIO):
+        # images read from an archive keep their encoded bytes in memory
+        source = BytesIO(img.fp.getvalue())
+    else:
+        return None
+
+    with PIL.Image.open(source) as reader:
+        # DCT scaling to the smallest of 1/2, 1/4, 1/8 that is at least *size*
+        reader.draft("L", size)
+        small = reader.convert("L")
+    if small.size != size:
+        small = small.resize(size, PIL.Image.Resampling.NEAREST)
+    return small
+
+
+def _analyse_image(
+    img: Image,
+    division_factor: int,
+    x_margins: int,
+    threshold: int,
+    window: int,
+) -> Tuple[Image, np.ndarray]:
+    """Return *img* with its confirmed rows, in division_factor space."""
+    df = division_factor
+
+    if isinstance(img, ScaledImage) and img.is_scaled:
+        # analyse the page at its own size, then map its rows to the resized ones
+        margins = int(x_margins * img.source.width / img.width)
+        _, valid_rows = _analyse_image(img.source, df, margins, threshold, window=1)
+        rows = img.height // df if df > 1 else img.height
+        return img, _apply_window(scale_rows(valid_rows, img.scale, rows, df), window)
+
+    if isinstance(img, MappedImage) and img.is_mapped:
+        # read the rows straight from the file, the image stays undecoded
+        arr = img.gray(df)
+        _validate_margins(arr.shape[1], x_margins)
+        return img, _apply_window(_compute_valid_rows(arr, x_margins, threshold), window)
+
+    # Downscale for analysis only -- original image is never modified
+    if df > 1:
+        size = (img.width // df, img.height // df)
+        small = _draft_gray(img, size)
+        if small is None:
+            small = img.resize(size, PIL.Image.Resampling.NEAREST)
+    else:
+        small = img
+
+    _validate_margins(small.width, x_margins)
+
+    # Build grayscale array ONCE per image (uint8 = half the memory of int16)
+    arr = np.array(small.convert("L"), dtype=np.uint8)
+    valid_rows = _compute_valid_rows(arr, x_margins, threshold)
+    return img, _apply_window(valid_rows, window)
+
+
 @logged
 def pixel_detect(
     images: List[Image],
@@ -89,11 +160,15 @@ def pixel_detect(
     min_height: Union[int, float] = -1,
     division_factor: int = 1,
     window: int = 1,
+    executor: Optional[Executor] = None,
+    start: Tuple[int, int] = (0, 0),
 ) -> List[Slice]:
     """Detect slice points using neighboring-pixel comparison.
 
     Args:
         images:          Input images (all must share the same width).
+                         ScaledImages are analysed on the rows of their
+                         page, see core.scaled_image.
         height:          Target slice height in pixels (original space).
         x_margins:       Pixels to ignore on each side during row validation.
         sensitivity:     Percentage (1-100). 100 = strictest (threshold=0).
@@ -107,10 +182,55 @@ def pixel_detect(
         window:          Number of consecutive valid rows required to confirm
                          a slice position. 1 = single-row check (default).
                          Values of 5-20 are recommended for noisy content.
+        executor:        Executor the per-image row analysis runs on.
+                         Defaults to executor.get_executor().
+        start:           See :func:`iter_pixel_detect`.
 
     Returns:
         List of Slice objects with coordinates in the original image space.
     """
+    return list(
+        iter_pixel_detect(
+            images,
+            height,
+            x_margins=x_margins,
+            sensitivity=sensitivity,
+            max_height=max_height,
+            min_height=min_height,
+            division_factor=division_factor,
+            window=window,
+            executor=executor,
+            start=start,
+        )
+    )
+
+
+def iter_pixel_detect(
+    images: Iterable[Image],
+    height: int,
+    x_margins: int = 0,
+    sensitivity: int = 100,
+    max_height: Union[int, float] = -1,
+    min_height: Union[int, float] = -1,
+    division_factor: int = 1,
+    window: int = 1,
+    executor: Optional[Executor] = None,
+    lookahead: Optional[int] = None,
+    start: Tuple[int, int] = (0, 0),
+) -> Iterator[Slice]:
+    """Lazy variant of :func:`pixel_detect`.
+
+    Images are consumed in order and every Slice is yielded as soon as its
+    last point is known, which lets a streaming pipeline stitch and encode
+    it while later images are still being decoded. At most *lookahead*
+    images (default: twice the executor's workers) are pulled from *images*
+    ahead of the cut search. See :func:`pixel_detect` for the meaning of the
+    other arguments.
+
+    *start* is the (image index, row) of a cut to detect from, to resume
+    an interrupted run: *images* then begins with that image, and the
+    slices are those a full run yields after that cut.
+    """
     assert (height <= max_height and max_height != -1) or max_height == -1
     assert (height >= min_height and min_height != -1) or min_height == -1
     assert max_height >= min_height or max_height == -1
@@ -124,34 +244,29 @@ def pixel_detect(
     threshold = int(255 * (1 - sensitivity / 100))
     df = division_factor
 
-    slices: List[Slice] = []
-    images_len = len(images)
     cur_height_o = 0   # rolling accumulator in ORIGINAL pixel space
     start_o = 0        # current segment start in ORIGINAL pixel space
     sp = Slice()
 
-    for idx, img in enumerate(images):
+    # Row analysis is independent per image, so it runs ahead on the executor
+    # while the rolling cut search below stays sequential.
+    analyse = functools.partial(
+        _analyse_image,
+        division_factor=df,
+        x_margins=x_margins,
+        threshold=threshold,
+        window=window,
+    )
+    executor = (executor or get_executor()).local()
+
+    first_idx, start_o = start
+    analysed = executor.imap(analyse, images, lookahead=lookahead)
+    for idx, (img, confirmed) in enumerate(analysed, first_idx):
         orig_h = img.height
         orig_w = img.width
 
-        # Downscale for analysis only -- original image is never modified
-        if df > 1:
-            small = img.resize(
-                (orig_w // df, orig_h // df),
-                PIL.Image.Resampling.NEAREST,
-            )
-        else:
-            small = img
-
-        _validate_margins(small.width, x_margins)
-
-        # Build grayscale array ONCE per image (uint8 = half the memory of int16)
-        arr = np.array(small.convert("L"), dtype=np.uint8)
-        valid_rows = _compute_valid_rows(arr, x_margins, threshold)
-        confirmed = _apply_window(valid_rows, window)
-
         start_s = start_o // df   # start position in small-image space
-        cur_height_o += orig_h
+        cur_height_o += orig_h - start_o
 
         while cur_height_o >= height:
             # Target slice position in original space
@@ -160,7 +275,7 @@ def pixel_detect(
 
             # Search bounds in small-image space
             lo_s = start_s + 1
-            hi_s = small.height  # exclusive
+            hi_s = len(confirmed)  # exclusive
 
             if min_height != -1:
                 lo_s = max(lo_s, start_s + min_height // df)
@@ -177,7 +292,7 @@ def pixel_detect(
 
             sp.add((idx, start_o, slice_pos_o))
             sp.width = orig_w
-            slices.append(sp)
+            yield sp
             sp = Slice()
 
             start_o = slice_pos_o
@@ -187,12 +302,10 @@ def pixel_detect(
         if 0 < cur_height_o < height:
             sp.add((idx, start_o, orig_h))
             sp.width = orig_w
-            if idx == images_len - 1:
-                slices.append(sp)
-                break
 
         # Reset start tracking for the next image
         start_o = 0
         start_s = 0
 
-    return slices
+    if sp.points:
+        yield sp
@@ -1,7 +1,5 @@
-from dataclasses import dataclass
-from dataclasses import field
-from typing import List
-from typing import Tuple
+from dataclasses import dataclass, field
+from typing import List, Tuple
 
 
 # TODO: Change points from a tuple to a class
@@ -36,3 +34,15 @@ class Slice:
     @property
     def size(self) -> tuple[int, int]:
         return (self.width, self.height)
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form, see Slice.from_dict."""
+        return {"width": self.width, "points": [list(p) for p in self.points]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Slice":
+        sp = cls()
+        for point in data["points"]:
+            sp.add(tuple(point))
+        sp.width = data["width"]
+        return sp
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import os.path as osp
+from typing import Optional
+
+from ...logger import logged
+from ..cache import default_cache_dir
+from .slice import Slice
+
+
+class SliceCache:
+    """On-disk cache of detected slices.
+
+    Entries are keyed by SliceCache.key, a digest of the input fingerprints,
+    the width images were normalized to and the detector parameters, so
+    re-exporting the same chapter in another format or as an archive reuses
+    the slices instead of running detection again.
+
+    Args:
+        path (str, optional): cache directory. Defaults to default_cache_dir("slices").
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_cache_dir("slices")
+
+    @staticmethod
+    def key(inputs: dict, width: Optional[int], method: str, height: Optional[int], **params) -> str:
+        """Cache key for a detection run.
+
+        Args:
+            inputs (dict): input fingerprints, see core.manifest.fingerprint_all.
+            width (int, optional): width images were normalized to before detection.
+            method (str): detection method.
+            height (int, optional): target slice height.
+            params: detector parameters.
+        """
+        material = {
+            "inputs": inputs,
+            "width": width,
+            "method": str(method),
+            "height": height,
+            "params": params,
+        }
+        data = json.dumps(material, sort_keys=True, default=str).encode()
+        return hashlib.sha256(data).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return osp.join(self.path, key[:2], f"{key}.json")
+
+    @logged(inclass=True)
+    def get(self, key: str) -> Optional[list[Slice]]:
+        """Cached slices for 'key', or None."""
+        try:
+            with open(self._entry(key)) as f:
+                data = json.load(f)
+            return [Slice.from_dict(s) for s in data["slices"]]
+        except (OSError, ValueError, KeyError, TypeError, AssertionError):
+            return None
+
+    @logged(inclass=True)
+    def put(self, key: str, slices: list[Slice]) -> None:
+        """Store 'slices' under 'key'. Failing to write the cache is not an error."""
+        entry = self._entry(key)
+        tmp = f"{entry}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(osp.dirname(entry), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump({"slices": [s.to_dict() for s in slices]}, f)
+            os.replace(tmp, entry)
+        except OSError:
+            pass
@@ -1,18 +1,24 @@
 from enum import StrEnum
+from typing import Iterable, Iterator, Optional, Tuple
 
 from PIL.Image import Image
 
 from ...logger import logged
+from ..executor import Executor
 from .auto_detect import auto_detect
-from .direct_detect import direct_detect
-from .pixel_detect import pixel_detect
+from .direct_detect import direct_detect, iter_direct_detect
+from .metadata_detect import iter_metadata_detect, metadata_detect, replay
+from .pixel_detect import iter_pixel_detect, pixel_detect
 from .slice import Slice
+from .slice_cache import SliceCache
 
 
 class DetectionMethod(StrEnum):
     AUTO = "auto"
     PIXEL = "pixel"
     DIRECT = "direct"
+    # replay a stored cut plan, see metadata_detect.load_plan
+    METADATA = "metadata"
 
 
 # TODO: set a minimum allowed height
@@ -24,13 +30,104 @@ class SlicesDetector:
         images: list[Image],
         method: DetectionMethod = DetectionMethod.PIXEL,
         height: int | None = None,
+        executor: Optional[Executor] = None,
+        cache: Optional[SliceCache] = None,
+        cache_key: Optional[str] = None,
+        start: Tuple[int, int] = (0, 0),
         **params,
     ) -> list[Slice]:
+        """detect slices.
+
+        Args:
+            images (list[Image]): images, all of the same width.
+            method (DetectionMethod): detection method. Defaults to PIXEL.
+            height (int, optional): target slice height.
+            executor (Executor, optional): executor for the pixel method.
+            cache (SliceCache, optional): reuse and store results in this cache.
+            cache_key (str, optional): key of this run in 'cache', see SliceCache.key.
+                The cache is only used if both are given.
+            start (tuple[int, int]): (image index, row) of a cut to detect
+                from, to resume an interrupted run: 'images' then begins with
+                that image, and only the slices after that cut are returned.
+                Such partial plans are not stored in the cache.
+            params: method parameters; the metadata method takes 'path', the plan file.
+        """
+        use_cache = cache is not None and cache_key is not None
+        if use_cache:
+            slices = cache.get(cache_key)
+            if slices is not None:
+                return list(replay(images, slices, start))
+
+        slices = cls._detect(images, method, height, executor, start, **params)
+        if use_cache and tuple(start) == (0, 0):
+            cache.put(cache_key, slices)
+        return slices
+
+    @staticmethod
+    def _detect(images, method, height, executor, start, **params) -> list[Slice]:
         if method == DetectionMethod.PIXEL:
-            return pixel_detect(images, height=height, **params)
+            return pixel_detect(images, height=height, executor=executor, start=start, **params)
         elif method == DetectionMethod.AUTO:
+            if tuple(start) != (0, 0):
+                raise ValueError("auto detection cannot start from a cut")
             return auto_detect(images)
         elif method == DetectionMethod.DIRECT:
-            return direct_detect(images, height=height)
+            return direct_detect(images, height=height, start=start)
+        elif method == DetectionMethod.METADATA:
+            return metadata_detect(images, start=start, **params)
+        else:
+            raise ValueError(f"Unknown detection method {method}")
+
+    @classmethod
+    @logged(inclass=True)
+    def iter_slice_points(
+        cls,
+        images: Iterable[Image],
+        method: DetectionMethod = DetectionMethod.PIXEL,
+        height: int | None = None,
+        executor: Optional[Executor] = None,
+        cache: Optional[SliceCache] = None,
+        cache_key: Optional[str] = None,
+        start: Tuple[int, int] = (0, 0),
+        **params,
+    ) -> Iterator[Slice]:
+        """lazily detect slices, yielding each one as soon as it is complete.
+
+        Unlike slice_points, 'images' may be any iterable; it is consumed in
+        order and only once, so it can be a generator that decodes images on
+        demand. Cached slices are replayed in step with 'images'; fresh ones
+        are stored once detection ran to completion. See slice_points for 'start'.
+        """
+        if cache is None or cache_key is None:
+            return cls._iter_detect(images, method, height, executor, start, **params)
+
+        slices = cache.get(cache_key)
+        if slices is not None:
+            return replay(images, slices, start)
+        detected = cls._iter_detect(images, method, height, executor, start, **params)
+        if tuple(start) != (0, 0):
+            return detected
+        return cls._iter_store(detected, cache, cache_key)
+
+    @staticmethod
+    def _iter_store(slices: Iterator[Slice], cache: SliceCache, key: str) -> Iterator[Slice]:
+        done = []
+        for s in slices:
+            done.append(s)
+            yield s
+        cache.put(key, done)
+
+    @staticmethod
+    def _iter_detect(images, method, height, executor, start, **params) -> Iterator[Slice]:
+        if method == DetectionMethod.PIXEL:
+            return iter_pixel_detect(images, height=height, executor=executor, start=start, **params)
+        elif method == DetectionMethod.AUTO:
+            if tuple(start) != (0, 0):
+                raise ValueError("auto detection cannot start from a cut")
+            return iter(auto_detect(list(images)))
+        elif method == DetectionMethod.DIRECT:
+            return iter_direct_detect(images, height=height, start=start)
+        elif method == DetectionMethod.METADATA:
+            return iter_metadata_detect(images, start=start, **params)
         else:
             raise ValueError(f"Unknown detection method {method}")
@@ -1,12 +1,47 @@
+import functools
+from enum import StrEnum
+from typing import Iterable, Iterator, Mapping, Optional, Sequence, Union
+
+import numpy as np
 import PIL.Image
 from PIL.Image import Image
 
-from ..const import SUPPORTS_TRANSPARENCY
 from ..logger import logged
+from .executor import Executor, get_executor
+from .image_manipulator import ImageManipulator
+from .mapped_image import MappedImage, decode
+from .scaled_image import ScaledImage
 from .slices_detectors.slices_detector import Slice
 
+# modes stitched in L
+_GRAY_MODES = {"1", "L"}
+
+# modes that may hold transparency, stitched in RGBA; palette images may
+# have a transparent color
+_ALPHA_MODES = {"RGBA", "RGBa", "LA", "La", "PA", "P"}
+
+
+class StitchBackend(StrEnum):
+    # crop the rows of every source and paste them into a new image
+    PIL = "pil"
+    # copy row ranges of source arrays into one buffer, see Stitcher.stitch_slice_array
+    NUMPY = "numpy"
+
 
 class Stitcher:
+    @staticmethod
+    def stitch_mode(modes: Iterable[str]) -> str:
+        """smallest mode of L, RGB and RGBA that pages of 'modes' can be stitched in without loss.
+
+        Defaults to RGBA when no modes are given.
+        """
+        modes = set(modes)
+        if not modes or modes & _ALPHA_MODES:
+            return "RGBA"
+        if modes <= _GRAY_MODES:
+            return "L"
+        return "RGB"
+
     @staticmethod
     @logged(inclass=True)
     def stitch(
@@ -14,23 +49,211 @@ class Stitcher:
             slices: list[Slice],
             mode="RGBA",
             fill_color=(255, 255, 255, 0),
+            executor: Optional[Executor] = None,
+            backend: StitchBackend = StitchBackend.PIL,
+            trim_transparent=False,
     ) -> list[Image]:
-        new_images = []
-        if mode != "RGBA" and len(fill_color) > 3:
-            fill_color = fill_color[0:3]
-        for s in slices:
-            img = PIL.Image.new(mode, s.size, fill_color)
-            cur_height = 0
-            for p in s.points:
-                img.paste(
-                    images[p[0]].crop((0, p[1], images[p[0]].width, p[2])),
-                    box=(0, cur_height),
-                )
-                cur_height += p[2] - p[1]
-            if mode in SUPPORTS_TRANSPARENCY:
-                bbox = img.getbbox()
-                if bbox:
-                    img = img.crop(bbox)
-            new_images.append(img)
-
-        return new_images
+        executor = (executor or get_executor()).local()
+        if StitchBackend(backend) == StitchBackend.NUMPY:
+            # every page is turned into an array once, whatever the number of
+            # slices using it, and only while slices using it are stitched
+            stitch = functools.partial(
+                _stitch_array_task,
+                mode=mode,
+                fill_color=fill_color,
+                trim_transparent=trim_transparent,
+            )
+            return list(executor.imap(stitch, Stitcher.iter_slice_pages(images, slices, mode, executor)))
+
+        # decode lazily opened images up front, one thread per image, so
+        # concurrent slices never race to load the same source; pages
+        # resized on demand are resampled a slice at a time
+        executor.map(decode, [img.source if isinstance(img, ScaledImage) else img for img in images])
+        stitch = functools.partial(
+            Stitcher.stitch_slice,
+            images,
+            mode=mode,
+            fill_color=fill_color,
+            trim_transparent=trim_transparent,
+        )
+        return executor.map(stitch, slices)
+
+    @staticmethod
+    def trim_transparent(img: Image) -> Image:
+        """'img' cropped to its pixels that are not fully transparent.
+
+        Images without an alpha band, and fully transparent ones, are returned as they are.
+        """
+        if "A" not in img.mode:
+            return img
+        bbox = img.getbbox()
+        if bbox is None or bbox == (0, 0) + img.size:
+            return img
+        return img.crop(bbox)
+
+    @staticmethod
+    def page_array(img: Image, mode="RGBA") -> np.ndarray:
+        """pixels of 'img' in 'mode', as an array of shape (height, width[, channels]).
+
+        The pixels of a MappedImage already in 'mode' are a view of its file.
+        """
+        if isinstance(img, MappedImage) and img.is_mapped and img.mode == mode:
+            return img.pixels()
+        decode(img)
+        if img.mode != mode:
+            # the conversion pasting into a 'mode' canvas does
+            img = img.convert(mode)
+        return np.asarray(img)
+
+    @staticmethod
+    def iter_slice_pages(
+            images: Sequence[Image],
+            slices: Sequence[Slice],
+            mode="RGBA",
+            executor: Optional[Executor] = None,
+    ) -> Iterator[tuple[dict[int, np.ndarray], Slice]]:
+        """(arrays of the pages of a slice, slice), for every slice in order.
+
+        The array of a page is built, see Stitcher.page_array, when the first
+        slice using it comes and dropped once the last one is yielded, so
+        only the pages of the slices being stitched are held twice.
+        """
+        executor = (executor or get_executor()).local()
+        last = {idx: i for i, s in enumerate(slices) for idx, _, _ in s.points}
+        pages = {}
+        for i, s in enumerate(slices):
+            needed = sorted({idx for idx, _, _ in s.points})
+            missing = [idx for idx in needed if idx not in pages]
+            arrays = executor.map(
+                functools.partial(Stitcher.page_array, mode=mode), [images[idx] for idx in missing]
+            )
+            pages.update(zip(missing, arrays))
+            yield {idx: pages[idx] for idx in needed}, s
+            for idx in needed:
+                if last[idx] == i:
+                    del pages[idx]
+
+    @staticmethod
+    def stitch_slice_array(
+            pages: Union[Sequence[np.ndarray], Mapping[int, np.ndarray]],
+            s: Slice,
+            mode="RGBA",
+            fill_color=(255, 255, 255, 0),
+            trim_transparent=False,
+    ) -> Image:
+        """stitch a single slice from page arrays, see Stitcher.page_array.
+
+        Row ranges of the pages are copied once, into a single buffer the
+        returned image is built on. A slice lying within a single page is a
+        view of that page instead, except in RGB, which Pillow stores with a
+        padding byte per pixel and always copies.
+
+        Args:
+            pages: page arrays in 'mode', indexed by the image indices in 's.points'.
+            s, mode, fill_color, trim_transparent: see Stitcher.stitch_slice.
+
+        Returns:
+            Image: stitched image, same as Stitcher.stitch_slice gives.
+        """
+        width, height = s.size
+        if len(s.points) == 1:
+            idx, start, end = s.points[0]
+            rows = pages[idx][start:end]
+            if rows.shape[:2] == (height, width):
+                img = PIL.Image.fromarray(rows)
+                return Stitcher.trim_transparent(img) if trim_transparent else img
+
+        fill_color = ImageManipulator.mode_color(fill_color, mode)
+        channels = pages[s.points[0][0]].shape[2:]
+        buffer = np.empty((height, width, *channels), np.uint8)
+        cur_height = 0
+        for idx, start, end in s.points:
+            rows = pages[idx][start:end, :width]
+            buffer[cur_height:cur_height + len(rows), :rows.shape[1]] = rows
+            buffer[cur_height:cur_height + len(rows), rows.shape[1]:] = fill_color
+            cur_height += len(rows)
+        buffer[cur_height:] = fill_color
+        img = PIL.Image.fromarray(buffer)
+        return Stitcher.trim_transparent(img) if trim_transparent else img
+
+    @staticmethod
+    def stitch_slice(
+            images: Union[Sequence[Image], Mapping[int, Image]],
+            s: Slice,
+            mode="RGBA",
+            fill_color=(255, 255, 255, 0),
+            trim_transparent=False,
+    ) -> Image:
+        """stitch a single slice.
+
+        The image is exactly the size of the slice: 's.size' is known from
+        the plan, so nothing is scanned or cropped afterwards unless asked.
+
+        Args:
+            images: source images, indexed by the image indices in 's.points'.
+                A mapping is accepted so streaming callers only need to keep
+                the images the slice actually references.
+            s (Slice): slice to build.
+            mode (str): mode of the new image, see Stitcher.stitch_mode. Defaults to RGBA.
+            fill_color: background color. Defaults to transparent white.
+            trim_transparent (bool): crop the image to its pixels that are not
+                fully transparent, for pages with transparent margins. This scans
+                the whole image, see Stitcher.trim_transparent. Defaults to False.
+
+        Returns:
+            Image: stitched image.
+        """
+        img = PIL.Image.new(mode, s.size, ImageManipulator.mode_color(fill_color, mode))
+        cur_height = 0
+        for p in s.points:
+            img.paste(images[p[0]].crop((0, p[1], images[p[0]].width, p[2])), box=(0, cur_height))
+            cur_height += p[2] - p[1]
+        return Stitcher.trim_transparent(img) if trim_transparent else img
+
+    @staticmethod
+    def iter_bands(
+            images: Union[Sequence[Image], Mapping[int, Image]],
+            s: Slice,
+            mode="RGBA",
+            fill_color=(255, 255, 255, 0),
+            band_pixels=1 << 22,
+    ) -> Iterator[Image]:
+        """stitch a single slice as successive bands of rows, top to bottom.
+
+        Stacked, the bands are the image stitch_slice returns, but only one
+        band is held at a time, see core.row_writer. Images are decoded
+        first, as every band would decode them again otherwise; MappedImages
+        stay mapped, so only the rows of each band are read from their file.
+
+        Args:
+            images, s, mode, fill_color: see Stitcher.stitch_slice.
+            band_pixels (int): approximate pixel count of a band. Every band
+                has the same height, except the last one.
+
+        Yields:
+            Image: bands of full-width rows.
+        """
+        fill_color = ImageManipulator.mode_color(fill_color, mode)
+        width, height = s.size
+        rows = max(1, band_pixels // max(1, width))
+        # (first row in the slice, image index, first row, row after the last)
+        strips = []
+        cur_height = 0
+        for idx, start, end in s.points:
+            decode(images[idx])
+            strips.append((cur_height, idx, start, end))
+            cur_height += end - start
+        for top in range(0, height, rows):
+            bottom = min(top + rows, height)
+            band = PIL.Image.new(mode, (width, bottom - top), fill_color)
+            for y, idx, start, end in strips:
+                first, last = max(top, y), min(bottom, y + end - start)
+                if first < last:
+                    strip = images[idx].crop((0, start + first - y, images[idx].width, start + last - y))
+                    band.paste(strip, box=(0, first - top))
+            yield band
+
+
+def _stitch_array_task(task: tuple[Mapping[int, np.ndarray], Slice], **kwargs) -> Image:
+    pages, s = task
+    return Stitcher.stitch_slice_array(pages, s, **kwargs)
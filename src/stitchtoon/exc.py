@@ -1,2 +1,6 @@
 class UnSupportedFormatError(Exception):
     pass
+
+
+class ImageTooLargeError(Exception):
+    pass
@@ -46,3 +46,40 @@ class DefaultCliProgress(ProgressHandler):
         self.value = value
         self.bar.message = msg
         self.bar.next(value)
+
+
+class QueueProgress(ProgressHandler):
+    """Forward progress updates of one task to a queue.
+
+    Used by worker processes; the parent drains the queue and feeds the
+    updates into a ProgressAggregator.
+    """
+
+    def __init__(self, queue, key, prefix="", size=100):
+        super().__init__(prefix, size)
+        self.queue = queue
+        self.key = key
+
+    def update(self, value, msg=""):
+        self.queue.put((self.key, value, msg))
+
+
+class ProgressAggregator:
+    """Combine the progress of `tasks` tasks into a single ProgressHandler.
+
+    Every task reports increments summing up to 100, like a ProgressHandler
+    of its own; the wrapped handler advances by the average of all tasks.
+    """
+
+    def __init__(self, handler: ProgressHandler, tasks: int):
+        self.handler = handler
+        self.tasks = max(1, tasks)
+        self._total = 0
+        self._shown = 0
+
+    def update(self, value, msg=""):
+        self._total += value
+        shown = self._total // self.tasks
+        if shown > self._shown:
+            self.handler.update(shown - self._shown, msg)
+            self._shown = shown
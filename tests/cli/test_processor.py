@@ -0,0 +1,384 @@
+import json
+import os
+import shutil
+import zipfile
+
+import numpy as np
+import PIL.Image
+import pytest
+
+from stitchtoon.cli.args import parse_args
+from stitchtoon.cli.processor import run
+from stitchtoon.core.slices_detectors import pixel_detect
+from stitchtoon.core.stitcher import Stitcher
+
+
+@pytest.fixture
+def chapter_dir(tmp_path, test_images_files):
+    chapter = tmp_path / "input" / "chapter"
+    chapter.mkdir(parents=True)
+    for imf in test_images_files:
+        shutil.copy(imf, chapter / imf.name)
+    return tmp_path / "input"
+
+
+@pytest.fixture
+def library_dir(tmp_path, test_images_files):
+    library = tmp_path / "library"
+    for i, count in enumerate((1, 3, 2)):
+        chapter = library / f"chapter{i}"
+        chapter.mkdir(parents=True)
+        for imf in test_images_files[:count]:
+            shutil.copy(imf, chapter / imf.name)
+    return library
+
+
+def _outputs(path):
+    return sorted(
+        (p.relative_to(path).as_posix(), PIL.Image.open(p).size)
+        for p in path.rglob("*")
+        if p.is_file() and not any(part.startswith(".") for part in p.relative_to(path).parts)
+    )
+
+
+class TestProcessor:
+    def test_run_directory(self, chapter_dir, tmp_path):
+        out = tmp_path / "out"
+        args = parse_args([str(chapter_dir), str(out), "-f", "png", "-m", "direct", "-H", "1500"])
+
+        assert run(args) == 0
+        assert _outputs(out)
+
+    def test_stream_matches_batch(self, chapter_dir, tmp_path):
+        common = [str(chapter_dir), "-f", "png", "-H", "1500", "--width", "400"]
+        batch = tmp_path / "batch"
+        stream = tmp_path / "stream"
+
+        assert run(parse_args([common[0], str(batch), *common[1:]])) == 0
+        assert run(parse_args([common[0], str(stream), *common[1:], "--stream"])) == 0
+        assert _outputs(stream) == _outputs(batch)
+
+    @pytest.mark.parametrize("stream", [True, False])
+    def test_unchanged_pages_are_copied(self, chapter_dir, tmp_path, stream):
+        pages = sorted(p for p in (chapter_dir / "chapter").iterdir() if p.suffix == ".jpeg")
+        for page in (chapter_dir / "chapter").iterdir():
+            if page not in pages:
+                page.unlink()
+        out = tmp_path / "out"
+        width, height = PIL.Image.open(pages[0]).size
+        # pages of equal size cut at their height: every slice is a whole page
+        argv = [str(chapter_dir), str(out), "-f", "jpeg", "-m", "direct", "-H", str(height),
+                "--width", str(width), "--no-progress"]
+        if stream:
+            argv.append("--stream")
+
+        assert run(parse_args(argv)) == 0
+        copied = [p.read_bytes() for p in sorted((out / "chapter").glob("*.jpeg"))]
+        assert run(parse_args([*argv, "--no-copy-unchanged"])) == 0
+        encoded = [p.read_bytes() for p in sorted((out / "chapter").glob("*.jpeg"))]
+        assert len(copied) == len(pages)
+        assert copied == [p.read_bytes() for p in pages] != encoded
+
+    @pytest.mark.parametrize("stream", [True, False])
+    def test_pages_in_other_modes_are_encoded(self, tmp_path, stream):
+        chapter = tmp_path / "input" / "chapter"
+        chapter.mkdir(parents=True)
+        page = chapter / "01.jpeg"
+        PIL.Image.new("CMYK", (200, 300), (10, 20, 30, 40)).save(page)
+        out = tmp_path / "out"
+        argv = [str(tmp_path / "input"), str(out), "-f", "jpeg", "-m", "direct", "-H", "300",
+                "--width", "200", "--no-progress"]
+        if stream:
+            argv.append("--stream")
+
+        assert run(parse_args(argv)) == 0
+        written = out / "chapter" / "001.jpeg"
+        assert written.read_bytes() != page.read_bytes()
+        assert PIL.Image.open(written).mode == "RGB"
+
+    @pytest.mark.parametrize("stream", [True, False])
+    def test_large_slices_are_written_by_rows(self, chapter_dir, tmp_path, monkeypatch, stream):
+        argv = [str(chapter_dir), "-f", "bmp", "-m", "direct", "-H", "3000", "--width", "400",
+                "--no-progress"]
+        if stream:
+            argv.append("--stream")
+        stitched = tmp_path / "stitched"
+        assert run(parse_args([argv[0], str(stitched), *argv[1:]])) == 0
+
+        by_rows = tmp_path / "by_rows"
+        monkeypatch.setattr("stitchtoon.core.row_writer.STREAM_MIN_PIXELS", 1)
+        whole = staticmethod(lambda *args, **kwargs: pytest.fail("slice stitched whole"))
+        monkeypatch.setattr(Stitcher, "stitch_slice", whole)
+        assert run(parse_args([argv[0], str(by_rows), *argv[1:]])) == 0
+
+        assert _outputs(by_rows) == _outputs(stitched)
+        for name, _ in _outputs(stitched):
+            assert PIL.Image.open(by_rows / name).tobytes() == PIL.Image.open(stitched / name).tobytes()
+
+    @pytest.mark.parametrize("stream", [True, False])
+    def test_read_ahead_matches(self, chapter_dir, tmp_path, stream):
+        common = ["-f", "png", "-H", "1500", "--width", "400", "--no-progress"]
+        if stream:
+            common.append("--stream")
+        direct = tmp_path / "direct"
+        ahead = tmp_path / "ahead"
+
+        assert run(parse_args([str(chapter_dir), str(direct), *common])) == 0
+        argv = [str(chapter_dir), str(ahead), *common, "--read-ahead", "2", "--io-workers", "2"]
+        assert run(parse_args(argv)) == 0
+        assert _outputs(ahead) == _outputs(direct)
+
+    @pytest.mark.parametrize("stream", [True, False])
+    def test_numpy_backend_matches_pil(self, chapter_dir, tmp_path, stream):
+        common = ["-f", "png", "-m", "direct", "-H", "1500", "--width", "400", "--no-progress"]
+        if stream:
+            common.append("--stream")
+        pil = tmp_path / "pil"
+        numpy = tmp_path / "numpy"
+
+        assert run(parse_args([str(chapter_dir), str(pil), *common])) == 0
+        assert run(parse_args([str(chapter_dir), str(numpy), *common, "--stitch-backend", "numpy"])) == 0
+        assert _outputs(numpy) == _outputs(pil)
+        for name, _ in _outputs(pil):
+            assert PIL.Image.open(numpy / name).tobytes() == PIL.Image.open(pil / name).tobytes()
+
+    @pytest.mark.parametrize("stream", [True, False])
+    def test_reducing_gap_keeps_outputs(self, chapter_dir, tmp_path, stream):
+        common = ["-f", "png", "-m", "direct", "-H", "1500", "--width", "300", "--no-progress"]
+        if stream:
+            common.append("--stream")
+        exact = tmp_path / "exact"
+        fast = tmp_path / "fast"
+
+        assert run(parse_args([str(chapter_dir), str(exact), *common])) == 0
+        assert run(parse_args([str(chapter_dir), str(fast), *common, "--reducing-gap", "2"])) == 0
+        assert _outputs(fast) == _outputs(exact)
+
+    @pytest.mark.parametrize("stream", [True, False])
+    def test_defer_resize_matches(self, chapter_dir, tmp_path, stream):
+        common = ["-f", "png", "-m", "direct", "-H", "1500", "--width", "300", "--no-progress"]
+        if stream:
+            common.append("--stream")
+        resized = tmp_path / "resized"
+        deferred = tmp_path / "deferred"
+
+        assert run(parse_args([str(chapter_dir), str(resized), *common])) == 0
+        assert run(parse_args([str(chapter_dir), str(deferred), *common, "--defer-resize"])) == 0
+        assert _outputs(deferred) == _outputs(resized)
+        for name, _ in _outputs(resized):
+            a = np.asarray(PIL.Image.open(deferred / name), dtype=np.int16)
+            b = np.asarray(PIL.Image.open(resized / name), dtype=np.int16)
+            assert np.abs(a - b).max() <= 1
+
+    def test_stream_defers_jpeg_decoding(self, chapter_dir, tmp_path):
+        for page in (chapter_dir / "chapter").iterdir():
+            if page.suffix != ".jpeg":
+                page.unlink()
+        out = tmp_path / "out"
+        argv = [str(chapter_dir), str(out), "-f", "png", "-H", "500", "--stream",
+                "--division-factor", "2", "--width", "728"]
+
+        assert run(parse_args(argv)) == 0
+        heights = sum(h for _, (_, h) in _outputs(out))
+        assert heights == sum(PIL.Image.open(p).height for p in (chapter_dir / "chapter").iterdir())
+
+    def test_deferred_decoding_matches_stream(self, chapter_dir, tmp_path, monkeypatch):
+        for page in (chapter_dir / "chapter").iterdir():
+            if page.suffix != ".jpeg":
+                page.unlink()
+        pages = len(list((chapter_dir / "chapter").iterdir()))
+        common = ["-f", "png", "-H", "500", "--division-factor", "2", "--width", "728", "--no-cache", "--no-progress"]
+        stream = tmp_path / "stream"
+        batch = tmp_path / "batch"
+
+        draft_gray = pixel_detect._draft_gray
+        drafted = []
+
+        def counting(*args, **kwargs):
+            small = draft_gray(*args, **kwargs)
+            drafted.append(small is not None)
+            return small
+
+        monkeypatch.setattr(pixel_detect, "_draft_gray", counting)
+        assert run(parse_args([str(chapter_dir), str(stream), *common, "--stream"])) == 0
+        assert run(parse_args([str(chapter_dir), str(batch), *common])) == 0
+        # both detect on draft-decoded pages, so both cut at the same rows
+        assert drafted == [True] * 2 * pages
+        assert _outputs(batch) == _outputs(stream)
+
+    def test_zip_members_are_draft_decoded(self, chapter_dir, tmp_path, monkeypatch):
+        pages = sorted(p for p in (chapter_dir / "chapter").iterdir() if p.suffix == ".jpeg")
+        archive = tmp_path / "chapter.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            for page in pages:
+                zf.write(page, page.name)
+        common = ["-f", "png", "-H", "500", "--division-factor", "2", "--width", "728", "--no-cache", "--no-progress"]
+
+        draft_gray = pixel_detect._draft_gray
+        drafted = []
+
+        def counting(*args, **kwargs):
+            small = draft_gray(*args, **kwargs)
+            drafted.append(small is not None)
+            return small
+
+        monkeypatch.setattr(pixel_detect, "_draft_gray", counting)
+        assert run(parse_args([str(archive), str(tmp_path / "stream"), *common, "--stream"])) == 0
+        assert run(parse_args([str(archive), str(tmp_path / "batch"), *common])) == 0
+        assert drafted == [True] * 2 * len(pages)
+        assert _outputs(tmp_path / "batch") == _outputs(tmp_path / "stream")
+
+    def test_run_zip_stream(self, test_archive_file, tmp_path):
+        out = tmp_path / "out"
+        args = parse_args(
+            [str(test_archive_file), str(out), "-f", "jpeg", "-m", "direct", "-H", "1500", "--stream"]
+        )
+
+        assert run(args) == 0
+        assert _outputs(out)
+
+    def test_jobs_matches_sequential(self, library_dir, tmp_path):
+        common = ["-f", "png", "-m", "direct", "-H", "1000", "--no-progress"]
+        seq = tmp_path / "seq"
+        par = tmp_path / "par"
+
+        assert run(parse_args([str(library_dir), str(seq), *common])) == 0
+        assert run(parse_args([str(library_dir), str(par), *common, "--jobs", "2"])) == 0
+        assert _outputs(par) == _outputs(seq)
+
+    def test_max_memory_matches_unlimited(self, library_dir, tmp_path):
+        common = ["-f", "png", "-H", "1000", "--width", "400", "--no-progress"]
+        unlimited = tmp_path / "unlimited"
+        budget = tmp_path / "budget"
+
+        assert run(parse_args([str(library_dir), str(unlimited), *common])) == 0
+        # far too small for any chapter: everything is streamed, one chapter at a time
+        argv = [str(library_dir), str(budget), *common, "--jobs", "3", "--max-memory", "1M"]
+        assert run(parse_args(argv)) == 0
+        assert _outputs(budget) == _outputs(unlimited)
+
+    @pytest.mark.parametrize("max_memory", [[], ["--max-memory", "1G"]])
+    def test_jobs_reports_bad_chapter(self, tmp_path, test_images_files, capsys, max_memory):
+        library = tmp_path / "library"
+        (library / "a").mkdir(parents=True)
+        (library / "b").mkdir()
+        for imf in test_images_files[:2]:
+            shutil.copy(imf, library / "a" / imf.name)
+        # its header alone exceeds the size limit
+        PIL.Image.new("1", (100, 200_000)).save(library / "b" / "huge.png")
+        common = ["-f", "png", "-m", "direct", "-H", "1000", "--no-progress"]
+        seq = tmp_path / "seq"
+        par = tmp_path / "par"
+
+        assert run(parse_args([str(library), str(seq), *common])) == 1
+        argv = [str(library), str(par), *common, "--jobs", "2", *max_memory]
+        assert run(parse_args(argv)) == 1
+        assert "Error in b" in capsys.readouterr().err
+        assert _outputs(par) == _outputs(seq)
+        assert _outputs(par)
+
+    @pytest.mark.parametrize("executor", ["thread", "serial"])
+    def test_executors_match_process(self, chapter_dir, tmp_path, executor):
+        common = ["-f", "png", "-H", "1500", "--width", "400"]
+        process = tmp_path / "process"
+        other = tmp_path / executor
+
+        assert run(parse_args([str(chapter_dir), str(process), *common])) == 0
+        assert run(parse_args([str(chapter_dir), str(other), *common, "--executor", executor])) == 0
+        assert _outputs(other) == _outputs(process)
+
+    def test_incremental_skips_unchanged(self, library_dir, tmp_path, capsys):
+        out = tmp_path / "out"
+        argv = [str(library_dir), str(out), "-f", "png", "-m", "direct", "-H", "1000", "--no-progress"]
+
+        assert run(parse_args(argv)) == 0
+        mtimes = {p: p.stat().st_mtime_ns for p in out.rglob("*.png")}
+        capsys.readouterr()
+
+        assert run(parse_args(argv)) == 0
+        assert "Skipping 3 up-to-date" in capsys.readouterr().out
+        assert {p: p.stat().st_mtime_ns for p in out.rglob("*.png")} == mtimes
+
+        # a changed input only rebuilds its own chapter
+        page = next((library_dir / "chapter1").iterdir())
+        os.utime(page, ns=(page.stat().st_atime_ns, page.stat().st_mtime_ns + 10**9))
+        assert run(parse_args(argv)) == 0
+        rebuilt = {p for p in out.rglob("*.png") if p.stat().st_mtime_ns != mtimes[p]}
+        assert rebuilt and all(p.parent.name == "chapter1" for p in rebuilt)
+
+    def test_incremental_settings_change_removes_stale(self, chapter_dir, tmp_path):
+        out = tmp_path / "out"
+        argv = [str(chapter_dir), str(out), "-f", "png", "-m", "direct", "--no-progress"]
+
+        assert run(parse_args([*argv, "-H", "500"])) == 0
+        many = _outputs(out)
+        assert run(parse_args([*argv, "-H", "5000"])) == 0
+        few = _outputs(out)
+
+        assert len(few) < len(many)
+        assert all(h <= 5000 for _, (_, h) in few)
+
+    def test_metadata_reexports_stored_plan(self, chapter_dir, tmp_path):
+        out = tmp_path / "out"
+        common = [str(chapter_dir), str(out), "--no-progress"]
+
+        assert run(parse_args([*common, "-f", "png", "-H", "1500"])) == 0
+        pixel = [size for _, size in _outputs(out)]
+        assert run(parse_args([*common, "-f", "webp", "-m", "metadata"])) == 0
+        assert [size for _, size in _outputs(out)] == pixel
+        assert all(name.endswith(".webp") for name, _ in _outputs(out))
+
+    def test_metadata_without_plan_fails(self, chapter_dir, tmp_path):
+        args = parse_args([str(chapter_dir), str(tmp_path / "out"), "-f", "png", "-m", "metadata"])
+        assert run(args) == 1
+
+    @pytest.mark.parametrize("stream", [True, False])
+    def test_resume_continues_after_last_slice(self, chapter_dir, tmp_path, monkeypatch, stream):
+        clean = tmp_path / "clean"
+        out = tmp_path / "out"
+        common = ["-f", "png", "-m", "direct", "-H", "500", "--no-progress"]
+        assert run(parse_args([str(chapter_dir), str(clean), *common])) == 0
+
+        stitch_slice = Stitcher.stitch_slice
+        calls = []
+        crash_at = [4]
+
+        def counting(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == crash_at[0]:
+                raise MemoryError("killed")
+            return stitch_slice(*args, **kwargs)
+
+        # the first run dies while stitching, leaving only its staging directory
+        monkeypatch.setattr(Stitcher, "stitch_slice", counting)
+        assert run(parse_args([str(chapter_dir), str(out), *common, "--stream"])) == 1
+        assert _outputs(out) == []
+        journal = json.loads((out / ".chapter.partial" / ".stitching_metadata.json").read_text())
+        finished = len(journal["outputs"])
+        assert finished > 0
+
+        calls.clear()
+        crash_at[0] = None
+        flag = ["--stream"] if stream else []
+        assert run(parse_args([str(chapter_dir), str(out), *common, *flag, "--resume"])) == 0
+        assert len(calls) == len(_outputs(clean)) - finished
+        assert _outputs(out) == _outputs(clean)
+        assert not (out / ".chapter.partial").exists()
+
+    def test_dry_run_exports_usable_plan(self, chapter_dir, tmp_path, capsys):
+        plans = tmp_path / "plans"
+        out = tmp_path / "out"
+        direct = tmp_path / "direct"
+        common = ["-f", "png", "-H", "1500", "--width", "400", "--no-progress"]
+
+        argv = [str(chapter_dir), str(out), *common, "-m", "direct", "--export-plan", str(plans)]
+        assert run(parse_args(argv)) == 0
+        assert "outputs" in capsys.readouterr().out
+        assert not out.exists()
+
+        plan = plans / "chapter.json"
+        argv = [str(chapter_dir), str(out), *common, "-m", "metadata", "--plan", str(plan)]
+        assert run(parse_args(argv)) == 0
+        assert run(parse_args([str(chapter_dir), str(direct), *common, "-m", "direct"])) == 0
+        assert _outputs(out) == _outputs(direct)
+        assert len(_outputs(out)) == len(json.loads(plan.read_text())["outputs"])
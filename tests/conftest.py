@@ -3,10 +3,15 @@ from pathlib import Path
 import pytest
 from PIL import Image
 
-
 DATA_DIR = Path(__file__).parent / "data"
 
 
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keep on-disk caches out of the user's cache directory."""
+    monkeypatch.setenv("STITCHTOON_CACHE_DIR", str(tmp_path / "cache"))
+
+
 @pytest.fixture
 def test_images_files(data_dir: Path = DATA_DIR) -> list[str]:
     imgs_files = (
@@ -0,0 +1,23 @@
+import os
+
+import PIL.Image
+
+from stitchtoon.core.composite_cache import CompositeCache
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = CompositeCache(str(tmp_path))
+    images = {key: PIL.Image.effect_noise((64, 64), 64) for key in ("aa1", "bb2", "cc3")}
+    for i, (key, img) in enumerate(images.items()):
+        cache.put(key, img)
+        # entries written in order, a second apart
+        os.utime(cache._entry(key), (i, i))
+    entry_size = os.path.getsize(cache._entry("aa1"))
+
+    # reading an entry makes it the most recently used
+    assert cache.get("aa1") is not None
+    cache.max_size = 2 * entry_size
+    cache.put("dd4", images["aa1"])
+
+    kept = {key for key in (*images, "dd4") if cache.get(key) is not None}
+    assert kept == {"aa1", "dd4"}
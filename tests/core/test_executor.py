@@ -0,0 +1,115 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from stitchtoon.core import executor as executor_module
+from stitchtoon.core.executor import Executor, ExecutorType, available_cpus, get_executor
+from stitchtoon.core.image_io import ImageIO
+
+
+def _square(x):
+    return x * x
+
+
+def _fail(x):
+    raise ValueError(x)
+
+
+def _die(x):
+    os._exit(1)
+
+
+@pytest.fixture(params=list(ExecutorType))
+def executor(request):
+    return get_executor(request.param, 2)
+
+
+class TestExecutor:
+    def test_available_cpus(self):
+        assert available_cpus() >= 1
+
+    def test_backends_implement_submit(self):
+        with pytest.raises(TypeError):
+            Executor()
+
+    def test_map_keeps_order(self, executor):
+        assert executor.map(_square, range(20)) == [x * x for x in range(20)]
+
+    def test_imap_is_lazy(self, executor):
+        consumed = []
+
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+
+        results = executor.imap(_square, items(), lookahead=2)
+        assert next(results) == 0
+        assert len(consumed) <= 3
+        results.close()
+
+    def test_imap_unordered(self, executor):
+        assert sorted(executor.imap_unordered(_square, range(20))) == [x * x for x in range(20)]
+
+    def test_exception_propagates(self, executor):
+        with pytest.raises(ValueError):
+            executor.map(_fail, range(3))
+
+    def test_dead_worker_fails_its_tasks(self):
+        executor = get_executor(ExecutorType.PROCESS, 2)
+        with pytest.raises(BrokenProcessPool):
+            executor.map(_die, range(3))
+        # a fresh pool takes over
+        assert executor.map(_square, range(5)) == [x * x for x in range(5)]
+
+    def test_pool_is_recycled(self, monkeypatch):
+        monkeypatch.setattr(executor_module, "MAX_TASKS_PER_CHILD", 1)
+        executor = executor_module.ProcessExecutor(2)
+        try:
+            executor.map(_square, range(2))
+            first = executor.pool
+            assert executor.map(_square, range(5)) == [x * x for x in range(5)]
+            assert executor.pool is not first
+        finally:
+            executor.shutdown()
+
+    def test_discard(self, executor):
+        discarded = []
+        results = executor.imap(_square, range(10), lookahead=3, discard=discarded.append)
+        next(results)
+        results.close()
+        executor.shutdown()
+
+        assert all(x in [i * i for i in range(10)] for x in discarded)
+
+    def test_local(self):
+        process = get_executor(ExecutorType.PROCESS, 2)
+        thread = get_executor(ExecutorType.THREAD, 2)
+
+        assert not process.shares_memory
+        assert process.local().shares_memory
+        assert thread.local() is thread
+
+    def test_executor_is_reused(self, test_images_files):
+        executor = get_executor(ExecutorType.PROCESS, 2)
+        ImageIO.load_all(files=tuple(test_images_files), executor=executor)
+        pool = executor.pool
+        ImageIO.load_all(files=tuple(test_images_files), executor=executor)
+
+        assert get_executor(ExecutorType.PROCESS, 2) is executor
+        assert executor.pool is pool
+
+    def test_default_executor(self):
+        executor_module.set_default_executor(ExecutorType.SERIAL)
+        try:
+            assert get_executor().kind == ExecutorType.SERIAL
+        finally:
+            executor_module.set_default_executor(ExecutorType.PROCESS)
+
+    def test_load_all_backends(self, executor, test_images_files):
+        imgs = ImageIO.load_all(files=tuple(test_images_files), executor=executor)
+
+        assert [img.size for img in imgs] == [
+            ImageIO.image_size(image_file=imf) for imf in test_images_files
+        ]
@@ -1,9 +1,17 @@
+import os
+import zipfile
+from io import BytesIO
 from pathlib import Path
 
+import PIL.Image
 import pytest
+from PIL.Image import Image
+from psd_tools import PSDImage
 
+from stitchtoon.core.composite_cache import CompositeCache
+from stitchtoon.core.executor import ExecutorType, get_executor
 from stitchtoon.core.image_io import ImageIO
-from PIL.Image import Image
+from stitchtoon.exc import ImageTooLargeError
 
 
 class TestImageIO:
@@ -20,6 +28,61 @@ class TestImageIO:
         for img in imgs:
             assert isinstance(img, Image)
 
+    @pytest.mark.parametrize("executor", [ExecutorType.PROCESS, ExecutorType.THREAD])
+    def test_load_all_resizes(self, test_images_files, executor):
+        imgs = ImageIO.load_all(files=test_images_files, executor=get_executor(executor, 2), width=200)
+
+        for img, imf in zip(imgs, test_images_files):
+            width, height = ImageIO.image_size(image_file=imf)
+            assert img.size == (200, int(height / width * 200))
+
+    def test_iter_load(self, test_images_files):
+        imgs = list(ImageIO.iter_load(files=test_images_files, prefetch=1))
+
+        assert len(imgs) == len(test_images_files)
+        for img, imf in zip(imgs, test_images_files):
+            assert img.size == ImageIO.image_size(image_file=imf)
+
+    def test_load_psd_uses_merged_image(self, test_images_rgba, tmp_path, monkeypatch):
+        psd_file = tmp_path / "page.psd"
+        PSDImage.frompil(test_images_rgba[0].convert("RGBA")).save(psd_file)
+
+        def composite(*args, **kwargs):
+            raise AssertionError("composited a file with a merged image")
+
+        monkeypatch.setattr(PSDImage, "composite", composite)
+        img = ImageIO.load_image(image_file=psd_file)
+        assert img.size == test_images_rgba[0].size
+        assert img.mode == "RGBA" and img.format == "psd"
+
+    def test_load_psd_caches_composite(self, test_images_rgba, tmp_path, monkeypatch):
+        psd_file = tmp_path / "page.psd"
+        PSDImage.frompil(test_images_rgba[0].convert("RGBA")).save(psd_file)
+        composite = PSDImage.composite
+        psd_open = PSDImage.open
+        calls = []
+        opened = []
+
+        def counting(*args, **kwargs):
+            calls.append(1)
+            return composite(*args, **kwargs)
+
+        def opening(*args, **kwargs):
+            opened.append(1)
+            return psd_open(*args, **kwargs)
+
+        # a file saved without a merged image
+        monkeypatch.setattr(PSDImage, "has_preview", lambda self: False)
+        monkeypatch.setattr(PSDImage, "composite", counting)
+        monkeypatch.setattr(PSDImage, "open", opening)
+        cache = CompositeCache(str(tmp_path / "composites"))
+        first = ImageIO.load_image(image_file=psd_file, composite_cache=cache)
+        second = ImageIO.load_image(image_file=psd_file, composite_cache=cache)
+
+        # the cached composite is used without parsing the file
+        assert len(calls) == len(opened) == 1
+        assert second.tobytes() == first.tobytes() and second.format == "psd"
+
     def test_load_wrong_path_image(self):
         with pytest.raises(FileNotFoundError):
             ImageIO.load_image(image_file="0239sdfamFJSlamN4")
@@ -27,6 +90,54 @@ class TestImageIO:
     def test_load_archive(self, test_archive_file):
         ImageIO.load_archive(path=test_archive_file)
 
+    def test_iter_archive(self, test_archive_file):
+        headers = ImageIO.archive_headers(path=test_archive_file)
+        images = list(ImageIO.iter_archive(path=test_archive_file))
+        assert [(img.size, img.mode) for img in images] == headers
+        assert [img.tobytes() for img in images] == [
+            img.tobytes() for img in ImageIO.load_archive(path=test_archive_file)
+        ]
+
+    @pytest.mark.parametrize("kind", list(ExecutorType))
+    def test_load_archive_natural_order(self, tmp_path, kind):
+        archive = tmp_path / "pages.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            for height in (10, 2, 1):
+                buf = BytesIO()
+                PIL.Image.new("RGB", (4, height)).save(buf, "png")
+                zf.writestr(f"page{height}.png", buf.getvalue())
+
+        images = ImageIO.load_archive(path=archive, executor=get_executor(kind, 2))
+        assert [img.height for img in images] == [1, 2, 10]
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+    @pytest.mark.parametrize("stream", [False, True])
+    def test_load_archive_closes_handles(self, test_archive_file, stream):
+        def open_handles():
+            fds = os.listdir("/proc/self/fd")
+            return sum(os.path.realpath(f"/proc/self/fd/{fd}") == str(test_archive_file) for fd in fds)
+
+        executor = get_executor(ExecutorType.THREAD, 2)
+        if stream:
+            images = ImageIO.iter_archive(path=test_archive_file, executor=executor)
+            next(images)
+            assert open_handles() > 0
+            list(images)
+        else:
+            ImageIO.load_archive(path=test_archive_file, executor=executor)
+        assert open_handles() == 0
+
+    def test_load_archive_checks_crc(self, test_images_files, tmp_path):
+        archive = tmp_path / "pages.zip"
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf:
+            zf.write(test_images_files[0], "001.jpeg")
+        data = bytearray(archive.read_bytes())
+        data[-200] ^= 0xFF  # inside the member, before the central directory
+        archive.write_bytes(bytes(data))
+
+        with pytest.raises(zipfile.BadZipFile):
+            ImageIO.load_archive(path=archive)
+
     def test_save_image(self, test_images_rgb, tmp_path):
         img = test_images_rgb[0]
         ImageIO.save_image(out=tmp_path / "01", image=img, format="jpeg", quality=80)
@@ -45,6 +156,23 @@ class TestImageIO:
             quality=80,
         )
 
+    @pytest.mark.parametrize(
+        "format, compression",
+        [("jpeg", zipfile.ZIP_STORED), ("bmp", zipfile.ZIP_DEFLATED)],
+    )
+    def test_archive_images_compression(self, test_images_rgb, tmp_path, format, compression):
+        out = tmp_path / "images.zip"
+        images = [img.convert("RGB") for img in test_images_rgb] * 3
+        ImageIO.archive_images(
+            out=out, images=images, format=format, executor=get_executor(ExecutorType.THREAD, 2)
+        )
+
+        with zipfile.ZipFile(out) as zf:
+            infos = zf.infolist()
+            assert [i.filename for i in infos] == [f"{n:03}.{format}" for n in range(1, 7)]
+            assert {i.compress_type for i in infos} == {compression}
+            assert [PIL.Image.open(zf.open(i)).size for i in infos] == [img.size for img in images]
+
     def test_archive_images_to_wrong_path(self, test_images_rgb):
         with pytest.raises(FileNotFoundError):
             ImageIO.archive_images(
@@ -62,6 +190,11 @@ class TestImageIO:
             convert_modes=True,
         )
 
+    @pytest.mark.parametrize("format, mode", [("jpeg", "L"), ("png", "L"), ("webp", "RGB")])
+    def test_save_all_keeps_compatible_modes(self, test_images_rgb, tmp_path, format, mode):
+        paths = ImageIO.save_all(out=tmp_path, images=test_images_rgb, format=format)
+        assert [PIL.Image.open(p).mode for p in paths] == [mode] * len(test_images_rgb)
+
     def test_save_image_RGBA_to_RGB_no_convert(self, test_images_rgba, tmp_path):
         for img in test_images_rgba:
             if img.mode == "RGBA":
@@ -71,3 +204,49 @@ class TestImageIO:
                         image=img,
                         format="jpeg",
                     )
+
+    def test_image_writer(self, test_images_rgba, tmp_path):
+        with ImageIO.open_writer(out=tmp_path, format="jpeg", max_pending=1) as writer:
+            for img in test_images_rgba:
+                writer.write(img)
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            f"{i:03}.jpeg" for i in range(1, len(test_images_rgba) + 1)
+        ]
+
+    def test_image_writer_archive(self, test_images_rgb, tmp_path):
+        out = tmp_path / "images.zip"
+        with ImageIO.open_writer(out=out, format="png", archive=True) as writer:
+            for img in test_images_rgb:
+                writer.write(img)
+
+        with zipfile.ZipFile(out) as zf:
+            assert zf.namelist() == [
+                f"{i:03}.png" for i in range(1, len(test_images_rgb) + 1)
+            ]
+
+    @pytest.mark.parametrize("archive", [False, True])
+    def test_image_writer_copy(self, test_images_rgb, test_archive_file, tmp_path, archive):
+        page = test_images_rgb[0].filename
+        out = tmp_path / "images.zip" if archive else tmp_path
+        with ImageIO.open_writer(out=out, format="jpeg", archive=archive) as writer:
+            writer.write(test_images_rgb[1])
+            writer.copy(page)
+            writer.copy(test_archive_file, "02.jpeg")
+
+        if archive:
+            with zipfile.ZipFile(out) as zf:
+                written = [zf.read(name) for name in zf.namelist()]
+        else:
+            written = [p.read_bytes() for p in sorted(out.glob("*.jpeg"))]
+        with zipfile.ZipFile(test_archive_file) as zf:
+            member = zf.read("02.jpeg")
+        assert written[1:] == [Path(page).read_bytes(), member]
+
+    def test_image_header_rejects_oversized(self, tmp_path):
+        huge = tmp_path / "huge.png"
+        PIL.Image.new("1", (8, 100_001)).save(huge)
+        with pytest.raises(ImageTooLargeError):
+            ImageIO.image_header(image_file=str(huge))
+        with pytest.raises(ImageTooLargeError):
+            ImageIO.check_size((60_000, 60_000))
@@ -1,3 +1,6 @@
+import PIL.Image
+import PIL.ImageChops
+import PIL.ImageStat
 import pytest
 
 from stitchtoon.core.image_manipulator import ImageManipulator
@@ -25,6 +28,22 @@ class TestImageManipulator:
         assert ImageManipulator.convert_mode(rgb, "RGBA").mode == "RGBA"
         assert ImageManipulator.convert_mode(rgba, "RGB").mode == "RGB"
 
+    def test_convert_mode_only_incompatible(self, test_images_rgb):
+        gray = test_images_rgb[0]
+        assert ImageManipulator.convert_mode(gray, "L") is gray
+
+        rgba = PIL.Image.new("RGBA", (4, 4), (0, 0, 0, 0))
+        rgba.putpixel((1, 1), (10, 20, 30, 255))
+        rgb = ImageManipulator.convert_mode(rgba, "RGB")
+        assert rgb.getpixel((0, 0)) == (255, 255, 255)
+        assert rgb.getpixel((1, 1)) == (10, 20, 30)
+        assert ImageManipulator.convert_mode(rgba, "L").getpixel((0, 0)) == 255
+
+        # palette transparency
+        p = rgba.convert("P")
+        p.info["transparency"] = p.getpixel((0, 0))
+        assert ImageManipulator.convert_mode(p, "RGB").getpixel((0, 0)) == (255, 255, 255)
+
     def test_resize_all_width_fixed_enforce(self, test_images):
         old_width = [im.width for im in test_images]
         new_width = old_width[0] // 2
@@ -38,3 +57,20 @@ class TestImageManipulator:
 
         for i in range(len(imgs) - 1):
             assert imgs[i].width == imgs[i + 1].width
+
+    def test_resize_all_width_keeps_images_at_width(self, test_images_rgb):
+        imgs = ImageManipulator.resize_all_width(test_images_rgb)
+
+        assert all(new is old for new, old in zip(imgs, test_images_rgb))
+
+    def test_resize_reducing_gap(self, test_images_files):
+        jpeg = test_images_files[0]
+        exact = ImageManipulator.resize(PIL.Image.open(jpeg), width=180)
+        lazy = PIL.Image.open(jpeg)
+        fast = ImageManipulator.resize(lazy, width=180, reducing_gap=2.0)
+
+        assert fast.size == exact.size
+        # decoded at a reduced scale, still at least twice the target width
+        assert 360 <= lazy.width < 728
+        diff = PIL.ImageChops.difference(fast.convert("L"), exact.convert("L"))
+        assert PIL.ImageStat.Stat(diff).mean[0] < 2
@@ -0,0 +1,42 @@
+import os
+
+from stitchtoon.const import METADATA_FILENAME
+from stitchtoon.core.manifest import Manifest, fingerprint, fingerprint_all, manifest_path
+
+
+class TestManifest:
+    def test_fingerprint(self, test_images_files):
+        fp = fingerprint(test_images_files[0], content_hash=True)
+
+        assert fp["size"] == os.path.getsize(test_images_files[0])
+        assert len(fp["sha256"]) == 64
+
+    def test_manifest_path(self, tmp_path):
+        assert manifest_path(tmp_path / "out") == str(tmp_path / "out" / METADATA_FILENAME)
+        assert manifest_path(tmp_path / "out.zip", archive=True) == str(
+            tmp_path / f".out.zip{METADATA_FILENAME}"
+        )
+
+    def test_save_load(self, tmp_path):
+        path = tmp_path / METADATA_FILENAME
+        manifest = Manifest(inputs={"a.png": {"size": 1}}, settings={"height": 10}, outputs=["001.png"])
+        manifest.save(path)
+
+        assert Manifest.load(path) == manifest
+        assert Manifest.load(tmp_path / "missing.json") is None
+
+    def test_is_up_to_date(self, tmp_path, test_images_files):
+        (tmp_path / "001.png").touch()
+        path = tmp_path / METADATA_FILENAME
+        inputs = fingerprint_all(test_images_files)
+        manifest = Manifest(inputs=inputs, settings={"height": 10}, outputs=["001.png"])
+
+        assert manifest.is_up_to_date(inputs, {"height": 10}, path)
+        assert not manifest.is_up_to_date(inputs, {"height": 20}, path)
+        assert not manifest.is_up_to_date(fingerprint_all(test_images_files[1:]), {"height": 10}, path)
+
+        changed = {k: dict(v, size=v["size"] + 1) for k, v in inputs.items()}
+        assert not manifest.is_up_to_date(changed, {"height": 10}, path)
+
+        os.remove(tmp_path / "001.png")
+        assert not manifest.is_up_to_date(inputs, {"height": 10}, path)
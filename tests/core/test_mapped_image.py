@@ -0,0 +1,70 @@
+import pickle
+
+import numpy as np
+import PIL.Image
+import pytest
+
+from stitchtoon.core.image_io import ImageIO
+from stitchtoon.core.mapped_image import MappedImage
+from stitchtoon.core.slices_detectors.slices_detector import SlicesDetector
+
+
+@pytest.fixture
+def page(test_images_rgba):
+    # RGB with some real content, tall enough to slice
+    img = test_images_rgba[0].convert("RGB")
+    return img.resize((img.width, img.height * 3))
+
+
+def _save(img, tmp_path, format, mode, **params):
+    path = tmp_path / f"page.{format}"
+    img.convert(mode).save(path, format, **params)
+    return path
+
+
+class TestMappedImage:
+    @pytest.mark.parametrize(
+        "format, mode",
+        [("bmp", "RGB"), ("bmp", "L"), ("tga", "RGBA"), ("tiff", "RGB"), ("tiff", "L")],
+    )
+    def test_crop_matches_decoded(self, page, tmp_path, format, mode):
+        path = _save(page, tmp_path, format, mode)
+        img = ImageIO.load_image(image_file=path)
+        decoded = PIL.Image.open(path)
+        box = (3, 17, img.width - 5, img.height // 2)
+
+        assert isinstance(img, MappedImage) and img.is_mapped
+        assert img.crop(box).tobytes() == decoded.crop(box).tobytes()
+        assert img.is_mapped
+        assert np.array_equal(img.gray(), np.array(decoded.convert("L")))
+        small = decoded.resize((img.width // 3, img.height // 3), PIL.Image.Resampling.NEAREST)
+        assert np.array_equal(img.gray(3), np.array(small.convert("L")))
+
+        assert img.tobytes() == decoded.tobytes()
+        assert not img.is_mapped
+
+    @pytest.mark.parametrize(
+        "format, params", [("tiff", {"compression": "tiff_lzw"}), ("tga", {"compression": "tga_rle"})]
+    )
+    def test_compressed_files_are_decoded(self, page, tmp_path, format, params):
+        img = ImageIO.load_image(image_file=_save(page, tmp_path, format, "RGB", **params))
+        assert not isinstance(img, MappedImage)
+
+    def test_pickles_as_reference(self, page, tmp_path):
+        img = ImageIO.load_image(image_file=_save(page, tmp_path, "bmp", "RGB"))
+        data = pickle.dumps(img)
+
+        assert len(data) < 1000
+        copy = pickle.loads(data)
+        assert copy.is_mapped and copy.tobytes() == img.tobytes()
+
+    def test_detection_matches_decoded(self, page, tmp_path):
+        path = _save(page, tmp_path, "bmp", "RGB")
+        mapped = [ImageIO.load_image(image_file=path)]
+        decoded = [PIL.Image.open(path)]
+
+        for df in (1, 2):
+            kwargs = dict(method="pixel", height=500, division_factor=df)
+            expected = SlicesDetector.slice_points(decoded, **kwargs)
+            assert SlicesDetector.slice_points(mapped, **kwargs) == expected
+        assert mapped[0].is_mapped
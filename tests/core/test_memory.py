@@ -0,0 +1,64 @@
+import pytest
+
+from stitchtoon.core.image_io import ImageIO
+from stitchtoon.core.memory import (
+    MAX_PREFETCH,
+    MIN_PREFETCH,
+    estimate,
+    parse_size,
+    pixel_bytes,
+    plan,
+)
+
+
+class TestMemory:
+    def test_parse_size(self):
+        assert parse_size("512") == 512
+        assert parse_size("4k") == 4 << 10
+        assert parse_size("1.5G") == 3 << 29
+        assert parse_size("24GiB") == 24 << 30
+        with pytest.raises(ValueError):
+            parse_size("lots")
+
+    def test_estimate_from_headers(self, test_images_files, test_images):
+        headers = [ImageIO.image_header(image_file=f) for f in test_images_files]
+        assert headers == [(img.size, img.mode) for img in test_images]
+
+        chapter = estimate(headers, width=400, height=1000)
+        assert chapter.native == sum(pixel_bytes(img.size, img.mode) for img in test_images)
+        assert chapter.slice == 400 * 1000 * 4
+        # resized pages keep their mode
+        assert chapter.resized == sum(
+            pixel_bytes((400, round(img.height * 400 / img.width)), img.mode) for img in test_images
+        )
+
+    def test_estimate_gray_chapter(self):
+        chapter = estimate([((800, 12_000), "L")] * 10, width=400, height=1000)
+        assert chapter.resized == 10 * 400 * 6000
+        assert chapter.slice == 400 * 1000
+
+    def test_estimate_deferred_resize(self):
+        headers = [((800, 12_000), "RGB")] * 10
+        chapter = estimate(headers, width=400)
+        deferred = estimate(headers, width=400, deferred_resize=True)
+        assert chapter.batch - deferred.batch == chapter.resized
+
+    def test_plan(self):
+        chapter = estimate([((800, 12_000), "RGB")] * 100, width=400)
+        assert chapter.batch > chapter.stream(MAX_PREFETCH, 2)
+
+        roomy = plan(chapter, chapter.batch)
+        assert not roomy.stream and roomy.reserved == chapter.batch
+
+        tight = plan(chapter, chapter.batch - 1)
+        assert tight.stream and MIN_PREFETCH <= tight.prefetch <= MAX_PREFETCH
+        assert tight.reserved <= chapter.batch - 1
+
+        starved = plan(chapter, 1)
+        assert starved.stream and starved.prefetch == MIN_PREFETCH
+
+    def test_plan_keeps_short_chapters_in_batch(self):
+        # one huge page: streaming would hold more than the whole chapter
+        chapter = estimate([((800, 60_000), "RGB"), ((800, 100), "RGB")], width=800)
+        assert chapter.stream(MIN_PREFETCH, 2) > chapter.batch
+        assert not plan(chapter, 1).stream
@@ -0,0 +1,23 @@
+from stitchtoon.core.image_io import ImageHeader, ImageIO
+from stitchtoon.core.image_manipulator import ImageManipulator
+from stitchtoon.core.planner import plan_slices
+from stitchtoon.core.slices_detectors.slices_detector import DetectionMethod, SlicesDetector
+
+
+class TestPlanner:
+    def test_plan_matches_decoded(self, test_images_files, test_images):
+        headers = [ImageIO.image_header(image_file=f) for f in test_images_files]
+        plan = plan_slices(headers, "png", DetectionMethod.DIRECT, height=700, width=400)
+
+        resized = ImageManipulator.resize_all_width(test_images, value=400)
+        slices = SlicesDetector.slice_points(resized, method=DetectionMethod.DIRECT, height=700)
+        assert [s.points for s in plan.slices] == [s.points for s in slices]
+        assert [size for _, size in plan.outputs] == [s.size for s in slices]
+        assert plan.outputs[0][0] == "001.png"
+        assert not plan.violations
+
+    def test_plan_reports_format_limits(self):
+        headers = [ImageHeader((800, 15_000), "RGB")] * 3
+        plan = plan_slices(headers, "webp", DetectionMethod.DIRECT, height=20_000)
+        assert len(plan.outputs) == 3
+        assert len(plan.violations) == 2 and "16383" in plan.violations[0]
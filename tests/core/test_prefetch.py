@@ -0,0 +1,45 @@
+import pytest
+
+from stitchtoon.core.image_io import ImageIO
+from stitchtoon.core.prefetch import PrefetchReader, read_file
+
+
+def test_read_file_in_chunks(tmp_path):
+    path = tmp_path / "page.bin"
+    path.write_bytes(bytes(range(256)) * 100)
+    assert read_file(path, chunk_size=1000) == path.read_bytes()
+
+
+@pytest.mark.parametrize("depth, workers", [(1, 1), (2, 4), (8, 3)])
+def test_iter_read_in_order(test_images_files, depth, workers):
+    reader = PrefetchReader(depth=depth, workers=workers, chunk_size=4096)
+    read = list(reader.iter_read(test_images_files))
+
+    assert [path for path, _ in read] == list(test_images_files)
+    assert [data for _, data in read] == [imf.read_bytes() for imf in test_images_files]
+
+
+def test_iter_read_stops_early(test_images_files):
+    reader = PrefetchReader(depth=2)
+    for path, data in reader.iter_read(test_images_files):
+        break
+    assert data == test_images_files[0].read_bytes()
+
+
+def test_iter_read_raises_missing_file(test_images_files, tmp_path):
+    files = [test_images_files[0], tmp_path / "missing.png"]
+    read = PrefetchReader().iter_read(files)
+    assert next(read)[0] == files[0]
+    with pytest.raises(FileNotFoundError):
+        next(read)
+
+
+def test_load_all_with_reader(test_images_files):
+    files = tuple(test_images_files)
+    expected = ImageIO.load_all(files=files)
+    loaded = ImageIO.load_all(files=files, reader=PrefetchReader(depth=2))
+
+    assert [img.tobytes() for img in loaded] == [img.tobytes() for img in expected]
+    assert [img.tobytes() for img in ImageIO.iter_load(files=files, reader=PrefetchReader())] == [
+        img.tobytes() for img in expected
+    ]
@@ -0,0 +1,126 @@
+import tracemalloc
+from io import BytesIO
+
+import PIL.Image
+import pytest
+
+from stitchtoon.core.image_io import ImageIO
+from stitchtoon.core.row_writer import RowWriter, open_row_writer, writes_by_rows
+from stitchtoon.core.slices_detectors.slice import Slice
+from stitchtoon.core.stitcher import Stitcher
+
+
+@pytest.fixture
+def page(test_images_rgba):
+    return test_images_rgba[0].convert("RGBA")
+
+
+@pytest.mark.parametrize("format", ["png", "tiff", "bmp"])
+@pytest.mark.parametrize("mode", ["L", "RGB", "RGBA"])
+def test_rows_decode_as_written(page, format, mode):
+    img = page.convert(mode)
+    fp = BytesIO()
+    with open_row_writer(fp, img.size, mode, format) as writer:
+        for top in range(0, img.height, 100):
+            writer.write(img.crop((0, top, img.width, min(top + 100, img.height))))
+
+    written = PIL.Image.open(BytesIO(fp.getvalue()))
+    assert written.format == format.upper()
+    assert written.size == img.size
+    assert written.convert(mode).tobytes() == img.tobytes()
+
+
+def test_png_is_compressed(page):
+    img = page.convert("RGB")
+    fp = BytesIO()
+    with open_row_writer(fp, img.size, "RGB", "png", compress_level=1) as writer:
+        writer.write(img)
+    assert len(fp.getvalue()) < len(img.tobytes()) // 2
+
+
+def test_missing_rows_are_rejected(page):
+    writer = open_row_writer(BytesIO(), page.size, "RGBA", "png")
+    writer.write(page.crop((0, 0, page.width, 10)))
+    with pytest.raises(ValueError):
+        writer.close()
+
+
+def test_png_filters_in_small_chunks(page):
+    img = page.resize((2048, 2048))
+    fp = BytesIO()
+    with open_row_writer(fp, img.size, "RGBA", "png", compress_level=1) as writer:
+        tracemalloc.start()
+        try:
+            writer.write(img)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    # the band's pixels as Pillow hands them out, not filtered copies of them
+    assert peak < 2.5 * len(img.tobytes())
+    assert PIL.Image.open(BytesIO(fp.getvalue())).tobytes() == img.tobytes()
+
+
+def test_tall_tiff(page):
+    img = page.convert("L").resize((4, 20_000))
+    fp = BytesIO()
+    with open_row_writer(fp, img.size, "L", "tiff") as writer:
+        writer.write(img)
+    assert PIL.Image.open(BytesIO(fp.getvalue())).tobytes() == img.tobytes()
+
+
+def test_writes_by_rows():
+    assert writes_by_rows("png", (2000, 20_000))
+    assert not writes_by_rows("png", (800, 1200))
+    assert not writes_by_rows("jpeg", (2000, 20_000))
+
+
+@pytest.mark.parametrize("archive", [False, True])
+@pytest.mark.parametrize("format", ["png", "bmp"])
+def test_write_slice_matches_write(test_images_rgb, tmp_path, archive, format):
+    images = [img.convert("RGB") for img in test_images_rgb]
+    s = Slice()
+    s.add((0, 100, images[0].height))
+    s.add((1, 0, 700))
+    s.width = images[0].width
+
+    paths = {}
+    for kind in ("write", "write_slice"):
+        out = tmp_path / (f"{kind}.zip" if archive else kind)
+        if not archive:
+            out.mkdir()
+        with ImageIO.open_writer(out=out, format=format, archive=archive) as writer:
+            if kind == "write":
+                writer.write(Stitcher.stitch_slice(images, s))
+            else:
+                writer.write_slice(images, s)
+        paths[kind] = out if archive else out / f"001.{format}"
+
+    if archive:
+        expected, written = (ImageIO.load_archive(path=paths[k])[0] for k in ("write", "write_slice"))
+    else:
+        expected, written = (PIL.Image.open(paths[k]) for k in ("write", "write_slice"))
+    assert written.size == s.size
+    assert written.mode == expected.mode
+    assert written.tobytes() == expected.tobytes()
+
+
+def test_iter_bands_stack_to_slice(test_images_rgb):
+    s = Slice()
+    s.add((0, 500, test_images_rgb[0].height))
+    s.add((1, 0, 900))
+    s.width = test_images_rgb[0].width
+
+    stitched = Stitcher.stitch_slice(test_images_rgb, s)
+    bands = list(Stitcher.iter_bands(test_images_rgb, s, band_pixels=s.width * 300))
+    assert [b.height for b in bands] == [300, 300, 300, 300, s.size[1] - 1200]
+    stacked = PIL.Image.new("RGBA", s.size)
+    top = 0
+    for band in bands:
+        stacked.paste(band, (0, top))
+        top += band.height
+    assert stacked.tobytes() == stitched.tobytes()
+
+
+def test_writers_implement_write():
+    with pytest.raises(TypeError):
+        RowWriter(BytesIO(), (1, 1), "L")
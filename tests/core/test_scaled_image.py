@@ -0,0 +1,60 @@
+import numpy as np
+import PIL.Image
+import pytest
+
+from stitchtoon.core.scaled_image import ScaledImage, scale_rows, scaled
+from stitchtoon.core.slices_detectors.slices_detector import DetectionMethod, SlicesDetector
+
+
+@pytest.fixture
+def page(test_images_rgba):
+    return test_images_rgba[0].convert("RGB")
+
+
+def _max_diff(a, b):
+    return np.abs(np.asarray(a, dtype=np.int16) - np.asarray(b, dtype=np.int16)).max()
+
+
+class TestScaledImage:
+    @pytest.mark.parametrize("width", [300, 1000])
+    def test_crop_matches_resize(self, page, width):
+        img = scaled(page, width)
+        resized = page.resize(img.size, PIL.Image.Resampling.LANCZOS)
+
+        assert isinstance(img, ScaledImage) and img.is_scaled
+        for box in [(0, 0, width, img.height), (0, 17, width, img.height // 3), (5, 40, width - 7, 90)]:
+            crop = img.crop(box)
+            assert crop.size == (box[2] - box[0], box[3] - box[1])
+            assert _max_diff(crop, resized.crop(box)) <= 1
+        assert img.is_scaled
+
+        assert _max_diff(img, resized) == 0
+        assert not img.is_scaled
+
+    def test_scaled_keeps_images_at_width(self, page):
+        assert scaled(page, page.width) is page
+
+    def test_scale_rows(self):
+        valid = np.ones(100, bool)
+        valid[40] = False
+
+        # halved: a resized row mostly samples 2 rows of the page on each side
+        rows = scale_rows(valid, 0.5, 50)
+        assert list(np.flatnonzero(~rows)) == [19, 20]
+        # doubled: 1 row of the page on each side
+        rows = scale_rows(valid, 2.0, 200)
+        assert list(np.flatnonzero(~rows)) == list(range(78, 84))
+
+    def test_pixel_detection_on_pages(self, test_images_rgb):
+        width = 400
+        pages = [scaled(img, width) for img in test_images_rgb]
+        resized = [img.resize(p.size, PIL.Image.Resampling.LANCZOS) for img, p in zip(test_images_rgb, pages)]
+
+        for df in (1, 2):
+            slices = SlicesDetector.slice_points(
+                pages, method=DetectionMethod.PIXEL, height=500, division_factor=df
+            )
+            assert sum(s.height for s in slices) == sum(img.height for img in resized)
+            assert all(s.width == width for s in slices)
+        # detection read the pages themselves
+        assert all(page.is_scaled for page in pages)
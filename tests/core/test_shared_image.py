@@ -0,0 +1,77 @@
+import os
+
+import PIL.Image
+import pytest
+
+from stitchtoon.core import shared_image
+from stitchtoon.core.image_io import ImageIO
+from stitchtoon.core.shared_image import SHM_DIR, SharedImage, discard, share, unshare
+
+
+def _shm_files():
+    return {f for f in os.listdir(SHM_DIR) if f.startswith("stitchtoon-")}
+
+
+class TestSharedImage:
+    @pytest.mark.parametrize("mode", ["L", "RGB", "RGBA", "CMYK"])
+    def test_roundtrip(self, test_images, mode):
+        before = _shm_files()
+        img = test_images[0].convert(mode)
+        ref = share(img)
+
+        assert isinstance(ref, SharedImage)
+        shared = unshare(ref)
+        assert shared.mode == mode
+        assert shared.tobytes() == img.tobytes()
+        # mapped from shared memory, except RGB that is copied out of it
+        assert shared.readonly == (mode != "RGB")
+        assert _shm_files() == before
+
+    def test_share_copies_by_bands(self, monkeypatch):
+        img = PIL.Image.effect_noise((512, 3000), 64).convert("RGB")
+        tobytes = PIL.Image.Image.tobytes
+        sizes = []
+
+        def tracked(self, *args, **kwargs):
+            data = tobytes(self, *args, **kwargs)
+            sizes.append(len(data))
+            return data
+
+        monkeypatch.setattr(PIL.Image.Image, "tobytes", tracked)
+        ref = share(img)
+        monkeypatch.undo()
+
+        assert len(sizes) > 1 and max(sizes) <= shared_image._BAND_BYTES
+        assert unshare(ref).tobytes() == img.tobytes()
+
+    def test_unsupported_mode_passthrough(self):
+        img = PIL.Image.new("P", (10, 10))
+        assert share(img) is img
+        assert unshare(img) is img
+
+    def test_shared_image_is_copy_on_write(self, test_images_rgb):
+        shared = unshare(share(test_images_rgb[0].convert("RGB")))
+        shared.paste((0, 0, 0), (0, 0, 10, 10))
+
+        assert shared.getpixel((0, 0)) == (0, 0, 0)
+
+    def test_discard(self, test_images_rgb):
+        before = _shm_files()
+        discard(share(test_images_rgb[0]))
+
+        assert _shm_files() == before
+
+    def test_load_all_keeps_format(self, test_images_files):
+        before = _shm_files()
+        imgs = ImageIO.load_all(files=tuple(test_images_files), shared_memory=True)
+
+        for img, imf in zip(imgs, test_images_files):
+            assert img.format == PIL.Image.open(imf).format
+        assert _shm_files() == before
+
+    def test_save_all_shared_memory(self, test_images_rgb, tmp_path):
+        before = _shm_files()
+        ImageIO.save_all(out=tmp_path, images=test_images_rgb, format="png", shared_memory=True)
+
+        assert len(list(tmp_path.iterdir())) == len(test_images_rgb)
+        assert _shm_files() == before
@@ -1,9 +1,11 @@
+import json
 import random
 
 import PIL.Image
 import pytest
 
-from stitchtoon.core.slices_detectors.slices_detector import SlicesDetector, DetectionMethod
+from stitchtoon.core.slices_detectors.slice_cache import SliceCache
+from stitchtoon.core.slices_detectors.slices_detector import DetectionMethod, SlicesDetector
 
 
 class TestSlicesDetector:
@@ -153,3 +155,106 @@ class TestSlicesDetector:
             assert sum(sp.height for sp in slices) == total_h, (
                 f"window={window}: coverage mismatch on solid image"
             )
+
+    def test_pixel_draft_decodes_jpeg(self, test_images_files):
+        jpegs = [PIL.Image.open(f) for f in test_images_files if f.suffix == ".jpeg"]
+        total_h = sum(img.height for img in jpegs)
+        slices = SlicesDetector.slice_points(
+            images=jpegs, height=500, method=DetectionMethod.PIXEL, division_factor=4
+        )
+        assert sum(sp.height for sp in slices) == total_h
+        # detection used its own reduced decode; the pages are still undecoded
+        assert all(img.tile for img in jpegs)
+
+    # ------------------------------------------------------------------
+    # lazy detection
+    # ------------------------------------------------------------------
+
+    def test_iter_slice_points_matches_slice_points(self, test_images):
+        for method, params in (
+            (DetectionMethod.DIRECT, {}),
+            (DetectionMethod.PIXEL, {"window": 3}),
+        ):
+            expected = SlicesDetector.slice_points(
+                images=test_images, height=700, method=method, **params
+            )
+            lazy = SlicesDetector.iter_slice_points(
+                iter(test_images), height=700, method=method, **params
+            )
+            assert [s.points for s in lazy] == [s.points for s in expected]
+
+    # ------------------------------------------------------------------
+    # slice cache and stored cut plans
+    # ------------------------------------------------------------------
+
+    def test_cache_reuses_slices(self, test_images, tmp_path, monkeypatch):
+        cache = SliceCache(str(tmp_path))
+        key = SliceCache.key({"01.jpeg": {"size": 1}}, None, DetectionMethod.PIXEL, 700)
+        expected = SlicesDetector.slice_points(
+            images=test_images, height=700, cache=cache, cache_key=key
+        )
+
+        def fail(*args, **kwargs):
+            raise AssertionError("detection ran despite a cached result")
+
+        monkeypatch.setattr(SlicesDetector, "_detect", fail)
+        monkeypatch.setattr(SlicesDetector, "_iter_detect", fail)
+        cached = SlicesDetector.slice_points(
+            images=test_images, height=700, cache=cache, cache_key=key
+        )
+        lazy = SlicesDetector.iter_slice_points(
+            iter(test_images), height=700, cache=cache, cache_key=key
+        )
+        assert [s.points for s in cached] == [s.points for s in expected]
+        assert [s.points for s in lazy] == [s.points for s in expected]
+
+    def test_cache_key_depends_on_params(self):
+        inputs = {"01.jpeg": {"size": 1, "mtime_ns": 2}}
+        key = SliceCache.key(inputs, 800, DetectionMethod.PIXEL, 700, window=1)
+        assert key == SliceCache.key(inputs, 800, DetectionMethod.PIXEL, 700, window=1)
+        assert key != SliceCache.key(inputs, 800, DetectionMethod.PIXEL, 700, window=2)
+        assert key != SliceCache.key(inputs, 600, DetectionMethod.PIXEL, 700, window=1)
+
+    def test_metadata_slice_points(self, test_images, tmp_path):
+        expected = SlicesDetector.slice_points(
+            images=test_images, height=700, method=DetectionMethod.DIRECT
+        )
+        plan = tmp_path / "plan.json"
+        plan.write_text(json.dumps({"slices": [s.to_dict() for s in expected]}))
+
+        slices = SlicesDetector.slice_points(
+            images=test_images, method=DetectionMethod.METADATA, path=plan
+        )
+        assert [s.points for s in slices] == [s.points for s in expected]
+        assert [s.size for s in slices] == [s.size for s in expected]
+
+        with pytest.raises(ValueError):
+            SlicesDetector.slice_points(
+                images=test_images[:-1], method=DetectionMethod.METADATA, path=plan
+            )
+
+    def test_slice_points_from_start(self, test_images, tmp_path):
+        plan = tmp_path / "plan.json"
+        for method, params in (
+            (DetectionMethod.DIRECT, {}),
+            (DetectionMethod.PIXEL, {"window": 3}),
+            (DetectionMethod.METADATA, {"path": plan}),
+        ):
+            # the stored plan replayed by the metadata method is a direct one
+            detect = DetectionMethod.DIRECT if method == DetectionMethod.METADATA else method
+            expected = SlicesDetector.slice_points(
+                images=test_images, height=700, method=detect, **({} if "path" in params else params)
+            )
+            plan.write_text(json.dumps({"slices": [s.to_dict() for s in expected]}))
+
+            for done in range(1, len(expected)):
+                idx, _, end = expected[done - 1].points[-1]
+                start = (idx, end)
+                slices = SlicesDetector.slice_points(
+                    images=test_images[idx:], height=700, method=method, start=start, **params
+                )
+                lazy = SlicesDetector.iter_slice_points(
+                    iter(test_images[idx:]), height=700, method=method, start=start, **params
+                )
+                assert [s.points for s in slices] == [s.points for s in expected[done:]]
+                assert [s.points for s in lazy] == [s.points for s in expected[done:]]
@@ -1,5 +1,14 @@
-from stitchtoon.core.slices_detectors.slices_detector import SlicesDetector, DetectionMethod
-from stitchtoon.core.stitcher import Stitcher
+import weakref
+
+import numpy as np
+import PIL.Image
+import pytest
+
+from stitchtoon.core.executor import get_executor
+from stitchtoon.core.image_manipulator import ImageManipulator
+from stitchtoon.core.slices_detectors.slice import Slice
+from stitchtoon.core.slices_detectors.slices_detector import DetectionMethod, SlicesDetector
+from stitchtoon.core.stitcher import StitchBackend, Stitcher
 
 
 class TestStitcher:
@@ -10,3 +19,91 @@ class TestStitcher:
         assert len(images) == len(slices)
         for i in range(len(slices)):
             assert images[i].height == slices[i].height
+
+    def test_stitch_slice_from_mapping(self, test_images):
+        slices = SlicesDetector.slice_points(test_images, height=2000, method=DetectionMethod.DIRECT)
+        for s in slices:
+            used = {p[0]: test_images[p[0]] for p in s.points}
+            img = Stitcher.stitch_slice(used, s)
+            assert img.height == s.height
+
+    @pytest.mark.parametrize(
+        "modes, mode",
+        [(["L", "L"], "L"), (["L", "RGB"], "RGB"), (["RGB", "P"], "RGBA"), (["L", "LA"], "RGBA"), ([], "RGBA")],
+    )
+    def test_stitch_mode(self, modes, mode):
+        assert Stitcher.stitch_mode(modes) == mode
+
+    def test_stitch_gray_pages_in_gray(self, test_images_rgb):
+        slices = SlicesDetector.slice_points(test_images_rgb, height=1500, method=DetectionMethod.DIRECT)
+        mode = Stitcher.stitch_mode(img.mode for img in test_images_rgb)
+        gray = Stitcher.stitch(test_images_rgb, slices, mode=mode)
+        rgba = Stitcher.stitch(test_images_rgb, slices)
+
+        assert mode == "L"
+        for g, c in zip(gray, rgba):
+            assert g.mode == "L"
+            assert g.tobytes() == c.convert("L").tobytes()
+
+    @pytest.mark.parametrize("mode", ["RGBA", "RGB", "L"])
+    def test_numpy_backend_matches_pil(self, test_images, mode):
+        images = ImageManipulator.resize_all_width(test_images, value=500)
+        slices = SlicesDetector.slice_points(images, height=1200, method=DetectionMethod.DIRECT)
+        expected = Stitcher.stitch(images, slices, mode=mode)
+        stitched = Stitcher.stitch(images, slices, mode=mode, backend=StitchBackend.NUMPY)
+
+        assert [img.mode for img in stitched] == [img.mode for img in expected]
+        assert [img.tobytes() for img in stitched] == [img.tobytes() for img in expected]
+
+    def test_numpy_backend_releases_page_arrays(self, monkeypatch):
+        images = [PIL.Image.new("RGB", (100, 50), (i, i, i)) for i in range(12)]
+        slices = SlicesDetector.slice_points(images, height=75, method=DetectionMethod.DIRECT)
+        page_array = Stitcher.page_array
+        stitch_slice_array = Stitcher.stitch_slice_array
+        arrays = []
+        held = []
+
+        def tracked(*args, **kwargs):
+            arr = page_array(*args, **kwargs)
+            arrays.append(weakref.ref(arr))
+            return arr
+
+        def counting(*args, **kwargs):
+            held.append(sum(ref() is not None for ref in arrays))
+            return stitch_slice_array(*args, **kwargs)
+
+        monkeypatch.setattr(Stitcher, "page_array", tracked)
+        monkeypatch.setattr(Stitcher, "stitch_slice_array", counting)
+        stitched = Stitcher.stitch(
+            images, slices, mode="RGB", executor=get_executor("serial"), backend=StitchBackend.NUMPY
+        )
+
+        assert len(stitched) == len(slices) and len(arrays) == len(images)
+        # pages of the slices in flight, not a second copy of every page
+        assert max(held) <= 4
+        assert all(ref() is None for ref in arrays)
+
+    def test_numpy_slice_within_page_is_a_view(self, test_images_rgb):
+        page = test_images_rgb[0]
+        s = Slice()
+        s.add((0, 100, 400))
+        s.width = page.width
+        pages = [np.array(page)]
+
+        img = Stitcher.stitch_slice_array(pages, s, mode="L")
+        assert img.tobytes() == Stitcher.stitch_slice([page], s, mode="L").tobytes()
+        pages[0][100:400] = 7
+        assert img.getextrema() == (7, 7)
+
+    @pytest.mark.parametrize("backend", list(StitchBackend))
+    def test_trim_transparent_is_opt_in(self, backend):
+        page = PIL.Image.new("RGBA", (100, 300), (0, 0, 0, 0))
+        page.paste((200, 10, 10, 255), (20, 50, 70, 250))
+        s = Slice()
+        s.add((0, 0, 300))
+        s.width = 100
+
+        assert Stitcher.stitch([page], [s], backend=backend)[0].size == (100, 300)
+        trimmed = Stitcher.stitch([page], [s], backend=backend, trim_transparent=True)[0]
+        assert trimmed.size == (50, 200)
+        assert trimmed.tobytes() == page.crop((20, 50, 70, 250)).tobytes()